@@ -0,0 +1,222 @@
+"""Throughput, time, memory and scaling of all the kernel backends.
+
+The sum string kernel of N synthetic CDR-like sequences with themselves is
+computed by each backend:
+
+- python, the pure Python dynamic programming (sk_fast disabled);
+- cython, the compiled engine sk_fast;
+- cpp, the C++ extension sum_string_kernel;
+- explicit, the explicit feature map (explicit_sk_dataframe, gaps limited
+  by --limit, or by --max-gap if given, hard matching only) and the
+  product of the features;
+- shogun, SubsequenceStringKernel (hard matching only), if installed;
+- auto, the backend chosen by the cost model (see core.cost_model).
+
+for every combination of sequence length, N, (min_kn, max_kn), lamda,
+hard/soft matching, number of jobs and maximum gap (--max-gap, -1 for the
+unbounded kernel). Each measure is taken in a fresh
+interpreter: the time is the best of --repeat runs, the memory is the
+growth of the peak resident set during the runs, and the throughput is the
+number of distinct pairs, N * (N + 1) / 2, per second.
+
+With --save the results are written to a JSON file; with --compare the
+times are compared with the ones of a previous file, and the script exits
+with status 1 if any of them is slower by more than --tolerance.
+
+Usage: python benchmarks/bench_backends.py [--backends B ...]
+           [--n-samples N ...] [--lengths L ...] [--kn MIN:MAX ...]
+           [--lamda L ...] [--matching hard soft] [--n-jobs J ...]
+           [--max-gap G ...] [--save FILE] [--compare FILE]
+"""
+from __future__ import print_function
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from bench_nystroem import PROTEIN, cdr_like_sequences
+
+BACKENDS = ('python', 'cython', 'cpp', 'explicit', 'shogun', 'auto')
+KEYS = ('backend', 'n_samples', 'length', 'min_kn', 'max_kn', 'lamda',
+        'matching', 'n_jobs', 'max_gap')
+
+
+def substitution_model(random_state=0):
+    """Symmetric scores between the amino acids, 1 on the diagonal."""
+    rng = np.random.RandomState(random_state)
+    scores = rng.rand(len(PROTEIN), len(PROTEIN)) * .5
+    scores = (scores + scores.T) / 2
+    np.fill_diagonal(scores, 1)
+    return scores, PROTEIN
+
+
+def _kernel_function(config):
+    """Function computing the kernel of config, None if not available."""
+    from string_kernel.core import sk
+    backend, hard = config['backend'], config['matching'] == 'hard'
+    params = dict(min_kn=config['min_kn'], max_kn=config['max_kn'],
+                  lamda=config['lamda'])
+    max_gap = config['max_gap'] if config['max_gap'] >= 0 else None
+    if backend in ('explicit', 'shogun') and not hard:
+        return None
+    if backend == 'shogun' and max_gap is not None:
+        return None
+    if backend == 'explicit':
+        from string_kernel.feature_map import explicit_sk_dataframe
+
+        def explicit(X):
+            features = explicit_sk_dataframe(
+                X, limit=config['limit'] if max_gap is None else max_gap + 2,
+                **params).values
+            return features.dot(features.T)
+        return explicit
+    if backend == 'shogun':
+        if sk._import_shogun() is None or config['min_kn'] != 1:
+            return None
+        estimator = sk.SumStringKernel(shogun=True, **params)
+        return lambda X: estimator.fit(X).transform(X)
+    if backend == 'cython' and sk.sk_fast is None:
+        return None
+    if backend == 'cpp':
+        try:
+            from string_kernel.core.src import sum_string_kernel  # noqa
+        except ImportError:
+            return None
+    if backend == 'python':
+        sk.sk_fast = None
+    aa_model = None if hard else substitution_model()
+    if backend == 'auto':
+        # calibrated (or loaded) once, outside of the measures
+        from string_kernel.core import cost_model
+        cost_model.load()
+    return lambda X: sk.sumstringkernel(
+        X, X, hard_matching=hard, aa_model=aa_model, deduplicate=False,
+        n_jobs=config['n_jobs'], max_gap=max_gap,
+        backend=backend if backend in ('cpp', 'auto') else None, **params)
+
+
+def worker(config):
+    """Measure config in this interpreter, the result as a dict."""
+    X = cdr_like_sequences(config['n_samples'],
+                           lengths=(config['length'], config['length']))
+    function = _kernel_function(config)
+    if function is None:
+        return None
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    times = []
+    for _ in range(config['repeat']):
+        start = time.time()
+        function(X)
+        times.append(time.time() - start)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    unit = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+    n_pairs = config['n_samples'] * (config['n_samples'] + 1) // 2
+    return dict(time=min(times), pairs_per_second=n_pairs / min(times),
+                memory=(peak - before) / float(unit))
+
+
+def measure(config):
+    """Measure config in a fresh interpreter."""
+    output = subprocess.check_output(
+        [sys.executable, __file__, '--worker', json.dumps(config)])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def _key(result):
+    # results saved before --max-gap are of the unbounded kernel
+    return tuple(result.get(k, -1) for k in KEYS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS,
+                        default=list(BACKENDS))
+    parser.add_argument('--n-samples', type=int, nargs='+',
+                        default=[100, 200])
+    parser.add_argument('--lengths', type=int, nargs='+',
+                        default=[10, 20, 40])
+    parser.add_argument('--kn', nargs='+', default=['1:3'],
+                        help="min_kn:max_kn")
+    parser.add_argument('--lamda', type=float, nargs='+', default=[.5])
+    parser.add_argument('--matching', nargs='+', choices=('hard', 'soft'),
+                        default=['hard', 'soft'])
+    parser.add_argument('--n-jobs', type=int, nargs='+',
+                        default=sorted({1, multiprocessing.cpu_count()}))
+    parser.add_argument('--max-gap', type=int, nargs='+', default=[-1],
+                        help="maximum gap, -1 for none")
+    parser.add_argument('--limit', type=int, default=3,
+                        help="gap limit of the explicit feature map")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help="JSON file to write the results to")
+    parser.add_argument('--compare', help="JSON file of previous results")
+    parser.add_argument('--tolerance', type=float, default=1.2,
+                        help="slowdown flagged as a regression")
+    args = parser.parse_args()
+    if args.worker:
+        print(json.dumps(worker(json.loads(args.worker))))
+        return
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {_key(r): r for r in json.load(f)['results']}
+
+    print("%-8s %5s %4s %5s %5s %4s %4s %4s %10s %12s %9s %8s" % (
+        'backend', 'N', 'len', 'kn', 'lamda', 'mat', 'jobs', 'gap',
+        'time (s)', 'pairs/s', 'mem (MB)', 'vs prev'))
+    results, regressions = [], 0
+    for (backend, n_samples, length, kn, lamda, matching, n_jobs,
+         max_gap) in itertools.product(args.backends, args.n_samples,
+                                       args.lengths, args.kn, args.lamda,
+                                       args.matching, args.n_jobs,
+                                       args.max_gap):
+        min_kn, max_kn = map(int, kn.split(':'))
+        config = dict(backend=backend, n_samples=n_samples, length=length,
+                      min_kn=min_kn, max_kn=max_kn, lamda=lamda,
+                      matching=matching, n_jobs=n_jobs, max_gap=max_gap,
+                      limit=args.limit, repeat=args.repeat)
+        result = measure(config)
+        if result is None:
+            continue
+        result.update((k, config[k]) for k in KEYS)
+        results.append(result)
+        ratio = ''
+        if _key(result) in previous:
+            slowdown = result['time'] / previous[_key(result)]['time']
+            ratio = '%.2fx' % slowdown
+            if slowdown > args.tolerance:
+                ratio += ' !'
+                regressions += 1
+        print("%-8s %5d %4d %5s %5.2f %4s %4d %4s %10.4f %12.0f %9.1f %8s" % (
+            backend, n_samples, length, kn, lamda, matching, n_jobs,
+            max_gap if max_gap >= 0 else '-', result['time'],
+            result['pairs_per_second'], result['memory'], ratio))
+
+    if args.save:
+        import numpy
+        import sklearn
+        with open(args.save, 'w') as f:
+            json.dump(dict(
+                date=time.strftime('%Y-%m-%d %H:%M:%S'),
+                python=platform.python_version(), numpy=numpy.__version__,
+                sklearn=sklearn.__version__, machine=platform.machine(),
+                cpu_count=multiprocessing.cpu_count(), limit=args.limit,
+                results=results), f, indent=1, sort_keys=True)
+    if regressions:
+        print("%d configurations slower than %.2fx the previous results" % (
+            regressions, args.tolerance))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Import time of string_kernel.core.sk, against a time budget.
+
+Each measure is taken in a fresh interpreter. The cost of the module itself
+is the time to import it minus the time to import its hard dependencies
+(numpy and sklearn.base), which are paid by any sklearn-like estimator.
+The import must not have side effects: sys.path is left as it is and the
+optional dependencies (joblib, shogun, pyximport) are not loaded.
+
+Usage: python benchmarks/bench_import.py [--repeat N] [--budget SECONDS]
+Exits with status 1 if the module takes longer than the budget.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import subprocess
+import sys
+
+DEPENDENCIES = 'import numpy, sklearn.base'
+MODULE = 'import string_kernel.core.sk'
+OPTIONAL = ('joblib', 'shogun', 'pyximport')
+
+_PROBE = r'''
+import json, sys, time
+path = list(sys.path)
+start = time.time()
+%s
+elapsed = time.time() - start
+print(json.dumps({'time': elapsed, 'path_changed': sys.path != path,
+                  'modules': [m for m in %r if m in sys.modules]}))
+'''
+
+
+def measure(statement, repeat=5):
+    """Best time of statement, each time in a new interpreter."""
+    results = []
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, '-c', _PROBE % (statement, OPTIONAL)])
+        results.append(json.loads(output.decode('utf-8').strip()
+                                  .splitlines()[-1]))
+    return min(r['time'] for r in results), results[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=.05,
+                        help="seconds allowed on top of the dependencies")
+    args = parser.parse_args()
+
+    deps, _ = measure(DEPENDENCIES, args.repeat)
+    total, probe = measure(MODULE, args.repeat)
+    own = max(total - deps, 0)
+    print("%-34s %8.4f s" % ('numpy + sklearn.base', deps))
+    print("%-34s %8.4f s" % ('string_kernel.core.sk', total))
+    print("%-34s %8.4f s (budget %.4f s)" % ('string_kernel.core.sk only',
+                                            own, args.budget))
+    print("sys.path changed: %s" % probe['path_changed'])
+    print("optional modules loaded: %s" % (', '.join(probe['modules'])
+                                           or 'none'))
+    if own > args.budget or probe['path_changed'] or probe['modules']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
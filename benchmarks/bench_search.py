@@ -0,0 +1,61 @@
+"""Top-k search with KernelNeighbors against the brute force kernel.
+
+For each mode the time, the number of exact kernel evaluations and the
+recall of the true top-k neighbours are reported, on synthetic CDR-like
+sequences (see bench_nystroem.py).
+
+Usage: python benchmarks/bench_search.py [--n-train N] [--n-queries Q]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+from bench_nystroem import cdr_like_sequences
+from string_kernel.core import sk
+from string_kernel.core.search import KernelNeighbors, recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--n-train', type=int, default=5000)
+    parser.add_argument('--n-queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--candidates', type=int, nargs='+',
+                        default=[20, 50, 100])
+    parser.add_argument('--max-kn', type=int, default=3)
+    parser.add_argument('--lamda', type=float, default=.5)
+    parser.add_argument('--normalize-before', action='store_true')
+    parser.add_argument('--n-jobs', type=int, default=1)
+    args = parser.parse_args()
+    params = dict(min_kn=1, max_kn=args.max_kn, lamda=args.lamda,
+                  n_jobs=args.n_jobs, normalize_before=args.normalize_before)
+
+    X = cdr_like_sequences(args.n_train)
+    Q = cdr_like_sequences(args.n_queries, random_state=1)
+    start = time.time()
+    kernel = sk.sumstringkernel(Q, X, **params)
+    true = np.argsort(-kernel, axis=1, kind='mergesort')[:, :args.k]
+    print("brute force: %.3f s, %d evaluations" % (time.time() - start,
+                                                  kernel.size))
+    start = time.time()
+    index = KernelNeighbors(**params).fit(X)
+    print("index: %.3f s" % (time.time() - start))
+
+    print("%-18s %10s %12s %8s" % ('mode', 'time (s)', 'evaluations',
+                                   'recall'))
+    modes = [('exact', dict(exact=True))] + [
+        ('approx, %d cand.' % n, dict(exact=False, n_candidates=n))
+        for n in args.candidates]
+    for name, kwargs in modes:
+        start = time.time()
+        _, indices = index.kneighbors(Q, n_neighbors=args.k, **kwargs)
+        print("%-18s %10.3f %12d %8.3f" % (
+            name, time.time() - start, index.n_evaluations_,
+            recall(indices, true)))
+
+
+if __name__ == '__main__':
+    main()
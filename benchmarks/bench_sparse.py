@@ -0,0 +1,70 @@
+"""Dense vs sparse (match list) dynamic programming with hard matching.
+
+The sparse algorithm only visits the positions where the two sequences
+match, so its advantage grows with the size of the alphabet and with the
+length of the sequences.
+
+Usage: python benchmarks/bench_sparse.py [--n-samples N] [--lengths L ...]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+from string_kernel.core import sk
+
+ALPHABETS = {
+    'dna': 'ACGT',
+    'protein': 'ACDEFGHIKLMNPQRSTVWY',
+}
+
+
+def random_sequences(n_samples, length, alphabet, random_state=0):
+    rng = np.random.RandomState(random_state)
+    return np.array([''.join(rng.choice(list(alphabet), length))
+                     for _ in range(n_samples)])
+
+
+def timeit(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        result = function()
+        times.append(time.time() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--n-samples', type=int, default=20)
+    parser.add_argument('--lengths', type=int, nargs='+',
+                        default=[20, 100, 500])
+    parser.add_argument('--max-kn', type=int, default=5)
+    parser.add_argument('--lamda', type=float, default=.5)
+    parser.add_argument('--n-jobs', type=int, default=1)
+    args = parser.parse_args()
+
+    print("engine: %s" % ('compiled' if sk.sk_fast is not None else 'python'))
+    print("%-8s %6s %10s %10s %8s %10s" % (
+        'alphabet', 'length', 'dense (s)', 'sparse (s)', 'speedup',
+        'max diff'))
+    for name, alphabet in sorted(ALPHABETS.items()):
+        for length in args.lengths:
+            X = random_sequences(args.n_samples, length, alphabet)
+            kernels = {}
+            times = {}
+            for algorithm in ('dense', 'sparse'):
+                times[algorithm], kernels[algorithm] = timeit(
+                    lambda: sk.sumstringkernel(
+                        X, X, min_kn=1, max_kn=args.max_kn, lamda=args.lamda,
+                        n_jobs=args.n_jobs, algorithm=algorithm))
+            print("%-8s %6d %10.4f %10.4f %7.1fx %10.2e" % (
+                name, length, times['dense'], times['sparse'],
+                times['dense'] / times['sparse'],
+                np.abs(kernels['dense'] - kernels['sparse']).max()))
+
+
+if __name__ == '__main__':
+    main()
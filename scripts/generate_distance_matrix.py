@@ -2,7 +2,7 @@
 from __future__ import print_function
 import pandas as pd
 from string_kernel import io
-from string_kernel.core.src import string_kernel, sum_string_kernel
+from string_kernel.core import sk
 
 df = io.pdb_to_df('/home/fede/projects_local/fais/data_CLL_2015/models')
 
@@ -33,10 +33,10 @@ min_kn = 1
 max_kn = 5
 lamda = .75
 normalize = 1
-for i in new_df.columns:
-    sum_string_kernel.sum_string_kernel(
-        list(new_df[i]),
-        filename='{}_kn{}-{}_l{}_norm{}_nodup.csv'.format(i, min_kn, max_kn, lamda, normalize),
-        min_kn=min_kn, max_kn=max_kn, lamda=lamda, labels=new_ids,
-        normalize=normalize
-    )
+# all the loops in one pass, with a single pool of workers
+kernels = sk.sumstringkernel_columns(
+    new_df, min_kn=min_kn, max_kn=max_kn, lamda=lamda, normalize=normalize)
+for i, kernel in kernels.items():
+    pd.DataFrame(kernel, index=new_ids, columns=new_ids).to_csv(
+        '{}_kn{}-{}_l{}_norm{}_nodup.csv'.format(i, min_kn, max_kn, lamda,
+                                                 normalize))
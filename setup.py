@@ -16,7 +16,27 @@ import numpy as np
 ssk_module = Extension(
     'string_kernel.core.src.sum_string_kernel',
     sources=['string_kernel/core/src/sum_string_kernel.cpp'],
-    include_dirs=[np.get_include()])
+    include_dirs=[np.get_include()],
+    extra_compile_args=['-std=c++11', '-pthread'],
+    extra_link_args=['-pthread'])
+
+# Compile the Cython engine from the .pyx if Cython is available,
+# otherwise use the shipped .c file
+try:
+    from Cython.Build import cythonize
+    sk_fast_source = 'string_kernel/core/sk_fast.pyx'
+except ImportError:
+    cythonize = None
+    sk_fast_source = 'string_kernel/core/sk_fast.c'
+sk_fast_module = Extension(
+    'string_kernel.core.sk_fast',
+    sources=[sk_fast_source],
+    extra_compile_args=['-O3', '-fopenmp'],
+    extra_link_args=['-fopenmp'])
+ext_modules = [ssk_module, sk_fast_module]
+if cythonize is not None:
+    ext_modules = cythonize(ext_modules)
+
 setup(
     name='string_kernel',
     version='0.1a',
@@ -50,6 +70,6 @@ setup(
               'sklearn (>=0.17)'],
     # scripts=['scripts/ici_run.py', 'scripts/ici_analysis.py'],
     # ext_modules=[sk_module, ssk_module]
-    ext_modules=[ssk_module],
+    ext_modules=ext_modules,
     include_dirs=[np.get_include()]
 )
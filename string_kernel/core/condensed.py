@@ -0,0 +1,102 @@
+"""Symmetric kernels stored as their condensed upper triangle.
+
+The entries (i, j), i < j, of a symmetric n x n matrix are stored one row
+after the other in a vector of n * (n - 1) / 2 elements, the layout of
+scipy.spatial.distance.squareform: a condensed distance vector can be given
+directly to scipy.cluster.hierarchy.linkage. The diagonal is kept apart.
+All the functions work in blocks of positions, so that no temporary array
+of the size of the whole kernel is created.
+"""
+import numpy as np
+
+# number of positions processed at once
+_BLOCK_SIZE = 2 ** 16
+
+
+def size(n):
+    """Number of entries of the condensed upper triangle of n x n."""
+    return n * (n - 1) // 2
+
+
+def row_start(i, n):
+    """Position of the entry (i, i + 1)."""
+    return i * (2 * n - i - 1) // 2
+
+
+def index(i, j, n):
+    """Position of the entry (i, j), i < j."""
+    return row_start(i, n) + j - i - 1
+
+
+def blocks(n):
+    """Blocks of positions of the condensed upper triangle of n x n.
+
+    Yields
+    ------
+    positions : slice
+        The positions of the block.
+    i, j : array of intp
+        Row and column of each position.
+    """
+    starts = row_start(np.arange(n, dtype=np.intp), n)
+    total = size(n)
+    for start in range(0, total, _BLOCK_SIZE):
+        stop = min(start + _BLOCK_SIZE, total)
+        positions = np.arange(start, stop, dtype=np.intp)
+        i = np.searchsorted(starts, positions, side='right') - 1
+        yield slice(start, stop), i, positions - starts[i] + i + 1
+
+
+def normalize(values, diagonal):
+    """Divide in place the entry (i, j) by sqrt(diagonal[i] * diagonal[j])."""
+    roots = np.sqrt(diagonal)
+    for positions, i, j in blocks(len(diagonal)):
+        values[positions] /= roots[i] * roots[j]
+    return values
+
+
+def to_distance(values, diagonal=None):
+    """Turn in place a kernel into the distance in its feature space.
+
+    The distance is sqrt(k(i, i) + k(j, j) - 2 k(i, j)), that is
+    sqrt(2 - 2 k(i, j)) for a normalised kernel (diagonal None).
+    """
+    if diagonal is None:
+        for start in range(0, len(values), _BLOCK_SIZE):
+            positions = slice(start, start + _BLOCK_SIZE)
+            block = values[positions]
+            values[positions] = np.sqrt(np.maximum(2 - 2 * block, 0))
+        return values
+    for positions, i, j in blocks(len(diagonal)):
+        values[positions] = np.sqrt(np.maximum(
+            diagonal[i] + diagonal[j] - 2 * values[positions], 0))
+    return values
+
+
+def expand(values, diagonal, inverse, out=None):
+    """Condensed kernel of the samples from the one of distinct sequences.
+
+    Parameters
+    ----------
+    values : array, shape (size(n_unique),)
+        Condensed kernel between the distinct sequences.
+    diagonal : array, shape (n_unique,)
+        Kernel of each distinct sequence with itself.
+    inverse : array of int, shape (n_samples,)
+        Position of each sample among the distinct sequences (see
+        SequenceStore.unique).
+    out : array, shape (size(n_samples),), optional
+        Where to write the result.
+    """
+    n_unique = len(diagonal)
+    if out is None:
+        out = np.empty(size(len(inverse)), dtype=values.dtype)
+    for positions, i, j in blocks(len(inverse)):
+        rows, cols = inverse[i], inverse[j]
+        block = diagonal[rows].astype(out.dtype)
+        different = rows != cols
+        rows, cols = rows[different], cols[different]
+        block[different] = values[index(np.minimum(rows, cols),
+                                        np.maximum(rows, cols), n_unique)]
+        out[positions] = block
+    return out
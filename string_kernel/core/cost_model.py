@@ -0,0 +1,263 @@
+"""Cost model of the backends of the sum string kernel, for backend='auto'.
+
+The time of each backend is modelled as a linear function of its work:
+
+- the dynamic programming engines (backend=None, the compiled engine or the
+  pure Python one, and backend='cpp') take c_cell * cells + c_pair * pairs
+  seconds, divided by the number of threads, where cells are about
+  max_kn * len(x) * len(y) for each pair (see core.stats);
+- with max_gap, their banded dynamic programming visits the matches, each
+  one in O(max_gap) time: its cells are scaled by band_factor, and it has
+  its own constants;
+- the explicit feature map (backend='explicit') takes
+  c_subsequence * subsequences + c_entry * entries seconds, where
+  subsequences is the number of gapped subsequences enumerated and entries
+  the size of the kernel.
+
+The constants are calibrated by timing each backend on two small synthetic
+data sets, once for each machine and installation, and cached in a JSON file
+(STRING_KERNEL_COST_MODEL, or cost_model.json in ~/.cache/string_kernel).
+"""
+import itertools
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+
+from string_kernel.core import sk
+from string_kernel.core.stats import _pairs_and_cells
+
+# version of the format of the cached constants
+_VERSION = 3
+
+# constants of this process, loaded or calibrated once
+_CONSTANTS = {}
+
+
+def cache_path():
+    """The file where the calibrated constants are cached."""
+    path = os.environ.get('STRING_KERNEL_COST_MODEL')
+    if path:
+        return path
+    root = os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(root, 'string_kernel', 'cost_model.json')
+
+
+def _cpp_available():
+    try:
+        from string_kernel.core.src import sum_string_kernel  # noqa
+    except ImportError:
+        return False
+    return True
+
+
+def fingerprint():
+    """What the constants depend on: the machine and the engines built."""
+    return dict(version=_VERSION, machine=platform.machine(),
+                node=platform.node(), python=platform.python_version(),
+                engine='python' if sk.sk_fast is None else 'compiled',
+                cpp=_cpp_available())
+
+
+def count_subsequences(length, kn, limit=None):
+    """Number of subsequences of length kn of a sequence, as enumerated by
+    feature_map.enumerate_subsequences (consecutive symbols at distance
+    less than limit)."""
+    if kn > length or kn < 1:
+        return 0
+    ends = np.ones(length)
+    for _ in range(kn - 1):
+        # subsequences ending at each position, extended by one symbol
+        cumulative = np.concatenate(([0], np.cumsum(ends)))
+        first = np.zeros(length, dtype=np.intp) if limit is None else \
+            np.maximum(np.arange(length) - limit + 1, 0)
+        ends = cumulative[np.arange(length)] - cumulative[first]
+    return ends.sum()
+
+
+def n_subsequences(lengths, min_kn, max_kn, limit=None):
+    """Subsequences enumerated for sequences of the given lengths."""
+    values, counts = np.unique(np.asarray(lengths, dtype=np.intp),
+                               return_counts=True)
+    return sum(count * sum(count_subsequences(length, kn, limit)
+                           for kn in range(min_kn, max_kn + 1))
+               for length, count in zip(values, counts))
+
+
+def workload(lengths_x, lengths_y=None, max_kn=2, norms_x=True,
+             norms_y=True):
+    """Pairs and cells of the dynamic programming of a kernel, norms
+    included; the kernel is symmetric if lengths_y is None.
+    norms_x (norms_y) is False if the norms of x (y) are given; the ones of
+    a symmetric kernel are the ones of y."""
+    if lengths_y is None:
+        pairs, cells = _pairs_and_cells(lengths_x, lengths_x, max_kn,
+                                        triangle=True)
+        norms = [lengths_x] if norms_y else []
+    else:
+        pairs, cells = _pairs_and_cells(lengths_x, lengths_y, max_kn)
+        norms = ([lengths_x] if norms_x else []) + (
+            [lengths_y] if norms_y else [])
+    for lengths in norms:
+        lengths = np.asarray(lengths, dtype=float)
+        pairs += len(lengths)
+        cells += max_kn * np.dot(lengths, lengths)
+    return pairs, cells
+
+
+def band_factor(max_kn, max_gap, n_symbols, hard_matching=True):
+    """Work of the banded dynamic programming for each cell of the
+    unbounded one: a scan of the columns for each row, plus the matches
+    (one in n_symbols cells) of each level, gathered and scattered over
+    max_gap + 1 rows and columns; with soft matching, the last level is
+    gathered at every cell."""
+    width = max_gap + 1.
+    factor = 1. / max_kn + 2 * width / max(n_symbols, 1)
+    if not hard_matching:
+        factor += width
+    return factor
+
+
+def estimate(backend, constants, lengths_x, lengths_y=None, min_kn=1,
+             max_kn=2, max_gap=None, n_symbols=20, hard_matching=True,
+             n_jobs=1, norms_x=True, norms_y=True):
+    """Estimated seconds of a backend (None, 'cpp' or 'explicit').
+
+    norms_x and norms_y are False if the norms are given to the engines
+    (see workload); the C++ extension computes them anyway.
+    """
+    matching = 'hard' if hard_matching else 'soft'
+    if backend == 'explicit':
+        limit = None if max_gap is None else max_gap + 2
+        c_subsequence, c_entry = constants['explicit']
+        lengths = lengths_x if lengths_y is None else np.concatenate(
+            (lengths_x, lengths_y))
+        n_entries = len(lengths_x) * len(
+            lengths_x if lengths_y is None else lengths_y)
+        return (c_subsequence * n_subsequences(lengths, min_kn, max_kn,
+                                               limit) +
+                c_entry * n_entries)
+    key = 'cpp' if backend == 'cpp' else 'engine'
+    if backend == 'cpp':
+        norms_x = norms_y = True
+    pairs, cells = workload(lengths_x, lengths_y, max_kn, norms_x=norms_x,
+                            norms_y=norms_y)
+    if max_gap is not None:
+        key += '_gapped'
+        cells *= band_factor(max_kn, max_gap, n_symbols, hard_matching)
+    c_cell, c_pair = constants[key][matching]
+    return (c_cell * cells + c_pair * pairs) / sk._effective_n_jobs(n_jobs)
+
+
+def choose(backends, constants, lengths_x, lengths_y=None, **kwargs):
+    """The backend with the lowest estimated time (see estimate)."""
+    costs = [estimate(backend, constants, lengths_x, lengths_y, **kwargs)
+             for backend in backends]
+    return backends[int(np.argmin(costs))]
+
+
+def _calibration_sets(random_state=0):
+    """Two sets of random protein sequences, short and long."""
+    rng = np.random.RandomState(random_state)
+    alphabet = list('ACDEFGHIKLMNPQRSTVWY')
+    return [np.array([''.join(rng.choice(alphabet, length))
+                      for _ in range(n_samples)])
+            for n_samples, length in ((40, 6), (24, 24))]
+
+
+def _calibration_model(random_state=0):
+    """A dense symmetric substitution model over A-Z, for the soft
+    matching."""
+    scores = np.random.RandomState(random_state).rand(26, 26)
+    return (scores + scores.T) / 2
+
+
+def _best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def _fit(work, times):
+    """Non-negative constants c with work.dot(c) = times."""
+    work, times = np.asarray(work, dtype=float), np.asarray(times)
+    constants = np.linalg.lstsq(work, times, rcond=None)[0]
+    if np.any(constants < 0):
+        # all the time to the first kind of work
+        constants = np.array([times.sum() / work[:, 0].sum(), 0.])
+    return [float(c) for c in constants]
+
+
+def calibrate(repeat=2, max_kn=3, max_gap=2):
+    """Time the available backends and fit their constants."""
+    sets = _calibration_sets()
+    lengths = [np.array([len(x) for x in X]) for X in sets]
+    params = dict(min_kn=1, max_kn=max_kn, lamda=.5, n_jobs=1,
+                  deduplicate=False)
+    backends = [None] + (['cpp'] if _cpp_available() else [])
+    aa_model = _calibration_model()
+    constants = {}
+    for backend, gap in itertools.product(backends, (None, max_gap)):
+        key = ('cpp' if backend == 'cpp' else 'engine') + (
+            '' if gap is None else '_gapped')
+        constants[key] = {}
+        for matching in ('hard', 'soft'):
+            work = []
+            for l in lengths:
+                cells, pairs = workload(l, max_kn=max_kn)[::-1]
+                if gap is not None:
+                    cells *= band_factor(max_kn, gap, 20, matching == 'hard')
+                work.append((cells, pairs))
+            constants[key][matching] = _fit(work, [_best_time(
+                lambda: sk.sumstringkernel(
+                    X, X, hard_matching=matching == 'hard',
+                    aa_model=None if matching == 'hard' else aa_model,
+                    backend=backend, max_gap=gap, **params), repeat)
+                for X in sets])
+    work = [(n_subsequences(l, 1, max_kn), len(l) ** 2) for l in lengths]
+    constants['explicit'] = _fit(work, [_best_time(
+        lambda: sk.sumstringkernel(X, X, backend='explicit', **params),
+        repeat) for X in sets])
+    return constants
+
+
+def load(recalibrate=False):
+    """The constants of this machine, calibrated and cached if needed."""
+    key = tuple(sorted(fingerprint().items()))
+    if key in _CONSTANTS and not recalibrate:
+        return _CONSTANTS[key]
+    path = cache_path()
+    cached = None
+    if not recalibrate and os.path.exists(path):
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+        except (IOError, ValueError):
+            cached = None
+    if cached is not None and cached.get('fingerprint') == fingerprint():
+        constants = cached['constants']
+    else:
+        constants = calibrate()
+        try:
+            folder = os.path.dirname(path)
+            if folder and not os.path.isdir(folder):
+                os.makedirs(folder)
+            # write and rename, so that readers never see a partial file
+            fd, temp = tempfile.mkstemp(dir=folder or '.', suffix='.json')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(fingerprint=fingerprint(),
+                               constants=constants), f, indent=1,
+                          sort_keys=True)
+            os.rename(temp, path)
+        except (IOError, OSError):
+            # a read-only cache: calibrate again in the next process
+            pass
+    _CONSTANTS[key] = constants
+    return constants
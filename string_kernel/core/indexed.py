@@ -0,0 +1,94 @@
+"""Kernel matrices between sequences with duplicates, without copies."""
+import numpy as np
+
+# number of entries built at once when writing into an output array
+_BLOCK_SIZE = 2 ** 16
+
+
+class IndexedKernel(object):
+    """Read-only view of a kernel computed on the distinct sequences only.
+
+    The kernel between the i-th sample of X and the j-th sample of Y is
+    values[rows[i], cols[j]], where `values` is the kernel between the
+    distinct sequences of X and Y. Only the requested entries are built.
+
+    Parameters
+    ----------
+    values : array, shape (n_unique_x, n_unique_y)
+        Kernel between the distinct sequences.
+    rows : array of int, shape (n_x,)
+        Row of `values` of each sample of X.
+    cols : array of int, shape (n_y,)
+        Column of `values` of each sample of Y.
+    """
+
+    ndim = 2
+
+    def __init__(self, values, rows, cols):
+        self.values = values
+        self.rows = np.asarray(rows, dtype=np.intp)
+        self.cols = np.asarray(cols, dtype=np.intp)
+
+    @property
+    def shape(self):
+        return len(self.rows), len(self.cols)
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        """Build the selected entries, with NumPy indexing rules.
+
+        Two integer or array indices are paired element-wise, as in NumPy:
+        kernel[[0, 1], [2, 3]] are the entries (0, 2) and (1, 3); use
+        kernel[np.ix_(rows, cols)] for the block of rows and cols.
+        """
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            raise IndexError("IndexedKernel is two-dimensional")
+        rows, cols = self.rows[key[0]], self.cols[key[1]]
+        if not isinstance(key[0], slice) and not isinstance(key[1], slice):
+            return self.values[rows, cols]
+        return self.values[rows][..., cols]
+
+    def toarray(self):
+        """Build the whole kernel."""
+        return self.values[np.ix_(self.rows, self.cols)]
+
+    def __array__(self, dtype=None):
+        array = self.toarray()
+        return array if dtype is None else array.astype(dtype)
+
+    def __repr__(self):
+        return '%s(shape=%r, n_unique=%r)' % (
+            type(self).__name__, self.shape, self.values.shape)
+
+
+def expand(values, rows=None, cols=None, lazy=False, out=None):
+    """Kernel between the samples from the kernel between distinct sequences.
+
+    rows and cols are the inverse indices of the distinct sequences (see
+    SequenceStore.unique); None means that there are no duplicates.
+    If out is given, the kernel is written into it one block of rows at a
+    time.
+    """
+    if rows is None and cols is None:
+        return values
+    if rows is None:
+        rows = np.arange(values.shape[0])
+    if cols is None:
+        cols = np.arange(values.shape[1])
+    kernel = IndexedKernel(values, rows, cols)
+    if lazy:
+        return kernel
+    if out is None:
+        return kernel.toarray()
+    step = max(1, _BLOCK_SIZE // max(len(cols), 1))
+    for start in range(0, len(rows), step):
+        out[start:start + step] = kernel[start:start + step]
+    return out
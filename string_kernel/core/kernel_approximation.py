@@ -0,0 +1,184 @@
+"""Low-rank approximation of the sum string kernel."""
+import numpy as np
+
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.utils import check_random_state
+
+from string_kernel.core import sk
+from string_kernel.core.sequences import SequenceStore
+
+LANDMARKS = ('uniform', 'kmeans++', 'leverage')
+
+
+class NystroemStringKernel(BaseEstimator, TransformerMixin):
+    """Nystroem approximation of the normalised sum string kernel.
+
+    A subset of m landmark sequences is selected among the distinct
+    training sequences; each sequence is then embedded in R^m using only its
+    kernel with the landmarks, so that the dot products of the embeddings
+    approximate the kernel of SumStringKernel(normalize=True). Computing the
+    embedding of n sequences takes n x m kernel evaluations, instead of the
+    n x n of the exact kernel.
+
+    Parameters
+    ----------
+    n_components : int, optional
+        Number of landmarks m (at most the number of distinct sequences).
+    landmarks : 'uniform', 'kmeans++' or 'leverage', optional
+        How landmarks are chosen:
+
+        - 'uniform', uniformly at random;
+        - 'kmeans++', each one with probability proportional to its squared
+          distance (in the feature space of the kernel) from the closest
+          landmark already chosen, as the k-means++ seeding;
+        - 'leverage', with probability proportional to the leverage scores
+          of a rank-m approximation built on a uniform pilot sample of
+          2 * m sequences.
+
+        'kmeans++' and 'leverage' cost about n x m more kernel evaluations
+        than 'uniform', and approximate the kernel better.
+    random_state : int, RandomState or None, optional
+        Seed of the landmark selection.
+    min_kn, max_kn, lamda, hard_matching, normalize_before, aa_model, \
+n_jobs, tile_size, alphabet, algorithm, backend :
+        Parameters of the kernel, as in SumStringKernel.
+
+    Attributes
+    ----------
+    landmarks_ : array of str, shape (m,)
+        The landmark sequences.
+    component_indices_ : array of int, shape (m,)
+        Position of the landmarks in the training sequences.
+    normalization_ : array, shape (m, m)
+        Inverse square root of the kernel between the landmarks.
+    """
+
+    def __init__(self, n_components=100, landmarks='uniform',
+                 random_state=None, min_kn=1, max_kn=2, lamda=.5,
+                 hard_matching=True, normalize_before=False, aa_model=None,
+                 n_jobs=-1, tile_size=None, alphabet=None, algorithm='dense',
+                 backend=None):
+        super(NystroemStringKernel, self).__init__()
+        self.n_components = n_components
+        self.landmarks = landmarks
+        self.random_state = random_state
+        self.min_kn = min_kn
+        self.max_kn = max_kn
+        self.lamda = lamda
+        self.hard_matching = hard_matching
+        self.normalize_before = normalize_before
+        self.aa_model = aa_model
+        self.n_jobs = n_jobs
+        self.tile_size = tile_size
+        self.alphabet = alphabet
+        self.algorithm = algorithm
+        self.backend = backend
+
+    def _kernel(self, X, Y, norms_y=None, norms_x=None):
+        """Normalised kernel between X and Y."""
+        return sk.sumstringkernel(
+            X, Y, min_kn=self.min_kn, max_kn=self.max_kn, lamda=self.lamda,
+            n_jobs=self.n_jobs, hard_matching=self.hard_matching,
+            normalize=True, normalize_before=self.normalize_before,
+            aa_model=self.aa_model, tile_size=self.tile_size,
+            alphabet=self.alphabet, algorithm=self.algorithm,
+            norms_train=norms_y, backend=self.backend, norms_x=norms_x)
+
+    def _columns(self, store, norms, cols):
+        """Normalised kernel between all the sequences of store and cols.
+
+        The columns are computed together, by the backend of the estimator.
+        norms are the ones of store for each length (see sk._norms), so that
+        they are computed once for all the landmarks (the C++ extension
+        computes its own).
+        """
+        return np.asarray(self._kernel(store, store.take(cols),
+                                       norms_y=norms[cols], norms_x=norms))
+
+    def _kmeanspp(self, store, norms, n_components, rng):
+        """Landmarks chosen with the k-means++ seeding."""
+        n_samples = len(store)
+        chosen = [rng.randint(n_samples)]
+        # squared distance in the feature space, 2 - 2 k(x, c)
+        distances = np.maximum(
+            2 - 2 * self._columns(store, norms, chosen)[:, 0], 0)
+        for _ in range(1, n_components):
+            distances[chosen] = 0
+            total = distances.sum()
+            if total > 0:
+                new = rng.choice(n_samples, p=distances / total)
+            else:
+                new = rng.choice(np.setdiff1d(np.arange(n_samples), chosen))
+            chosen.append(new)
+            distances = np.minimum(distances, np.maximum(
+                2 - 2 * self._columns(store, norms, [new])[:, 0], 0))
+        return np.array(chosen)
+
+    def _leverage(self, store, norms, n_components, rng):
+        """Landmarks sampled according to approximate leverage scores."""
+        n_samples = len(store)
+        pilot = rng.permutation(n_samples)[:min(n_samples, 2 * n_components)]
+        columns = self._columns(store, norms, pilot)
+        features = columns.dot(_inverse_sqrt(columns[pilot]))
+        # leverage scores of the best rank-m approximation of the pilot
+        U, S, _ = np.linalg.svd(features, full_matrices=False)
+        rank = min(n_components, np.sum(S > S[0] * 1e-8))
+        scores = (U[:, :rank] ** 2).sum(axis=1)
+        # every sequence can be chosen, to get n_components distinct ones
+        scores += scores.max() * 1e-8
+        return rng.choice(n_samples, n_components, replace=False,
+                          p=scores / scores.sum())
+
+    def fit(self, X, y=None):
+        """Choose the landmarks among the distinct sequences of X."""
+        if self.landmarks not in LANDMARKS:
+            raise ValueError("landmarks must be one of %s, got %r" % (
+                ', '.join(LANDMARKS), self.landmarks))
+        rng = check_random_state(self.random_state)
+        store = SequenceStore(np.ravel(X), alphabet=self.alphabet)
+        unique, index, _ = store.unique()
+        n_components = min(self.n_components, len(unique))
+
+        if self.landmarks == 'uniform':
+            chosen = rng.permutation(len(unique))[:n_components]
+        else:
+            norms = sk._norms(
+                unique, n_jobs=self.n_jobs, min_kn=self.min_kn,
+                max_kn=self.max_kn, lamda=self.lamda,
+                hard_matching=self.hard_matching, aa_model=self.aa_model,
+                algorithm=self.algorithm)
+            select = (self._kmeanspp if self.landmarks == 'kmeans++'
+                      else self._leverage)
+            chosen = select(unique, norms, n_components, rng)
+
+        self.component_indices_ = index[chosen]
+        self.landmark_store_ = unique.take(chosen)
+        self.landmarks_ = np.array(list(self.landmark_store_), dtype=object)
+        self.norms_landmarks_ = None
+        if self.backend is None:
+            self.norms_landmarks_ = sk._norms(
+                self.landmark_store_, n_jobs=self.n_jobs, min_kn=self.min_kn,
+                max_kn=self.max_kn, lamda=self.lamda,
+                hard_matching=self.hard_matching, aa_model=self.aa_model,
+                algorithm=self.algorithm)
+        self.normalization_ = _inverse_sqrt(self._kernel(
+            self.landmark_store_, self.landmark_store_,
+            self.norms_landmarks_))
+        return self
+
+    def transform(self, X):
+        """Embedding of X, shape (n_samples, m).
+
+        The dot products between the rows approximate the normalised sum
+        string kernel.
+        """
+        kernel = self._kernel(np.ravel(X), self.landmark_store_,
+                              self.norms_landmarks_)
+        return kernel.dot(self.normalization_.T)
+
+
+def _inverse_sqrt(kernel):
+    """Inverse square root of a kernel, with small eigenvalues clipped."""
+    U, S, V = np.linalg.svd(kernel)
+    S = np.maximum(S, 1e-12)
+    return np.dot(U / np.sqrt(S), V)
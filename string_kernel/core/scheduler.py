@@ -0,0 +1,87 @@
+"""Split a kernel matrix in tiles to be computed by parallel workers.
+
+The cost of the dynamic programming between two sequences is proportional to
+the product of their lengths, so the tiles are built to have a similar cost
+rather than the same number of sequences, and they are returned from the most
+to the least expensive to let the workers balance the load.
+"""
+import numpy as np
+
+# default number of sequences on each side of a tile
+TILE_SIZE = 256
+
+
+def split_by_cost(lengths, tile_size=TILE_SIZE):
+    """Split a list of sequences in chunks of similar total length.
+
+    Parameters
+    ----------
+    lengths : array-like, shape (n_sequences,)
+        Length of each sequence.
+    tile_size : int, optional
+        Average number of sequences in a chunk.
+
+    Returns
+    -------
+    bounds : array of int
+        The i-th chunk contains the sequences bounds[i]:bounds[i + 1].
+    """
+    n_sequences = len(lengths)
+    n_chunks = max(1, -(-n_sequences // max(1, int(tile_size))))
+    # +1 so that also empty sequences have a cost
+    cumulative = np.cumsum(np.asarray(lengths, dtype=float) + 1)
+    if n_chunks == 1 or n_sequences == 0:
+        return np.array([0, n_sequences])
+    targets = cumulative[-1] * np.arange(1, n_chunks) / n_chunks
+    inner = np.searchsorted(cumulative, targets) + 1
+    return np.unique(np.concatenate(([0], inner, [n_sequences])))
+
+
+def tile_cost(lengths_x, lengths_y, rows, cols, symmetric=False):
+    """Cost of the tile (rows, cols), proportional to its cells.
+
+    If symmetric and rows == cols, the tile is on the diagonal and only its
+    upper triangle is computed.
+    """
+    cost = np.sum(lengths_x[rows] + 1.) * np.sum(lengths_y[cols] + 1.)
+    if symmetric and rows == cols:
+        cost /= 2.
+    return cost
+
+
+def make_tiles(lengths_x, lengths_y=None, tile_size=TILE_SIZE):
+    """Tiles covering a kernel matrix, sorted by decreasing cost.
+
+    Parameters
+    ----------
+    lengths_x : array-like, shape (n_x,)
+        Length of the sequences on the rows.
+    lengths_y : array-like, shape (n_y,), optional
+        Length of the sequences on the columns. If None, the kernel is
+        symmetric and only the tiles on and above the diagonal are returned.
+    tile_size : int, optional
+        Average number of sequences on each side of a tile.
+
+    Returns
+    -------
+    tiles : list of (slice, slice)
+        Rows and columns of each tile. In the symmetric case, tiles with the
+        same rows and columns are on the diagonal (triangular tiles).
+    """
+    symmetric = lengths_y is None
+    if tile_size is None:
+        tile_size = TILE_SIZE
+    lengths_x = np.asarray(lengths_x, dtype=float)
+    lengths_y = lengths_x if symmetric else np.asarray(lengths_y, dtype=float)
+    bounds_x = split_by_cost(lengths_x, tile_size)
+    bounds_y = bounds_x if symmetric else split_by_cost(lengths_y, tile_size)
+
+    tiles, costs = [], []
+    for i in range(len(bounds_x) - 1):
+        rows = slice(bounds_x[i], bounds_x[i + 1])
+        for j in range(i if symmetric else 0, len(bounds_y) - 1):
+            cols = slice(bounds_y[j], bounds_y[j + 1])
+            tiles.append((rows, cols))
+            costs.append(tile_cost(lengths_x, lengths_y, rows, cols,
+                                   symmetric=symmetric))
+    return [tiles[i] for i in np.argsort(costs, kind='mergesort')[::-1]]
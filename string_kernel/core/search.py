@@ -0,0 +1,283 @@
+"""Search of the training sequences most similar to a query.
+
+The normalised sum string kernel with hard matching is a sum over the
+subsequences u of products phi_u(x) phi_u(y). Grouping the subsequences by
+length and by last symbol and applying Cauchy-Schwarz to each group gives
+
+    k(x, y) <= sum_{kn, a} g_{kn, a}(x) g_{kn, a}(y),
+
+where g_{kn, a}(x) ** 2 is the kernel of x with itself restricted to the
+subsequences of length kn ending with the symbol a. Once normalised, the
+vectors g (the sketches) give an upper bound of the kernel of a pair with a
+single dot product, and the exact kernel is computed only for the training
+sequences whose bound can still beat the current k-th neighbour.
+"""
+import numpy as np
+
+from sklearn.base import BaseEstimator
+
+from string_kernel.core import sk
+from string_kernel.core.sequences import SequenceStore, as_store
+
+# tolerance on the bounds, for the rounding errors
+_EPS = 1e-9
+
+
+def _python_symbol_norms(x, min_kn, max_kn, lamda, n_symbols):
+    """Kernel of x with itself for each length and last symbol.
+
+    The dynamic programming of sk._core_sumstringkernel with y = x, where
+    the contribution of each match is accumulated according to its symbol.
+    x is an array of codes, lower than n_symbols.
+    """
+    len_x = len(x)
+    top = min(max_kn, len_x)
+    values = np.zeros((max_kn - min_kn + 1, n_symbols))
+    Kd = np.zeros((max(top, 1), len_x))
+    Kd[0] = 1
+    for j in range(len_x):
+        for i in range(min(j, top - 1), 0, -1):
+            Kdd = 0
+            row, prev = Kd[i], Kd[i - 1]
+            for k in range(i, len_x):
+                if x[j - 1] != x[k - 1]:
+                    Kdd *= lamda
+                else:
+                    Kdd = lamda * (Kdd + (lamda * prev[k - 1]))
+                row[k] = lamda * row[k] + Kdd
+
+        for kn in range(max(min_kn, 1), min(top, j + 1) + 1):
+            row = Kd[kn - 1]
+            for k in range(kn - 1, len_x):
+                if x[j] == x[k]:
+                    values[kn - min_kn, x[j]] += lamda * lamda * row[k]
+    return values
+
+
+def symbol_norms(store, min_kn=1, max_kn=2, lamda=.5, n_jobs=1):
+    """Kernel of each sequence with itself for each length and last symbol.
+
+    Lengths longer than a sequence are 0.
+
+    Returns
+    -------
+    values : array, shape (n_sequences, max_kn - min_kn + 1, n_present)
+        values[i, l, s] is the kernel of the length min_kn + l restricted to
+        the subsequences ending with symbols[s].
+    symbols : array of uint8
+        The codes of the symbols present in store.
+    """
+    symbols = np.unique(store.data)
+    values = np.zeros((len(store), max_kn - min_kn + 1, len(symbols)))
+    if sk.sk_fast is None:
+        codes = np.searchsorted(symbols, store.data)
+        for i in range(len(store)):
+            values[i] = _python_symbol_norms(
+                codes[store.offsets[i]:store.offsets[i + 1]], min_kn, max_kn,
+                lamda, len(symbols))
+    else:
+        # soft matching with a table which only matches the symbol a
+        diagonal = np.arange(len(store))
+        out = np.empty((len(store), max_kn - min_kn + 1))
+        for s, a in enumerate(symbols):
+            table = np.zeros((store.n_symbols, store.n_symbols))
+            table[a, a] = 1
+            sk.sk_fast.sumstringkernel_pairs(
+                store.data, store.offsets, store.data, store.offsets,
+                diagonal, diagonal, min_kn, max_kn, lamda, False, table, out,
+                num_threads=sk._effective_n_jobs(n_jobs))
+            values[:, :, s] = out
+    lengths = np.arange(min_kn, max_kn + 1)
+    values[lengths > store.lengths[:, None]] = 0
+    return values, symbols
+
+
+class KernelNeighbors(BaseEstimator):
+    """Training sequences with the highest normalised sum string kernel.
+
+    Hard matching only. At fit time the distinct training sequences, their
+    norms and their sketches (see the module docstring) are computed once.
+    Queries are answered in batches: the bounds of a batch against all the
+    training sequences are a single matrix product, then the exact kernel is
+    computed in the order of decreasing bound, until no bound can beat the
+    k-th neighbour (exact mode), or only for the n_candidates sequences with
+    the highest bounds (approximate mode).
+
+    Parameters
+    ----------
+    min_kn, max_kn, lamda, normalize_before, alphabet, n_jobs, algorithm :
+        Parameters of the kernel, as in SumStringKernel.
+    batch_size : int, optional
+        Number of queries processed together.
+
+    Attributes
+    ----------
+    n_evaluations_ : int
+        Number of exact kernel evaluations of the last query.
+    """
+
+    def __init__(self, min_kn=1, max_kn=2, lamda=.5, normalize_before=False,
+                 alphabet=None, n_jobs=1, algorithm='dense', batch_size=64):
+        super(KernelNeighbors, self).__init__()
+        self.min_kn = min_kn
+        self.max_kn = max_kn
+        self.lamda = lamda
+        self.normalize_before = normalize_before
+        self.alphabet = alphabet
+        self.n_jobs = n_jobs
+        self.algorithm = algorithm
+        self.batch_size = batch_size
+
+    def _params(self):
+        return dict(min_kn=self.min_kn, max_kn=self.max_kn, lamda=self.lamda,
+                    n_jobs=self.n_jobs)
+
+    def _sketches(self, store):
+        """Normalised sketches of store, on the symbols of the training set.
+
+        Returns also the norms of the sequences for each length.
+        """
+        values, symbols = symbol_norms(store, **self._params())
+        n_lengths = values.shape[1]
+        # lengths longer than a sequence have kernel 1 with itself only
+        overflow = (np.arange(self.min_kn, self.max_kn + 1) >
+                    store.lengths[:, None]).astype(float)
+        norms = values.sum(axis=2) + overflow
+        if self.normalize_before:
+            scale = np.sqrt(norms * n_lengths)[:, :, None]
+        else:
+            scale = np.sqrt(norms.sum(axis=1))[:, None, None]
+        sketches = np.zeros((len(store), n_lengths,
+                             len(self.symbols_) + 1))
+        # subsequences ending with a symbol not in the training set do not
+        # contribute to the kernel
+        position = np.searchsorted(self.symbols_, symbols)
+        found = position < len(self.symbols_)
+        found[found] = self.symbols_[position[found]] == symbols[found]
+        sketches[:, :, position[found]] = np.sqrt(values[:, :, found])
+        sketches[:, :, -1] = overflow
+        sketches /= scale
+        return sketches.reshape(len(store), -1), norms
+
+    def fit(self, X, y=None):
+        """Index the distinct sequences of X."""
+        self.X_train_ = np.ravel(X)
+        train_store = SequenceStore(self.X_train_, alphabet=self.alphabet)
+        self.unique_store_, _, inverse = train_store.unique()
+        # samples of each distinct sequence
+        self.counts_ = np.bincount(inverse, minlength=len(self.unique_store_))
+        order = np.argsort(inverse, kind='mergesort')
+        self.members_ = np.split(order, np.cumsum(self.counts_)[:-1])
+        self.symbols_ = np.unique(self.unique_store_.data)
+        self.sketches_, self.norms_ = self._sketches(self.unique_store_)
+        return self
+
+    def _similarity(self, store, norms, rows, cols):
+        """Exact normalised kernel of the pairs (store[rows], unique[cols])."""
+        values = sk._pairs_kernel(
+            store, self.unique_store_, rows, cols,
+            hard_matching=True, algorithm=self.algorithm, **self._params())
+        if self.normalize_before:
+            values /= np.sqrt(norms[rows] * self.norms_[cols])
+            return values.mean(axis=1)
+        return values.sum(axis=1) / np.sqrt(
+            norms[rows].sum(axis=1) * self.norms_[cols].sum(axis=1))
+
+    def _kth(self, values, uniques, n_neighbors):
+        """Similarity of the k-th sample among the evaluated sequences."""
+        order = np.argsort(-values, kind='mergesort')
+        covered = np.searchsorted(np.cumsum(self.counts_[uniques[order]]),
+                                  n_neighbors)
+        if covered >= len(order):
+            return -np.inf
+        return values[order[covered]]
+
+    def _neighbors(self, values, uniques, n_neighbors):
+        """The n_neighbors samples with the highest similarities."""
+        order = np.lexsort((uniques, -values))
+        values, uniques = values[order], uniques[order]
+        samples = np.concatenate([self.members_[u] for u in
+                                  uniques[:n_neighbors]])
+        values = np.repeat(values[:n_neighbors],
+                           self.counts_[uniques[:n_neighbors]])
+        return values[:n_neighbors], samples[:n_neighbors]
+
+    def kneighbors(self, X, n_neighbors=5, exact=True, n_candidates=None):
+        """The training sequences most similar to each sequence of X.
+
+        Parameters
+        ----------
+        X : array of str, shape (n_queries,)
+        n_neighbors : int, optional
+            Number of neighbours of each query.
+        exact : bool, optional
+            If False, the exact kernel is computed only with the distinct
+            training sequences with the n_candidates highest bounds.
+        n_candidates : int, optional
+            Number of candidates of the approximate mode, 10 * n_neighbors by
+            default.
+
+        Returns
+        -------
+        similarities : array, shape (n_queries, n_neighbors)
+            Normalised kernel with the neighbours, in decreasing order.
+        indices : array of int, shape (n_queries, n_neighbors)
+            Position of the neighbours in the training sequences.
+        """
+        if n_neighbors > len(self.X_train_):
+            raise ValueError("n_neighbors is %d, but there are only %d "
+                             "training sequences" % (n_neighbors,
+                                                     len(self.X_train_)))
+        if n_candidates is None:
+            n_candidates = 10 * n_neighbors
+        n_candidates = max(n_candidates, n_neighbors)
+        store = as_store(np.ravel(X), self.unique_store_.alphabet)
+        n_queries = len(store)
+        similarities = np.empty((n_queries, n_neighbors))
+        indices = np.empty((n_queries, n_neighbors), dtype=np.intp)
+        self.n_evaluations_ = 0
+
+        for start in range(0, n_queries, self.batch_size):
+            batch = store.take(np.arange(start, min(start + self.batch_size,
+                                                    n_queries)))
+            sketches, norms = self._sketches(batch)
+            bounds = sketches.dot(self.sketches_.T)
+            order = np.argsort(-bounds, axis=1, kind='mergesort')
+            # exact similarities, in the order of the bounds; the active
+            # queries have evaluated order[:, :position]
+            exact_values = np.empty(bounds.shape)
+            evaluated = np.zeros(len(batch), dtype=np.intp)
+            active = np.arange(len(batch))
+            position = 0
+            step = max(n_neighbors, 8) if exact else n_candidates
+            while len(active):
+                cols = order[active, position:position + step]
+                values = self._similarity(
+                    batch, norms, np.repeat(active, cols.shape[1]),
+                    cols.ravel())
+                self.n_evaluations_ += len(values)
+                exact_values[active, position:position + cols.shape[1]] = \
+                    values.reshape(cols.shape)
+                position += cols.shape[1]
+                evaluated[active] = position
+                if not exact or position >= len(self.unique_store_):
+                    break
+                # continue with the queries whose next bound can still win
+                next_bounds = bounds[active, order[active, position]]
+                kth = np.array([self._kth(
+                    exact_values[q, :position], order[q, :position],
+                    n_neighbors) for q in active])
+                active = active[next_bounds >= kth - _EPS]
+                step *= 2
+
+            for q in range(len(batch)):
+                similarities[start + q], indices[start + q] = \
+                    self._neighbors(exact_values[q, :evaluated[q]],
+                                    order[q, :evaluated[q]], n_neighbors)
+        return similarities, indices
+
+
+def recall(indices, true_indices):
+    """Fraction of the true neighbours found, on average over the queries."""
+    return np.mean([len(np.intersect1d(found, true)) / float(len(true))
+                    for found, true in zip(indices, true_indices)])
@@ -0,0 +1,192 @@
+"""Compact storage of integer-encoded sequences."""
+import numpy as np
+import os
+import shutil
+import tempfile
+
+
+class SequenceStore(object):
+    """Integer-encoded sequences in a single contiguous buffer.
+
+    Sequences are encoded once, according to an alphabet, and concatenated
+    in `data`; the i-th sequence is data[offsets[i]:offsets[i + 1]].
+    Like `DataSet` in core/src/data_set.h, but without one allocation for
+    each element.
+
+    Parameters
+    ----------
+    sequences : iterable of str
+        Sequences to encode.
+    alphabet : str, optional
+        Symbols of the alphabet, at most 256. Each symbol is encoded with its
+        position in the alphabet. If None, symbols are encoded with their
+        byte value.
+
+    Attributes
+    ----------
+    data : array of uint8
+        The encoded sequences, one after the other.
+    offsets : array of intp, shape (n_sequences + 1,)
+        Boundaries of the sequences in `data`.
+    """
+
+    def __init__(self, sequences, alphabet=None):
+        if alphabet is not None and len(alphabet) > 256:
+            raise ValueError("The alphabet can contain at most 256 symbols")
+        self.alphabet = alphabet
+        self._temp_folder = None
+        self._unique = None
+
+        sequences = [x if isinstance(x, bytes) else x.encode('latin-1')
+                     for x in sequences]
+        self.offsets = np.zeros(len(sequences) + 1, dtype=np.intp)
+        np.cumsum([len(x) for x in sequences], out=self.offsets[1:])
+        self.data = np.frombuffer(b''.join(sequences), dtype=np.uint8)
+
+        if alphabet is not None:
+            codes = self._codes()
+            self.data = codes[self.data]
+            if np.any(self.data == len(alphabet)):
+                raise ValueError("Sequences contain symbols which are not in "
+                                 "the alphabet")
+            self.data = self.data.astype(np.uint8)
+
+    def _codes(self):
+        # map each byte to its code; len(alphabet) marks unknown symbols
+        codes = np.empty(256, dtype=np.intp)
+        codes.fill(len(self.alphabet))
+        symbols = np.frombuffer(self.alphabet.encode('latin-1'),
+                                dtype=np.uint8)
+        codes[symbols] = np.arange(len(symbols))
+        return codes
+
+    @property
+    def symbols(self):
+        """The byte value of each code."""
+        if self.alphabet is None:
+            return np.arange(256, dtype=np.uint8)
+        return np.frombuffer(self.alphabet.encode('latin-1'), dtype=np.uint8)
+
+    @property
+    def n_symbols(self):
+        """Number of possible codes."""
+        return 256 if self.alphabet is None else len(self.alphabet)
+
+    @property
+    def lengths(self):
+        """Length of each sequence."""
+        return np.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        """Decode the i-th sequence."""
+        codes = self.data[self.offsets[i]:self.offsets[i + 1]]
+        return self.symbols[codes].tobytes().decode('latin-1')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def equals(self, other):
+        """True if other contains the same sequences."""
+        if not isinstance(other, SequenceStore):
+            other = SequenceStore(other, alphabet=self.alphabet)
+        if self.alphabet != other.alphabet:
+            return list(self) == list(other)
+        return (np.array_equal(self.offsets, other.offsets) and
+                np.array_equal(self.data, other.data))
+
+    def take(self, indices):
+        """A new store with the sequences at the given indices."""
+        indices = np.asarray(indices, dtype=np.intp)
+        store = SequenceStore([], alphabet=self.alphabet)
+        store.offsets = np.zeros(len(indices) + 1, dtype=np.intp)
+        np.cumsum(self.lengths[indices], out=store.offsets[1:])
+        store.data = np.concatenate(
+            [self.data[self.offsets[i]:self.offsets[i + 1]] for i in indices]
+            or [np.empty(0, dtype=np.uint8)])
+        return store
+
+    def concatenate(self, other):
+        """A new store with the sequences of self, then the ones of other.
+
+        The buffers are appended as they are, without encoding the
+        sequences again, so both stores must use the same alphabet.
+        """
+        if self.alphabet != other.alphabet:
+            raise ValueError("The stores are encoded with different "
+                             "alphabets")
+        store = SequenceStore([], alphabet=self.alphabet)
+        store.offsets = np.concatenate(
+            (self.offsets, other.offsets[1:] + self.offsets[-1]))
+        store.data = np.concatenate((self.data, other.data))
+        return store
+
+    def unique(self):
+        """Remove the duplicated sequences.
+
+        The result is computed once and cached.
+
+        Returns
+        -------
+        unique : SequenceStore
+            The distinct sequences, in order of first occurrence.
+        index : array of intp
+            Position in self of each sequence of `unique`.
+        inverse : array of intp
+            Position in `unique` of each sequence of self, so that
+            self[i] == unique[inverse[i]].
+        """
+        if self._unique is None:
+            keys = np.empty(len(self), dtype=object)
+            keys[:] = [self.data[self.offsets[i]:self.offsets[i + 1]]
+                       .tobytes() for i in range(len(self))]
+            _, index, inverse = np.unique(keys, return_index=True,
+                                          return_inverse=True)
+            # sort the unique sequences by first occurrence
+            order = np.argsort(index)
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+            index = index[order].astype(np.intp)
+            inverse = rank[inverse].astype(np.intp)
+            # None stands for self, to avoid a reference cycle
+            unique = None if len(index) == len(self) else self.take(index)
+            self._unique = unique, index, inverse
+        unique, index, inverse = self._unique
+        return (self if unique is None else unique), index, inverse
+
+    def share(self, folder=None):
+        """Move the buffers to memory-mapped files.
+
+        Memory-mapped arrays are passed to joblib workers as references to
+        the files, so the workers read the sequences without copying them.
+        The files are removed when the store is deleted.
+        """
+        if isinstance(self.data, np.memmap):
+            return self
+        if folder is None:
+            folder = self._temp_folder = tempfile.mkdtemp(
+                prefix='string_kernel_')
+        for name in ('data', 'offsets'):
+            filename = os.path.join(folder, '%s_%d.npy' % (name, id(self)))
+            np.save(filename, getattr(self, name))
+            setattr(self, name, np.load(filename, mmap_mode='r'))
+        return self
+
+    def __getstate__(self):
+        # the temporary files belong to this instance only
+        state = self.__dict__.copy()
+        state['_temp_folder'] = None
+        return state
+
+    def __del__(self):
+        if getattr(self, '_temp_folder', None) is not None:
+            shutil.rmtree(self._temp_folder, ignore_errors=True)
+
+
+def as_store(X, alphabet=None):
+    """Encode X, unless it is already a SequenceStore."""
+    if isinstance(X, SequenceStore):
+        return X
+    return SequenceStore(X, alphabet=alphabet)
@@ -1,20 +1,45 @@
 """Interface for string kernel sklearn-like."""
 from __future__ import print_function
-import joblib as jl
 import numpy as np
+import os
+import shutil
+import tempfile
 
+from collections import OrderedDict
 from functools import partial
-from itertools import combinations
 from sklearn.base import BaseEstimator, TransformerMixin
 
-try:
-    import sys
-    sys.path.append("/usr/lib/python2.7/dist-packages/")
-    from shogun.Kernel import SubsequenceStringKernel, IdentityKernelNormalizer
-    from shogun.Features import StringCharFeatures, RAWBYTE
-    __shogun__ = True
-except:
-    __shogun__ = False
+from string_kernel.core import condensed, indexed, scheduler, substitution
+from string_kernel.core.sequences import SequenceStore, as_store
+from string_kernel.core.stats import KernelStats
+
+
+
+def _effective_n_jobs(n_jobs):
+    """Number of jobs, as joblib.effective_n_jobs, without importing joblib.
+
+    joblib is imported only by the functions which actually run in parallel.
+    """
+    if n_jobs == 0:
+        raise ValueError("n_jobs == 0 has no meaning")
+    if n_jobs is None:
+        return 1
+    if n_jobs < 0:
+        import multiprocessing
+        return max(multiprocessing.cpu_count() + 1 + n_jobs, 1)
+    return n_jobs
+
+
+def _import_shogun():
+    """The shogun classes used by SumStringKernel, None if not installed."""
+    try:
+        from shogun.Kernel import (SubsequenceStringKernel,
+                                   IdentityKernelNormalizer)
+        from shogun.Features import StringCharFeatures, RAWBYTE
+    except ImportError:
+        return None
+    return (SubsequenceStringKernel, IdentityKernelNormalizer,
+            StringCharFeatures, RAWBYTE)
 
 
 def _core_stringkernel(x, y, kn, lamda, hard_matching, aa_model=None):
@@ -22,93 +47,650 @@ def _core_stringkernel(x, y, kn, lamda, hard_matching, aa_model=None):
     if len_x < kn or len_y < kn:
         # do not compute kernel
         return int(x == y)
+    return _core_sumstringkernel(x, y, kn, kn, lamda, hard_matching,
+                                 aa_model)[0]
 
-    x_dim = len_x + 1
-    y_dim = len_y + 1
-    # Allocate and initialise Kd
-    Kd = [np.ones(x_dim * y_dim), np.zeros(x_dim * y_dim)]
-    # Kd now contains two matrices, that are n+1 x m+1 (empty string included)
-    # Kd[0] is composed by 1s (follows the definition of K_0)
-    # Kd[1] is composed by 0s -> it starts to be filled
 
-    #  start with i = kn = 1, 2, 3 ...
-    for i in range(1, kn):
-        #   Set the Kd to zero for those lengths of s and t
-        #   where s (or t) has exactly length i-1 and t (or s)
-        #   has length >= i-1. L-shaped upside down matrix
+def _codes(x):
+    """Byte values of the symbols of x, unless it is already encoded."""
+    if isinstance(x, np.ndarray):
+        return x
+    if not isinstance(x, bytes):
+        x = x.encode('latin-1')
+    return np.frombuffer(x, dtype=np.uint8)
 
-        for j in range(i - 1, len_x):
-            Kd[i % 2][j * y_dim + i - 1] = 0
 
-        for j in range(i - 1, len_y):
-            Kd[i % 2][(i - 1) * y_dim + j] = 0
+def _core_sumstringkernel(x, y, min_kn, max_kn, lamda, hard_matching,
+                          aa_model=None, table=None):
+    """Kernel contributions of all the lengths from min_kn to max_kn.
 
-        for j in range(i, len_x):
+    The dynamic programming table Kd of level i has a row for each prefix of
+    x, and row j only depends on row j - 1 of the levels i and i - 1.
+    The tables are therefore swept one row at a time, keeping only the
+    current row of each level (levels are updated from the highest, so that
+    the lower one still holds the previous row), and the contribution of
+    each length is accumulated as soon as its row is ready.
+    The tables take O(max_kn * min(len(x), len(y))) memory instead of
+    O(max_kn * len(x) * len(y)).
+
+    x and y are strings or arrays of codes. The matching scores of all the
+    pairs of symbols are gathered once, from `table` (scores between codes,
+    see substitution.table) or, if it is None, from aa_model for the byte
+    values, and reused for all the lengths.
+
+    Returns
+    -------
+    values : array, shape (max_kn - min_kn + 1,)
+        values[i] is the kernel of length min_kn + i between x and y.
+    """
+    x, y = _codes(x), _codes(y)
+    values = np.empty(max_kn - min_kn + 1)
+    if not hard_matching and table is None:
+        table = substitution.table(aa_model, np.arange(256))
+    if len(x) < len(y):
+        # rows are as long as the shortest sequence
+        x, y = y, x
+        if table is not None:
+            table = table.T
+    len_x, len_y = len(x), len(y)
+
+    # lengths longer than a sequence are not computed
+    top = min(max_kn, len_y)
+    values[max(top + 1, min_kn) - min_kn:] = int(
+        len_x == len_y and np.array_equal(x, y))
+
+    # Kd[i] is the current row of the level i table; level 0 is all 1s
+    Kd = np.zeros((max(top, 1), len_y))
+    Kd[0] = 1
+    sums = np.zeros(max_kn + 1)
+    if table is None:
+        scores = (x[:, None] == y).astype(float)
+    else:
+        scores = table[x[:, None], y]
+    x_, y_ = x.tolist(), y.tolist()
+    for j in range(len_x):
+        for i in range(min(j, top - 1), 0, -1):
             # Kdd maintains the contribution of the left and diagonal terms
-            # that is, ONLY the contribution of the left (not influenced by the
-            # upper terms) and the eventual contibution of lambda^2 in case the
-            # chars are the same
             Kdd = 0
-
+            row, prev = Kd[i], Kd[i - 1]
             for k in range(i, len_y):
-                if x[j - 1] != y[k - 1]:
-                    # ((.))-1 is because indices start with 0 (not with 1)
+                if x_[j - 1] != y_[k - 1]:
                     Kdd *= lamda
                 else:
-                    Kdd = lamda * (Kdd + (lamda * Kd[(i + 1) % 2][(j - 1) * y_dim + k - 1]))
-                Kd[i % 2][j*y_dim+k] = lamda * Kd[i % 2][(j - 1) * y_dim + k] + Kdd
-
-    # Calculate K
-    sum_ = 0
-    for i in range(kn - 1, len_x):
-        for j in range(kn - 1, len_y):
-            # hard matching
-            if hard_matching:
-                if x[i] == y[j]:
-                    sum_ += lamda * lamda * Kd[(kn - 1) % 2][i*y_dim + j]
-            else:
-                # soft matching, regulated from models.h, amminoacidic model
-                sum_ += lamda * lamda * \
-                      aa_model[(ord(x[i])-65)*26 + ord(y[j])-65] * \
-                      Kd[(kn - 1) % 2][i*y_dim + j];
-    return sum_
+                    Kdd = lamda * (Kdd + (lamda * prev[k - 1]))
+                row[k] = lamda * row[k] + Kdd
+
+        # Calculate K, row j, for the lengths whose table has this row
+        weights = scores[j]
+        for kn in range(max(min_kn, 1), min(top, j + 1) + 1):
+            sums[kn] += lamda * lamda * np.dot(weights[kn - 1:],
+                                               Kd[kn - 1, kn - 1:])
+
+    for kn in range(max(min_kn, 1), top + 1):
+        values[kn - min_kn] = sums[kn]
+    return values
+
+
+def _core_sumstringkernel_sparse(x, y, min_kn, max_kn, lamda):
+    """Hard matching kernel of all the lengths, visiting only the matches.
+
+    With hard matching, the table of level i at a match (a, b), that is
+    x[a] == y[b], is the sum over the matches (a', b') with a' < a, b' < b of
+    lamda ** (a - 1 - a' + b - 1 - b') * P(a', b'), where
+    P(a', b') = lamda ** 2 * Kd[i - 1][a'][b'], and the contribution of the
+    length i is the sum of P over all the matches.
+    The matches are visited row by row, keeping the P of the previous rows
+    in a Fenwick tree over the columns of y, where each node stores the sum
+    of its P decayed to its last column. The decay along the rows is a
+    common factor, rescaled when it becomes too small.
+    Time is O(max_kn * n_matches * log(len(y))) instead of
+    O(max_kn * len(x) * len(y)), memory is O(n_matches).
+
+    Returns
+    -------
+    values : array, shape (max_kn - min_kn + 1,)
+        values[i] is the kernel of length min_kn + i between x and y.
+    """
+    values = np.empty(max_kn - min_kn + 1)
+    len_x, len_y = len(x), len(y)
+
+    # lengths longer than a sequence are not computed, as in the dense DP
+    top = min(max_kn, len_x, len_y)
+    values[max(top + 1, min_kn) - min_kn:] = int(x == y)
+
+    # columns of the matches of each row
+    positions = {}
+    for b, symbol in enumerate(y):
+        positions.setdefault(symbol, []).append(b)
+    matches = [positions.get(symbol, ()) for symbol in x]
+    # powers[d] is lamda ** d
+    powers = lamda ** np.arange(len_y + 1)
+
+    # P of level 1, lamda ** 2 * Kd[0], where Kd[0] is all 1s
+    P = [[lamda * lamda] * len(row) for row in matches]
+    for kn in range(1, top + 1):
+        if kn >= min_kn:
+            values[kn - min_kn] = sum(sum(row) for row in P)
+        if kn == top:
+            break
+
+        tree = np.zeros(len_y + 1)
+        scale = 1.
+        P_next = []
+        for row, P_row in zip(matches, P):
+            # Kd[kn] at the matches of this row, from the previous rows
+            Kd = []
+            for b in row:
+                value, node = 0., b
+                while node > 0:
+                    value += tree[node] * powers[b - node]
+                    node &= node - 1
+                Kd.append(value * scale)
+            P_next.append([lamda * lamda * value for value in Kd])
+
+            # one more row of decay for the previous matches
+            scale *= lamda
+            if scale < 1e-100:
+                tree *= scale
+                scale = 1.
+            for b, p in zip(row, P_row):
+                node = b + 1
+                while node <= len_y:
+                    tree[node] += p / scale * powers[node - 1 - b]
+                    node += node & -node
+        P = P_next
+    return values
+
+
+def _core_sumstringkernel_gapped(x, y, min_kn, max_kn, lamda, max_gap,
+                                 hard_matching, aa_model=None, table=None):
+    """Kernel of all the lengths, with at most max_gap symbols skipped
+    between two consecutive symbols of a subsequence.
+
+    M[i][a, b] is the sum over the common subsequences of length i ending
+    with x[a] == y[b] of lamda ** (span in x + span in y). A subsequence
+    ending with (a, b) can only be extended by a match at most max_gap + 1
+    positions further in both sequences, so
+
+        M[i + 1][a, b] = sum_{d, e = 1 .. max_gap + 1}
+                         lamda ** (d + e) * M[i][a - d, b - e]
+
+    at the matches, a sum over a band of max_gap + 1 rows and columns,
+    computed as two windowed sums. The kernel of length i is the sum of
+    M[i]; with soft matching, only the last symbol of the subsequences is
+    scored, as in the unbounded dynamic programming, and the contribution of
+    the length i is the band sum of M[i - 1] weighted by the scores.
+    This is the kernel of the explicit feature map with limit = max_gap + 2
+    (see feature_map.allperm), and the unbounded one for max_gap >= len(x).
+
+    Returns
+    -------
+    values : array, shape (max_kn - min_kn + 1,)
+        values[i] is the kernel of length min_kn + i between x and y.
+    """
+    x, y = _codes(x), _codes(y)
+    values = np.empty(max_kn - min_kn + 1)
+    len_x, len_y = len(x), len(y)
+
+    # lengths longer than a sequence are not computed, as in the dense DP
+    top = min(max_kn, len_x, len_y)
+    values[max(top + 1, min_kn) - min_kn:] = int(
+        len_x == len_y and np.array_equal(x, y))
+    if top == 0:
+        return values
+    if not hard_matching and table is None:
+        table = substitution.table(aa_model, np.arange(256))
+    matches = (x[:, None] == y).astype(float)
+    scores = matches if table is None else table[x[:, None], y]
+    # powers[d - 1] is lamda ** d, for d in 1 .. max_gap + 1
+    powers = lamda ** np.arange(1, min(max_gap + 1, max(len_x, len_y)) + 1)
+
+    M = lamda * lamda * matches
+    for kn in range(1, top + 1):
+        if kn == 1:
+            band = lamda * lamda
+        else:
+            # band[a, b], sum of lamda ** (d + e) * M[a - d, b - e]
+            columns = np.zeros_like(M)
+            for e, power in enumerate(powers[:len_y - 1], 1):
+                columns[:, e:] += power * M[:, :-e]
+            band = np.zeros_like(M)
+            for d, power in enumerate(powers[:len_x - 1], 1):
+                band[d:] += power * columns[:-d]
+            M = matches * band
+        if kn >= min_kn:
+            values[kn - min_kn] = np.sum(scores * band)
+    return values
 
 
 try:
-    import pyximport; pyximport.install(pyimport=True, reload_support=True)
-    import sk_fast
-    _core_function = sk_fast._core_stringkernel
+    # built by setup.py (python setup.py build_ext --inplace)
+    from . import sk_fast
 except ImportError:
-    _core_function = _core_stringkernel
+    sk_fast = None
+
+# maximum number of pairs evaluated with a single native call
+_BLOCK_SIZE = 2 ** 16
+
+
+def _aa_model_table(aa_model, store, hard_matching=False):
+    """Substitution scores indexed by the codes of two symbols of store.
+
+    With hard matching the scores are not used, and None is returned. The
+    table is built once for each kernel and given to _pairs_kernel, instead
+    of aa_model, so that the tiles do not build it again.
+    """
+    if hard_matching:
+        return None
+    _check_matching(hard_matching, aa_model)
+    return substitution.table(aa_model, store.symbols)
+
+
+def _share(n_jobs, *stores):
+    # processes read the sequences from memory-mapped files
+    if sk_fast is None and _effective_n_jobs(n_jobs) > 1:
+        for store in stores:
+            store.share()
+
+
+def _core_function(store_x, store_y, rows, cols, min_kn, max_kn, lamda,
+                   hard_matching, table, out, n_jobs=1, algorithm='dense',
+                   max_gap=None):
+    """Kernel of all the lengths for the pairs (rows[p], cols[p]) into out.
+
+    table holds the soft matching scores (see _aa_model_table), None with
+    hard matching.
+    """
+    sparse = algorithm == 'sparse'
+    if sk_fast is not None:
+        sk_fast.sumstringkernel_pairs(
+            store_x.data, store_x.offsets, store_y.data, store_y.offsets,
+            rows, cols, min_kn, max_kn, lamda, bool(hard_matching), table,
+            out, num_threads=n_jobs, sparse=sparse,
+            max_gap=-1 if max_gap is None else max_gap)
+        return out
+
+    for p, (i, j) in enumerate(zip(rows, cols)):
+        if max_gap is not None:
+            out[p] = _core_sumstringkernel_gapped(
+                store_x.data[store_x.offsets[i]:store_x.offsets[i + 1]],
+                store_y.data[store_y.offsets[j]:store_y.offsets[j + 1]],
+                min_kn, max_kn, lamda, max_gap, hard_matching, table=table)
+        elif sparse:
+            out[p] = _core_sumstringkernel_sparse(
+                store_x[i], store_y[j], min_kn, max_kn, lamda)
+        else:
+            out[p] = _core_sumstringkernel(
+                store_x.data[store_x.offsets[i]:store_x.offsets[i + 1]],
+                store_y.data[store_y.offsets[j]:store_y.offsets[j + 1]],
+                min_kn, max_kn, lamda, hard_matching, table=table)
+    return out
+
+
+def _python_block(store_x, store_y, rows, cols, min_kn, max_kn, lamda,
+                  hard_matching, table, algorithm='dense', max_gap=None):
+    out = np.empty((len(rows), max_kn - min_kn + 1))
+    return _core_function(store_x, store_y, rows, cols, min_kn, max_kn, lamda,
+                          hard_matching, table, out, algorithm=algorithm,
+                          max_gap=max_gap)
+
+
+def _check_matching(hard_matching, aa_model):
+    # without a model all the soft matching scores, so the kernel, are 0
+    if not hard_matching and aa_model is None:
+        raise ValueError("Soft matching (hard_matching=False) requires an "
+                         "aa_model")
+
+
+def _check_algorithm(algorithm, hard_matching, max_gap=None):
+    if algorithm not in ('dense', 'sparse'):
+        raise ValueError("algorithm must be 'dense' or 'sparse', got %r"
+                         % (algorithm,))
+    if algorithm == 'sparse' and not hard_matching:
+        raise ValueError("The sparse algorithm requires hard_matching=True")
+    if max_gap is not None and max_gap < 0:
+        raise ValueError("max_gap must be None or >= 0, got %r" % (max_gap,))
+
+
+def _pairs_kernel(store_x, store_y, rows, cols, min_kn=1, max_kn=2, lamda=.5,
+                  hard_matching=True, aa_model=None, n_jobs=1,
+                  algorithm='dense', max_gap=None, table=None):
+    """Kernel of all the lengths for a list of pairs of encoded sequences.
+
+    Pairs are split in blocks, each one evaluated with a single call.
+    The compiled engine uses `n_jobs` threads inside each call, while the
+    pure Python one distributes the blocks among `n_jobs` processes.
+    With algorithm='sparse' (hard matching only) the dynamic programming
+    only visits the positions where the two sequences match, which is
+    faster for large alphabets.
+    With max_gap, at most max_gap symbols are skipped between consecutive
+    symbols of a subsequence, and the banded dynamic programming of
+    _core_sumstringkernel_gapped is used, whatever the algorithm: each
+    match only looks back max_gap + 1 rows and columns.
+    The soft matching scores are table, if given, or the ones of aa_model
+    (see _aa_model_table).
+
+    Returns
+    -------
+    values : array, shape (len(rows), max_kn - min_kn + 1)
+    """
+    _check_algorithm(algorithm, hard_matching, max_gap)
+    if table is None:
+        table = _aa_model_table(aa_model, store_x, hard_matching)
+    rows = np.ascontiguousarray(rows, dtype=np.intp)
+    cols = np.ascontiguousarray(cols, dtype=np.intp)
+    n_pairs = len(rows)
+    n_jobs = _effective_n_jobs(n_jobs)
+    values = np.empty((n_pairs, max_kn - min_kn + 1))
+
+    if sk_fast is not None or n_jobs == 1:
+        for start in range(0, n_pairs, _BLOCK_SIZE):
+            block = slice(start, start + _BLOCK_SIZE)
+            _core_function(store_x, store_y, rows[block], cols[block],
+                           min_kn, max_kn, lamda, hard_matching, table,
+                           values[block], n_jobs=n_jobs, algorithm=algorithm,
+                           max_gap=max_gap)
+        return values
+
+    import joblib as jl
+    _share(n_jobs, store_x, store_y)
+    block_size = max(1, min(_BLOCK_SIZE, -(-n_pairs // (4 * n_jobs))))
+    blocks = [slice(start, start + block_size)
+              for start in range(0, n_pairs, block_size)]
+    result_ = jl.Parallel(n_jobs=n_jobs)(jl.delayed(_python_block)(
+        store_x, store_y, rows[block], cols[block], min_kn, max_kn, lamda,
+        hard_matching, table, algorithm, max_gap) for block in blocks)
+    for block, result in zip(blocks, result_):
+        values[block] = result
+    return values
+
+
+def _output_array(out, shape, dtype=np.float64):
+    """Array where to write a kernel of the given shape.
+
+    out can be None (a new array in memory), the name of a .npy file to
+    create, memory-mapped, or an existing array of the right shape.
+    """
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if not hasattr(out, 'shape'):
+        return np.lib.format.open_memmap(out, mode='w+', dtype=dtype,
+                                         shape=shape)
+    if out.shape != shape:
+        raise ValueError("out has shape %s, expected %s" % (out.shape, shape))
+    return out
+
+
+def _row_blocks(n_rows, n_cols):
+    """Slices of rows of a matrix, of about _BLOCK_SIZE entries each."""
+    step = max(1, _BLOCK_SIZE // max(n_cols, 1))
+    return [slice(start, min(start + step, n_rows))
+            for start in range(0, n_rows, step)]
+
+
+def _normalize(kernel, norms_x, norms_y=None):
+    """Divide in place kernel[i, j] by sqrt(norms_x[i] * norms_y[j]).
+
+    If norms_y is None the kernel is symmetric and its diagonal is set to 1.
+    The kernel is processed in blocks of rows, so that no temporary array
+    of the size of the kernel is created.
+    """
+    symmetric = norms_y is None
+    if symmetric:
+        norms_y = norms_x
+    for rows in _row_blocks(*kernel.shape):
+        kernel[rows] /= np.sqrt(np.outer(norms_x[rows], norms_y))
+    if symmetric:
+        kernel.flat[::kernel.shape[0] + 1] = 1
+    return kernel
+
+
+def _norms(store, n_jobs=1, stats=None, **kwargs):
+    """Kernel of each sequence of store with itself, for all the lengths.
+
+    The time and the work are recorded in stats (see core.stats), if given.
+    """
+    if stats is None:
+        stats = KernelStats()
+    diagonal = np.arange(len(store))
+    with stats.stage('norms'):
+        stats.count_norms(store.lengths, kwargs.get('max_kn', 2))
+        return _pairs_kernel(store, store, diagonal, diagonal,
+                             n_jobs=n_jobs, **kwargs)
+
+
+def _tile_values(rows, cols, store_x, store_y, symmetric=False,
+                 norms_x=None, norms_y=None, **kwargs):
+    """Unnormalised kernel of the pairs (i, j) of the tile (rows, cols).
+
+    If symmetric and the tile lies on the diagonal, only its upper triangle
+    is computed.
+    If norms are given, each length is normalised before summing them.
+
+    Returns
+    -------
+    i, j : array of intp
+        Row and column of each pair.
+    values : array
+        Kernel of each pair.
+    """
+    if symmetric and rows == cols:
+        i, j = np.triu_indices(rows.stop - rows.start, 1)
+    else:
+        i, j = np.indices((rows.stop - rows.start, cols.stop - cols.start))
+        i, j = i.ravel(), j.ravel()
+    i += rows.start
+    j += cols.start
+
+    values = _pairs_kernel(store_x, store_y, i, j, n_jobs=1, **kwargs)
+    if norms_x is not None:
+        values /= np.sqrt(norms_x[i] * norms_y[j])
+    return i, j, values.sum(axis=1)
+
+
+def _tile_kernel(out, rows, cols, symmetric=False, **kwargs):
+    """Compute the tile out[rows, cols] of an unnormalised kernel.
+
+    If symmetric, the tile is mirrored in out[cols, rows] (see _tile_values).
+    """
+    i, j, values = _tile_values(rows, cols, symmetric=symmetric, **kwargs)
+    out[i, j] = values
+    if symmetric:
+        out[j, i] = values
+
+
+def _tile_condensed(out, rows, cols, store, **kwargs):
+    """Compute the tile (rows, cols) of the condensed upper triangle out of
+    the unnormalised kernel of store (see core.condensed)."""
+    i, j, values = _tile_values(rows, cols, store_x=store, store_y=store,
+                                symmetric=True, **kwargs)
+    out[condensed.index(i, j, len(store))] = values
+
+
+def _count_tiles(stats, tiles, lengths_x, lengths_y, max_kn,
+                 symmetric=False):
+    """Record in stats the tiles to compute and their work."""
+    stats.add_tiles(len(tiles))
+    for rows, cols in tiles:
+        stats.count(lengths_x[rows], lengths_y[cols], max_kn,
+                    triangle=symmetric and rows == cols)
+
+
+def _tiles_in_processes(function, tiles, out, n_jobs, stats):
+    """Compute the tiles in n_jobs processes writing into out.
+
+    With a progress callback, the tiles are dispatched in batches, and
+    their completion reported after each one.
+    """
+    import joblib as jl
+    if stats.progress is None:
+        jl.Parallel(n_jobs=n_jobs)(
+            jl.delayed(function)(out, rows, cols) for rows, cols in tiles)
+        stats.tiles_completed(len(tiles))
+        return
+    batch_size = 4 * n_jobs
+    with jl.Parallel(n_jobs=n_jobs) as parallel:
+        for start in range(0, len(tiles), batch_size):
+            batch = tiles[start:start + batch_size]
+            parallel(jl.delayed(function)(out, rows, cols)
+                     for rows, cols in batch)
+            stats.tiles_completed(len(batch))
+
+
+def _compute_tiles(function, tiles, out, n_jobs=1, stats=None):
+    """Compute all the tiles, writing them directly into out.
+
+    The completed tiles are reported to stats (see core.stats), if given.
+    """
+    if stats is None:
+        stats = KernelStats()
+
+    def tile(out, rows, cols):
+        function(out, rows, cols)
+        stats.tiles_completed()
+
+    n_jobs = _effective_n_jobs(n_jobs)
+    if n_jobs == 1 or len(tiles) == 1:
+        for rows, cols in tiles:
+            tile(out, rows, cols)
+        return out
+
+    import joblib as jl
+    if sk_fast is not None:
+        # the compiled engine releases the GIL, threads share out
+        jl.Parallel(n_jobs=n_jobs, backend='threading')(
+            jl.delayed(tile)(out, rows, cols) for rows, cols in tiles)
+        return out
+
+    if isinstance(out, np.memmap):
+        # processes write directly into the file
+        _tiles_in_processes(function, tiles, out, n_jobs, stats)
+        return out
+
+    # processes write into a memory-mapped copy of out
+    temp_folder = tempfile.mkdtemp(prefix='string_kernel_')
+    try:
+        shared = np.memmap(os.path.join(temp_folder, 'kernel.mmap'),
+                           dtype=out.dtype, shape=out.shape, mode='w+')
+        _tiles_in_processes(function, tiles, shared, n_jobs, stats)
+        out[...] = shared
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+    return out
+
+
+def _sumstringkernel_symmetric(X, min_kn=1, max_kn=2, lamda=.5,
+                               hard_matching=True, aa_model=None,
+                               normalize_before=False, n_jobs=1,
+                               tile_size=None, alphabet=None,
+                               algorithm='dense', norms=None, out=None,
+                               stats=None, max_gap=None):
+    # all the lengths are computed together for each pair;
+    # norms, if given, are the ones of X for each length (see _norms);
+    # the kernel is written into out (see _output_array);
+    # timings and counters go to stats (see core.stats)
+    if stats is None:
+        stats = KernelStats()
+    store = as_store(X, alphabet)
+    n_samples = len(store)
+    kernel = _output_array(out, (n_samples, n_samples))
+    _share(n_jobs, store)
+
+    params = dict(min_kn=min_kn, max_kn=max_kn, lamda=lamda,
+                  hard_matching=hard_matching, algorithm=algorithm,
+                  max_gap=max_gap,
+                  table=_aa_model_table(aa_model, store, hard_matching))
+    if norms is None:
+        norms = _norms(store, n_jobs=n_jobs, stats=stats, **params)
+
+    tiles = scheduler.make_tiles(store.lengths, tile_size=tile_size)
+    _count_tiles(stats, tiles, store.lengths, store.lengths, max_kn,
+                 symmetric=True)
+    if normalize_before:
+        params.update(norms_x=norms, norms_y=norms)
+    function = partial(_tile_kernel, store_x=store, store_y=store,
+                       symmetric=True, **params)
+    with stats.stage('pairs'):
+        _compute_tiles(function, tiles, kernel, n_jobs=n_jobs, stats=stats)
+
+    if normalize_before:
+        norms = np.ones_like(norms)
+    kernel.flat[::n_samples + 1] = norms.sum(axis=1)
+    return kernel
+
+
+def _sumstringkernel_unsymmetric(X, X_train_, min_kn=1, max_kn=2, lamda=.5,
+                                 hard_matching=True, aa_model=None,
+                                 normalize_before=False, n_jobs=1,
+                                 tile_size=None, alphabet=None,
+                                 algorithm='dense', norms_train=None,
+                                 out=None, stats=None, max_gap=None,
+                                 norms_x=None):
+    # all the lengths are computed together for each pair;
+    # norms_train (norms_x), if given, are the ones of X_train_ (X) for each
+    # length;
+    # the kernel is written into out (see _output_array);
+    # timings and counters go to stats (see core.stats)
+    if stats is None:
+        stats = KernelStats()
+    store_y = as_store(X_train_, alphabet)
+    store_x = as_store(X, store_y.alphabet)
+    if store_x.alphabet != store_y.alphabet:
+        raise ValueError("X and X_train_ are encoded with different alphabets")
+    kernel = _output_array(out, (len(store_x), len(store_y)))
+    _share(n_jobs, store_x, store_y)
+
+    params = dict(min_kn=min_kn, max_kn=max_kn, lamda=lamda,
+                  hard_matching=hard_matching, algorithm=algorithm,
+                  max_gap=max_gap,
+                  table=_aa_model_table(aa_model, store_x, hard_matching))
+    if norms_x is None:
+        norms_x = _norms(store_x, n_jobs=n_jobs, stats=stats, **params)
+    norms_y = norms_train
+    if norms_y is None:
+        norms_y = _norms(store_y, n_jobs=n_jobs, stats=stats, **params)
+
+    tiles = scheduler.make_tiles(store_x.lengths, store_y.lengths,
+                                 tile_size=tile_size)
+    _count_tiles(stats, tiles, store_x.lengths, store_y.lengths, max_kn)
+    if normalize_before:
+        params.update(norms_x=norms_x, norms_y=norms_y)
+    function = partial(_tile_kernel, store_x=store_x, store_y=store_y,
+                       **params)
+    with stats.stage('pairs'):
+        _compute_tiles(function, tiles, kernel, n_jobs=n_jobs, stats=stats)
+
+    norms = np.vstack((norms_x, norms_y))
+    if normalize_before:
+        norms = np.ones_like(norms)
+    return kernel, norms.sum(axis=1)
+
+
+def _same_sequences(X, Y):
+    if X is Y:
+        return True
+    if len(X) != len(Y):
+        return False
+    if isinstance(X, SequenceStore):
+        return X.equals(Y)
+    if isinstance(Y, SequenceStore):
+        return Y.equals(X)
+    return np.all(np.asarray(X) == np.asarray(Y))
 
 
 def _stringkernel_unsymmetric(X, X_train_, kn=1, lamda=.5,
                               hard_matching=True, normalize=True,
-                              aa_model=None, return_norms=False, n_jobs=1):
+                              aa_model=None, return_norms=False, n_jobs=1,
+                              tile_size=None, alphabet=None,
+                              algorithm='dense', norms_train=None, out=None,
+                              max_gap=None, norms_x=None):
     # X != X_train_
-    x_len = len(X)
-    y_len = len(X_train_)
-    kernel = np.empty((x_len, y_len))
-    function = partial(_core_function, kn=kn, lamda=lamda,
-                       hard_matching=hard_matching, aa_model=aa_model)
-    # result_ = [function(x, y) for x in X for y in X_train_]
-    result_ = jl.Parallel(n_jobs=n_jobs)(jl.delayed(function)(
-        x, y) for x in X for y in X_train_)
-    kernel = np.array(result_, dtype=float).reshape(x_len, y_len)
-
-    if return_norms or normalize:
-        # norms_x = [function(x, x) for x in X]
-        norms_x = jl.Parallel(n_jobs=n_jobs)(jl.delayed(function)(
-            x, x) for x in X)
-        # norms_y = [function(x, x) for x in X_train_]
-        norms_y = jl.Parallel(n_jobs=n_jobs)(jl.delayed(function)(
-            x, x) for x in X_train_)
-        norms = np.array(norms_x + norms_y, dtype=float)
-
-    if normalize:
-        x_grid, y_grid = np.meshgrid(norms_y, norms_x)
-        kernel /= np.sqrt(x_grid * y_grid)
-        norms = np.ones_like(norms, dtype=float)
+    kernel, norms = _sumstringkernel_unsymmetric(
+        X, X_train_, min_kn=kn, max_kn=kn, lamda=lamda,
+        hard_matching=hard_matching, aa_model=aa_model,
+        normalize_before=normalize, n_jobs=n_jobs, tile_size=tile_size,
+        alphabet=alphabet, algorithm=algorithm, norms_train=norms_train,
+        out=out, max_gap=max_gap, norms_x=norms_x)
 
     if return_norms:
         return kernel, norms
@@ -117,60 +699,340 @@ def _stringkernel_unsymmetric(X, X_train_, kn=1, lamda=.5,
 
 def _stringkernel_symmetric(X, kn=1, lamda=.5, hard_matching=True,
                             normalize=True, aa_model=None, return_norms=False,
-                            n_jobs=1):
+                            n_jobs=1, tile_size=None, alphabet=None,
+                            algorithm='dense', norms=None, out=None,
+                            max_gap=None):
     # X is not changed (ie in fit transform), optimise
-    n_samples = len(X)
-    kernel = np.empty((n_samples, n_samples))
-    iu1 = np.triu_indices(n_samples, 1)
-    il1 = iu1[::-1]
-
-    function = partial(_core_function, kn=kn, lamda=lamda,
-                       hard_matching=hard_matching, aa_model=aa_model)
-    # result_ = [function(x, y) for x, y in combinations(X, 2)]
-    result_ = jl.Parallel(n_jobs=n_jobs)(jl.delayed(function)(
-        x, y) for x, y in combinations(X, 2))
-    values = np.array(result_, dtype=float)
-    # norms = np.array([function(x, x) for x in X], dtype=float)
-    norms = jl.Parallel(n_jobs=n_jobs)(jl.delayed(function)(
-        x, x) for x in X)
-    norms = np.array(norms, dtype=float)
+    kernel = _sumstringkernel_symmetric(
+        X, min_kn=kn, max_kn=kn, lamda=lamda, hard_matching=hard_matching,
+        aa_model=aa_model, normalize_before=normalize, n_jobs=n_jobs,
+        tile_size=tile_size, alphabet=alphabet, algorithm=algorithm,
+        norms=norms, out=out, max_gap=max_gap)
+
+    if return_norms:
+        return kernel, np.array(kernel.flat[::len(X) + 1])
+    return kernel
+
+
+def _deduplicate(X, X_train_, alphabet=None, norms_train=None, norms_x=None):
+    """Distinct sequences of X and X_train_.
+
+    Returns
+    -------
+    store_x, store_y : SequenceStore
+        Distinct sequences of X and X_train_ (the same object if X and
+        X_train_ contain the same sequences).
+    inverse_x, inverse_y : array of intp, or None
+        Position in store_x (store_y) of each sample, None if there are no
+        duplicates.
+    norms_train, norms_x : array or None
+        The rows of norms_train (norms_x) of the distinct sequences of
+        X_train_ (X).
+    """
+    same_x = _same_sequences(X, X_train_)
+    store_y = as_store(X_train_, alphabet)
+    store_x = store_y if same_x else as_store(X, store_y.alphabet)
+
+    unique_y, index_y, inverse_y = store_y.unique()
+    if unique_y is store_y:
+        inverse_y = None
+    elif norms_train is not None:
+        norms_train = norms_train[index_y]
+    if same_x:
+        return unique_y, unique_y, inverse_y, inverse_y, norms_train, None
+
+    unique_x, index_x, inverse_x = store_x.unique()
+    if unique_x is store_x:
+        inverse_x = None
+    elif norms_x is not None:
+        norms_x = norms_x[index_x]
+    return unique_x, unique_y, inverse_x, inverse_y, norms_train, norms_x
+
+
+def _cpp_sumstringkernel(X, X_train_, same_x, min_kn=1, max_kn=2, lamda=.5,
+                         hard_matching=True, aa_model=None, normalize=True,
+                         n_jobs=1, max_gap=None):
+    """Sum string kernel computed by the C++ extension.
 
+    The extension computes the kernel (and the norms, for normalisation)
+    with native threads and returns it in a NumPy array owning its buffer.
+    Symbols are compared byte for byte, as in the other engines, and soft
+    matching uses the scores of aa_model between byte values: aa_model is
+    required for soft matching.
+    """
+    from string_kernel.core.src.sum_string_kernel import sum_string_kernel
+    kwargs = {}
+    if not same_x:
+        kwargs['train'] = [x.encode('latin-1') for x in X_train_]
+    if not hard_matching:
+        kwargs['scores'] = substitution.table(aa_model, np.arange(256))
+    return sum_string_kernel(
+        [x.encode('latin-1') for x in X], min_kn=min_kn, max_kn=max_kn,
+        lamda=lamda, normalize=int(bool(normalize)),
+        hard_matching=int(bool(hard_matching)),
+        n_jobs=_effective_n_jobs(n_jobs), double_precision=1,
+        max_gap=-1 if max_gap is None else max_gap, **kwargs)
+
+
+def _explicit_sumstringkernel(X, X_train_, same_x, min_kn=1, max_kn=2,
+                              lamda=.5, normalize=True,
+                              normalize_before=False, limit=None):
+    """Sum string kernel as the product of explicit feature maps.
+
+    The subsequences of X and X_train_ are enumerated together (see
+    feature_map.enumerate_subsequences), so that they share the columns.
+    For the lengths longer than a sequence, the sequence itself is a
+    feature of weight 1, since the dynamic programming gives int(x == y)
+    for them. The kernel is the one of the dynamic programming with
+    max_gap = limit - 2 (unbounded if limit is None), hard matching only.
+    """
+    from scipy.sparse import csr_matrix
+    from string_kernel import feature_map
+    strings = list(X) if same_x else list(X) + list(X_train_)
+    rows, features, weights, vocabulary, symbols = \
+        feature_map.enumerate_subsequences(
+            strings, min_kn=min_kn, max_kn=max_kn, limit=limit, lamda=lamda)
+    # length of each subsequence, the number of digits of its code
+    groups = np.zeros(len(vocabulary), dtype=np.intp)
+    codes = vocabulary.copy()
+    while np.any(codes):
+        groups += codes > 0
+        codes //= len(symbols) + 1
+
+    # the sequences shorter than each length
+    kns = np.arange(min_kn, max_kn + 1)
+    _, ids = np.unique(np.array(strings), return_inverse=True)
+    short, kn = np.nonzero(np.array([len(x) for x in strings])[:, None] < kns)
+    n_unique = ids.max() + 1 if len(ids) else 0
+    features = np.concatenate((
+        features, len(vocabulary) + ids[short] * len(kns) + kn))
+    groups = np.concatenate((groups, np.tile(kns, n_unique)))
+    F = csr_matrix((np.concatenate((weights, np.ones(len(short)))),
+                    (np.concatenate((rows, short)), features)),
+                   shape=(len(strings), len(groups)))
+
+    if normalize_before:
+        feature_map.normalize_rows(F, groups=groups)
     if normalize:
-        values /= [np.sqrt(norms[i] * norms[j]) for i, j in
-                   combinations(range(n_samples), 2)]
-        norms = 1
+        feature_map.normalize_rows(F)
+    F_x = F[:len(X)]
+    F_y = F_x if same_x else F[len(X):]
+    return F_x.dot(F_y.T).toarray()
+
+
+BACKENDS = (None, 'cpp', 'explicit', 'auto')
+
+
+def _check_backend(backend, aa_model=None, normalize_before=False,
+                   algorithm='dense', hard_matching=True, max_gap=None):
+    if max_gap is not None and max_gap < 0:
+        raise ValueError("max_gap must be None or >= 0, got %r" % (max_gap,))
+    _check_matching(hard_matching, aa_model)
+    if backend not in BACKENDS:
+        raise ValueError("backend must be one of %s, got %r" % (
+            ', '.join(map(repr, BACKENDS)), backend))
+    if backend == 'cpp' and (normalize_before or algorithm != 'dense'):
+        raise ValueError("The 'cpp' backend does not support "
+                         "normalize_before and algorithm='sparse'")
+    if backend == 'explicit' and (aa_model is not None or
+                                  not hard_matching):
+        raise ValueError("The 'explicit' backend requires hard matching")
+
+
+def _auto_backend(X, X_train_, same_x, min_kn=1, max_kn=2,
+                  hard_matching=True, aa_model=None, normalize_before=False,
+                  algorithm='dense', n_jobs=1, max_gap=None,
+                  norms_x=None, norms_train=None):
+    """The backend with the lowest estimated time (see core.cost_model),
+    among the ones supporting the parameters; the engines do not compute
+    the norms given."""
+    from string_kernel.core import cost_model
+    constants = cost_model.load()
+    store_y = as_store(X_train_)
+    store_x = store_y if same_x else as_store(X, store_y.alphabet)
+    # all the candidates give the same kernel: the C++ extension compares
+    # the symbols byte for byte and scores them with aa_model, as the
+    # engines do (see _cpp_sumstringkernel)
+    candidates = [None]
+    if not normalize_before and algorithm == 'dense' and 'cpp' in constants:
+        candidates.append('cpp')
+    n_symbols = len(np.union1d(store_x.data, store_y.data))
+    if (hard_matching and aa_model is None and
+            max_kn * np.log2(n_symbols + 1) < 63):
+        candidates.append('explicit')
+    return cost_model.choose(
+        candidates, constants, store_x.lengths,
+        None if same_x else store_y.lengths, min_kn=min_kn, max_kn=max_kn,
+        max_gap=max_gap, n_symbols=n_symbols, hard_matching=hard_matching,
+        n_jobs=n_jobs, norms_x=norms_x is None,
+        norms_y=norms_train is None)
+
+
+def _deduplicated_kernel(compute, X, X_train_, deduplicate=True,
+                        alphabet=None, norms_train=None, out=None,
+                        lazy=False, stats=None, norms_x=None):
+    """Compute a kernel on the distinct sequences, then expand it.
 
-    kernel[iu1] = kernel[il1] = values.ravel()
-    kernel.flat[::n_samples + 1] = norms
+    compute(X, X_train_, same_x, norms_train, norms_x, out) computes the
+    kernel into out (see _output_array) and returns it with the norms of
+    the samples (of X, then of X_train_ if not same_x), or None.
+    If out is given and the kernel has to be expanded, the kernel between
+    the distinct sequences goes to a temporary file, unless lazy: then
+    out receives the kernel between the distinct sequences.
+    The time of the expansion is recorded in stats, if given.
 
+    Returns
+    -------
+    kernel : array or IndexedKernel
+    norms : array or None
+        The norms of the samples.
+    """
+    if stats is None:
+        stats = KernelStats()
+    inverse_x = inverse_y = None
+    if deduplicate:
+        X, X_train_, inverse_x, inverse_y, norms_train, norms_x = \
+            _deduplicate(X, X_train_, alphabet=alphabet,
+                         norms_train=norms_train, norms_x=norms_x)
+    same_x = _same_sequences(X, X_train_)
+    shape = (len(X) if inverse_x is None else len(inverse_x),
+             len(X_train_) if inverse_y is None else len(inverse_y))
+    expanded = shape != (len(X), len(X_train_))
+
+    temp_folder, target = None, out
+    if expanded and out is not None and not lazy:
+        temp_folder = tempfile.mkdtemp(prefix='string_kernel_')
+        target = os.path.join(temp_folder, 'unique.npy')
+    try:
+        kernel, norms = compute(X, X_train_, same_x, norms_train, norms_x,
+                                target)
+        with stats.stage('expand'):
+            if expanded and not lazy and out is not None:
+                kernel = indexed.expand(kernel, inverse_x, inverse_y,
+                                        out=_output_array(out, shape))
+            else:
+                kernel = indexed.expand(kernel, inverse_x, inverse_y,
+                                        lazy=lazy)
+    finally:
+        if temp_folder is not None:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+    if norms is not None and expanded:
+        if same_x:
+            norms = norms[inverse_y]
+        else:
+            norms_x, norms_y = norms[:len(X)], norms[len(X):]
+            norms = np.concatenate((
+                norms_x if inverse_x is None else norms_x[inverse_x],
+                norms_y if inverse_y is None else norms_y[inverse_y]))
+    return kernel, norms
+
+
+def stringkernel(X, X_train_, kn=1, lamda=.5,
+                 hard_matching=True, normalize=True,
+                 aa_model=None, return_norms=False, n_jobs=1, tile_size=None,
+                 alphabet=None, algorithm='dense', norms_train=None,
+                 deduplicate=True, lazy=False, out=None, max_gap=None,
+                 norms_x=None):
+    # norms_train, if given, are the norms of X_train_, shape (n_train, 1),
+    # and norms_x the ones of X (used only if X is not X_train_).
+    # If deduplicate, the kernel is computed between the distinct sequences
+    # and then expanded, or wrapped in an IndexedKernel if lazy.
+    # out is None, the name of a .npy file or an array (see _output_array).
+    _check_matching(hard_matching, aa_model)
+
+    def compute(X, X_train_, same_x, norms_train, norms_x, out):
+        params = dict(
+            kn=kn, lamda=lamda, hard_matching=hard_matching,
+            normalize=normalize, aa_model=aa_model, return_norms=True,
+            n_jobs=n_jobs, tile_size=tile_size, alphabet=alphabet,
+            algorithm=algorithm, out=out, max_gap=max_gap)
+        if same_x:
+            return _stringkernel_symmetric(X_train_, norms=norms_train,
+                                           **params)
+        return _stringkernel_unsymmetric(X, X_train_, norms_train=norms_train,
+                                         norms_x=norms_x, **params)
+
+    kernel, norms = _deduplicated_kernel(
+        compute, X, X_train_, deduplicate=deduplicate, alphabet=alphabet,
+        norms_train=norms_train, out=out, lazy=lazy, norms_x=norms_x)
     if return_norms:
-        if normalize:
-            norms = np.array(kernel.flat[::n_samples + 1])
         return kernel, norms
     return kernel
 
 
-def stringkernel(X, X_train_, kn=1, lamda=.5,
-                 hard_matching=True, normalize=True,
-                 aa_model=None, return_norms=False, n_jobs=1):
-    if len(X) == len(X_train_) and np.all(X == X_train_):
-        return _stringkernel_symmetric(
-            X, kn=kn, lamda=lamda, hard_matching=hard_matching,
-            normalize=normalize, aa_model=aa_model, return_norms=return_norms,
-            n_jobs=n_jobs)
+def _extend_gram(gram, cross, block):
+    """Kernel of the training sequences after adding new ones.
+
+    gram is the kernel between the old sequences, cross the one between the
+    new and the old sequences and block the one between the new sequences.
+    """
+    n_old, n_new = gram.shape[0], block.shape[0]
+    result = np.empty((n_old + n_new, n_old + n_new), dtype=gram.dtype)
+    result[:n_old, :n_old] = gram
+    result[n_old:, :n_old] = cross
+    result[:n_old, n_old:] = cross.T
+    result[n_old:, n_old:] = block
+    return result
+
+
+class _IncrementalMixin(object):
+    """Incremental training set, for the string kernel estimators.
 
-    return _stringkernel_unsymmetric(
-        X, X_train_, kn=kn, lamda=lamda, hard_matching=hard_matching,
-        normalize=normalize, aa_model=aa_model, return_norms=return_norms,
-        n_jobs=n_jobs)
+    The unnormalised kernel between the training sequences is kept in
+    `gram_`; adding sequences with partial_fit computes only the new rows
+    (and columns), O(n_new * n_train) kernel evaluations instead of
+    O(n_train ** 2). Estimators implement _train_norms(store) and
+    _kernel(X, X_train_, normalize, norms_train, out=None, norms_x=None).
+    """
+
+    def _gram(self):
+        if getattr(self, 'gram_', None) is None:
+            self.gram_ = np.asarray(self._kernel(
+                self.train_store_, self.train_store_, normalize=False,
+                norms_train=self.norms_train_))
+        return self.gram_
+
+    def partial_fit(self, X, y=None):
+        """Add X to the training sequences."""
+        X = np.ravel(X)
+        if not hasattr(self, 'train_store_'):
+            self.fit(X)
+            self._gram()
+            return self
+        gram = self._gram()
+        store = SequenceStore(X, alphabet=self.alphabet)
+        norms = self._train_norms(store)
+        cross = self._kernel(store, self.train_store_, normalize=False,
+                             norms_train=self.norms_train_, norms_x=norms)
+        block = self._kernel(store, store, normalize=False, norms_train=norms)
+        self.gram_ = _extend_gram(gram, np.asarray(cross), np.asarray(block))
+        self.X_train_ = np.concatenate((np.ravel(self.X_train_), X))
+        self.train_store_ = self.train_store_.concatenate(store)
+        if norms is not None:
+            self.norms_train_ = np.vstack((self.norms_train_, norms))
+        return self
 
+    def training_kernel(self):
+        """Kernel between the training sequences, from `gram_`.
 
-class StringKernel(BaseEstimator, TransformerMixin):
+        The same of fit_transform on all the training sequences, without
+        computing it again after partial_fit.
+        """
+        kernel = self._gram().copy()
+        if self.normalize:
+            _normalize(kernel, kernel.diagonal().copy())
+        return kernel
+
+
+class StringKernel(_IncrementalMixin, BaseEstimator, TransformerMixin):
     """Utility class for string kernel."""
 
     def __init__(self, kn=1, lamda=.5, check_min_length=0,
                  hard_matching=1, normalize=True,
-                 aa_model=None, return_norms=False, n_jobs=1):
+                 aa_model=None, return_norms=False, n_jobs=1, tile_size=None,
+                 alphabet=None, algorithm='dense', deduplicate=True,
+                 out=None, max_gap=None):
         super(StringKernel, self).__init__()
         self.kn = kn
         self.lamda = lamda
@@ -180,104 +1042,482 @@ class StringKernel(BaseEstimator, TransformerMixin):
         self.normalize = normalize
         self.return_norms = return_norms
         self.n_jobs = n_jobs
+        self.tile_size = tile_size
+        self.alphabet = alphabet
+        self.algorithm = algorithm
+        self.deduplicate = deduplicate
+        self.out = out
+        self.max_gap = max_gap
 
     def fit(self, X, y=None, **fit_params):
-        """String kernel of a single subsequence length."""
+        """String kernel of a single subsequence length.
+
+        The norms of the training sequences are computed here, once, and
+        stored in `norms_train_`, shape (n_train, 1).
+        """
         self.X_train_ = X
+        self.train_store_ = SequenceStore(X, alphabet=self.alphabet)
+        self.norms_train_ = self._train_norms(self.train_store_)
+        self.gram_ = None
         return self
 
-    def transform(self, X):
-        kernel = stringkernel(
-            X, self.X_train_, kn=self.kn,
+    def _train_norms(self, store):
+        unique, _, inverse = store.unique()
+        return _norms(
+            unique, n_jobs=self.n_jobs, min_kn=self.kn,
+            max_kn=self.kn, lamda=self.lamda,
+            hard_matching=self.hard_matching, aa_model=self.aa_model,
+            algorithm=self.algorithm, max_gap=self.max_gap)[inverse]
+
+    def _kernel(self, X, X_train_, normalize, norms_train, out=None,
+                return_norms=False, norms_x=None):
+        return stringkernel(
+            X, X_train_, kn=self.kn,
             lamda=self.lamda, aa_model=self.aa_model,
-            hard_matching=self.hard_matching, normalize=self.normalize,
-            return_norms=self.return_norms, n_jobs=self.n_jobs)
+            hard_matching=self.hard_matching, normalize=normalize,
+            return_norms=return_norms, n_jobs=self.n_jobs,
+            tile_size=self.tile_size, alphabet=self.alphabet,
+            algorithm=self.algorithm, norms_train=norms_train,
+            deduplicate=self.deduplicate, out=out, max_gap=self.max_gap,
+            norms_x=norms_x)
+
+    def transform(self, X):
+        """Kernel between X and the training sequences.
+
+        If `out` is the name of a .npy file, the kernel is written there and
+        returned memory-mapped.
+        """
+        kernel = self._kernel(X, self.train_store_, normalize=self.normalize,
+                              norms_train=self.norms_train_, out=self.out,
+                              return_norms=self.return_norms)
         if self.return_norms:
             kernel, self.norms_ = kernel
         return kernel
 
 
-def _worker_string_kernel(X, X_train, kn, lamda=.5, check_min_length=0,
-                          hard_matching=True, aa_model=None,
-                          normalize=False, return_norms=False, n_jobs=1):
-    single_kernel = StringKernel(
-        kn=kn, lamda=lamda,
-        check_min_length=check_min_length,
-        hard_matching=hard_matching, aa_model=aa_model,
-        normalize=normalize, return_norms=return_norms,
-        n_jobs=n_jobs).fit(X_train)
-    kernel = single_kernel.transform(X)
-    if return_norms:
-        return kernel, single_kernel.norms_
-    return kernel
-
-
 def sumstringkernel(X, X_train_, min_kn=1, max_kn=2, lamda=.5, n_jobs=-1,
                     check_min_length=0, hard_matching=True, normalize=True,
                     normalize_before=False, aa_model=None, verbose=0,
-                    n_jobs_single=1):
-    same_x = len(X) == len(X_train_) and np.all(X == X_train_)
-    x_len = len(X)
-    y_len = len(X_train_)
-
-    return_norms = normalize and not same_x
-
-    # special case
-    if n_jobs == 1:
-        kernel = np.zeros((x_len, y_len))
-        norms = np.zeros(x_len if same_x else x_len + y_len)
-        for kn in range(min_kn, max_kn + 1):
-            single_kernel = _worker_string_kernel(
-                X, X_train_, kn, lamda=lamda,
-                check_min_length=check_min_length,
-                hard_matching=hard_matching, aa_model=aa_model,
-                normalize=normalize_before,
-                return_norms=return_norms, n_jobs=n_jobs_single)
-            if return_norms:
-                single_kernel, single_norms = single_kernel
-                norms += single_norms
-            kernel += single_kernel
-    else:
-        kernel = jl.Parallel(n_jobs=n_jobs)(jl.delayed(_worker_string_kernel)(
-            X=X, X_train=X_train_, kn=kn, lamda=lamda,
-            check_min_length=check_min_length,
-            hard_matching=hard_matching, aa_model=aa_model,
-            normalize=normalize_before,
-            return_norms=return_norms, n_jobs=n_jobs_single) for kn in range(
-                min_kn, max_kn + 1))
-
-        if return_norms:
-            kernel, norms = zip(*kernel)
-            norms = reduce(lambda x, y: sum((x, y)), norms)
-        kernel = reduce(lambda x, y: sum((x, y)), kernel)
+                    n_jobs_single=1, tile_size=None, alphabet=None,
+                    algorithm='dense', norms_train=None, deduplicate=True,
+                    lazy=False, out=None, backend=None, stats=None,
+                    max_gap=None, norms_x=None):
+    # n_jobs_single is not used anymore, since all the lengths are computed
+    # in a single pass for each pair; it is kept for backward compatibility.
+    # norms_train, if given, are the norms of X_train_ for each length,
+    # shape (n_train, max_kn - min_kn + 1), and norms_x the ones of X (used
+    # only if X is not X_train_).
+    # If deduplicate, the kernel is computed between the distinct sequences
+    # and then expanded, or wrapped in an IndexedKernel if lazy.
+    # out is None, the name of a .npy file or an array (see _output_array).
+    # backend='cpp' uses the C++ extension (norms_train is not used).
+    # aa_model is a substitution matrix in any of the forms accepted by
+    # substitution.as_canonical (the flat 26 x 26 models over A-Z included).
+    # The timings and the counters of each stage are recorded in stats, a
+    # KernelStats (see core.stats), which also reports the progress.
+    # backend='explicit' uses the explicit feature map, and backend='auto'
+    # the backend with the lowest estimated cost (see core.cost_model).
+    # With max_gap, at most max_gap symbols are skipped between consecutive
+    # symbols of a subsequence: the kernel of the explicit feature map with
+    # limit = max_gap + 2, computed by the banded dynamic programming.
+    if stats is None:
+        stats = KernelStats()
+    _check_backend(backend, aa_model=aa_model,
+                   normalize_before=normalize_before, algorithm=algorithm,
+                   hard_matching=hard_matching, max_gap=max_gap)
+    params = dict(min_kn=min_kn, max_kn=max_kn, lamda=lamda,
+                  hard_matching=hard_matching, aa_model=aa_model,
+                  normalize_before=normalize_before, n_jobs=n_jobs,
+                  tile_size=tile_size, alphabet=alphabet, algorithm=algorithm,
+                  max_gap=max_gap)
 
-    if normalize:
+    def compute(X, X_train_, same_x, norms_train, norms_x, out):
+        chosen = backend
+        if backend == 'auto':
+            chosen = _auto_backend(
+                X, X_train_, same_x, min_kn=min_kn, max_kn=max_kn,
+                hard_matching=hard_matching, aa_model=aa_model,
+                normalize_before=normalize_before, algorithm=algorithm,
+                n_jobs=n_jobs, max_gap=max_gap, norms_x=norms_x,
+                norms_train=norms_train)
+        stats.backend = chosen
+        if chosen == 'explicit':
+            with stats.stage('explicit'):
+                kernel = _explicit_sumstringkernel(
+                    X, X_train_, same_x, min_kn=min_kn, max_kn=max_kn,
+                    lamda=lamda, normalize=normalize,
+                    normalize_before=normalize_before,
+                    limit=None if max_gap is None else max_gap + 2)
+            if out is not None:
+                out = _output_array(out, kernel.shape)
+                out[...] = kernel
+                kernel = out
+            return kernel, None
+        if chosen == 'cpp':
+            lengths_x = np.array([len(x) for x in X])
+            lengths_y = np.array([len(x) for x in X_train_])
+            stats.count_norms(lengths_x, max_kn)
+            if not same_x:
+                stats.count_norms(lengths_y, max_kn)
+            stats.count(lengths_x, lengths_y, max_kn, triangle=same_x)
+            with stats.stage('native'):
+                kernel = _cpp_sumstringkernel(
+                    X, X_train_, same_x, min_kn=min_kn, max_kn=max_kn,
+                    lamda=lamda, hard_matching=hard_matching,
+                    aa_model=aa_model, normalize=normalize, n_jobs=n_jobs,
+                    max_gap=max_gap)
+            if out is not None:
+                out = _output_array(out, kernel.shape)
+                out[...] = kernel
+                kernel = out
+            return kernel, None
         if same_x:
-            iu1 = np.triu_indices(x_len, 1)
-            il1 = iu1[::-1]
-            diagonal = kernel.flat[::x_len + 1]
-            kernel[iu1] /= [np.sqrt(diagonal[i] * diagonal[j]) for i, j in
-                            combinations(range(x_len), 2)]
-            kernel[il1] = kernel[iu1]
-            kernel.flat[::x_len + 1] = 1
-
+            kernel = _sumstringkernel_symmetric(
+                X_train_, norms=norms_train, out=out, stats=stats, **params)
+            if normalize:
+                with stats.stage('normalize'):
+                    _normalize(kernel, np.array(kernel.flat[::len(X) + 1]))
         else:
-            x_grid, y_grid = np.meshgrid(norms[x_len:], norms[:x_len])
-            kernel /= np.sqrt(x_grid * y_grid)
+            kernel, norms = _sumstringkernel_unsymmetric(
+                X, X_train_, norms_train=norms_train, norms_x=norms_x,
+                out=out, stats=stats, **params)
+            if normalize:
+                with stats.stage('normalize'):
+                    _normalize(kernel, norms[:len(X)], norms[len(X):])
+        return kernel, None
 
+    kernel, _ = _deduplicated_kernel(
+        compute, X, X_train_, deduplicate=deduplicate, alphabet=alphabet,
+        norms_train=norms_train, out=out, lazy=lazy, stats=stats,
+        norms_x=norms_x)
     if verbose:
-        print("SumStringKernel: kernel computed")
+        print("SumStringKernel: kernel computed, %r" % (stats,))
 
     return kernel
 
 
-class SumStringKernel(BaseEstimator, TransformerMixin):
+def sumstringkernel_condensed(X, min_kn=1, max_kn=2, lamda=.5, n_jobs=-1,
+                              hard_matching=True, normalize=True,
+                              normalize_before=False, aa_model=None,
+                              tile_size=None, alphabet=None,
+                              algorithm='dense', deduplicate=True,
+                              distance=False, dtype=np.float64, out=None,
+                              stats=None, max_gap=None):
+    """Symmetric kernel of X, as its condensed upper triangle.
+
+    Only the entries (i, j), i < j, are computed and stored, in the layout
+    of scipy.spatial.distance.squareform (see core.condensed): half the
+    memory of the square kernel, a quarter with dtype float32.
+    Parameters are the ones of sumstringkernel.
+
+    Parameters
+    ----------
+    distance : bool, optional
+        Return the distance in the feature space of the kernel,
+        sqrt(2 - 2 k(i, j)) if normalize, instead of the kernel. The result
+        can be given directly to scipy.cluster.hierarchy.linkage.
+    dtype : float32 or float64, optional
+        Type of the result.
+    out : str or array, optional
+        The name of a .npy file to create, memory-mapped, or an array of
+        shape (n * (n - 1) / 2,) where to write the result.
+    stats : KernelStats, optional
+        Where to record the timings and the counters (see core.stats).
+
+    Returns
+    -------
+    values : array, shape (n * (n - 1) / 2,)
+        The value of (X[i], X[j]) is at position condensed.index(i, j, n).
+    """
+    if stats is None:
+        stats = KernelStats()
+    store = as_store(X, alphabet)
+    inverse = None
+    if deduplicate:
+        unique, _, inverse = store.unique()
+        if unique is store:
+            inverse = None
+        store = unique
+    n_samples = len(store) if inverse is None else len(inverse)
+
+    temp_folder, target = None, out
+    if inverse is not None and out is not None:
+        # the kernel between the distinct sequences goes to a temporary file
+        temp_folder = tempfile.mkdtemp(prefix='string_kernel_')
+        target = os.path.join(temp_folder, 'unique.npy')
+    try:
+        values = _output_array(target, (condensed.size(len(store)),),
+                               dtype=dtype)
+        _share(n_jobs, store)
+        params = dict(min_kn=min_kn, max_kn=max_kn, lamda=lamda,
+                      hard_matching=hard_matching, algorithm=algorithm,
+                      max_gap=max_gap,
+                      table=_aa_model_table(aa_model, store, hard_matching))
+        norms = _norms(store, n_jobs=n_jobs, stats=stats, **params)
+        if normalize_before:
+            params.update(norms_x=norms, norms_y=norms)
+            norms = np.ones_like(norms)
+        diagonal = norms.sum(axis=1)
+
+        tiles = scheduler.make_tiles(store.lengths, tile_size=tile_size)
+        _count_tiles(stats, tiles, store.lengths, store.lengths, max_kn,
+                     symmetric=True)
+        function = partial(_tile_condensed, store=store, **params)
+        with stats.stage('pairs'):
+            _compute_tiles(function, tiles, values, n_jobs=n_jobs,
+                           stats=stats)
+        if normalize:
+            with stats.stage('normalize'):
+                condensed.normalize(values, diagonal)
+            diagonal = np.ones_like(diagonal)
+
+        if inverse is not None:
+            with stats.stage('expand'):
+                values = condensed.expand(
+                    values, diagonal, inverse, out=_output_array(
+                        out, (condensed.size(n_samples),), dtype=dtype))
+            diagonal = diagonal[inverse]
+    finally:
+        if temp_folder is not None:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+    if distance:
+        with stats.stage('normalize'):
+            condensed.to_distance(values, None if normalize else diagonal)
+    return values
+
+
+def sumstringkernel_blocks(X, X_train_, block_size=1024, min_kn=1,
+                           max_kn=2, lamda=.5, n_jobs=-1, hard_matching=True,
+                           normalize=True, normalize_before=False,
+                           aa_model=None, tile_size=None, alphabet=None,
+                           algorithm='dense', norms_train=None,
+                           deduplicate=True, max_gap=None):
+    """Kernel between X and X_train_, one block of rows at a time.
+
+    The norms of X_train_ are computed once, then each block of rows of X
+    is computed against the whole X_train_, so that only a block of
+    block_size x len(X_train_) is in memory at any time. For the kernel of
+    a single length use min_kn = max_kn.
+
+    Yields
+    ------
+    rows : slice
+        The rows of the kernel in the block.
+    block : array, shape (rows.stop - rows.start, len(X_train_))
+        The kernel between X[rows] and X_train_.
+    """
+    store_y = as_store(X_train_, alphabet)
+    store_x = as_store(X, store_y.alphabet)
+    params = dict(min_kn=min_kn, max_kn=max_kn, lamda=lamda,
+                  hard_matching=hard_matching, aa_model=aa_model,
+                  algorithm=algorithm, max_gap=max_gap)
+    if norms_train is None:
+        unique, _, inverse = store_y.unique()
+        norms_train = _norms(unique, n_jobs=n_jobs, **params)[inverse]
+
+    for start in range(0, len(store_x), block_size):
+        rows = slice(start, min(start + block_size, len(store_x)))
+        block = sumstringkernel(
+            store_x.take(np.arange(rows.start, rows.stop)), store_y,
+            n_jobs=n_jobs, normalize=normalize,
+            normalize_before=normalize_before, tile_size=tile_size,
+            norms_train=norms_train, deduplicate=deduplicate, **params)
+        yield rows, block
+
+
+def _column_tile(rows, cols, store, diagonal=None, **kwargs):
+    """Tile (rows, cols) of the symmetric kernel of store, normalised with
+    diagonal if given (see _tile_values)."""
+    i, j, values = _tile_values(rows, cols, store_x=store, store_y=store,
+                                symmetric=True, **kwargs)
+    if diagonal is not None:
+        values /= np.sqrt(diagonal[i] * diagonal[j])
+    return i, j, values
+
+
+def _accumulate_tile(out, weight, rows, cols, i, j, values, diagonal,
+                     samples, bounds, inverse):
+    """Add weight times a tile of the kernel between distinct sequences to
+    the entries of all their samples in out.
+
+    samples are sorted by distinct sequence, the ones of the k-th being
+    samples[bounds[k]:bounds[k + 1]], and inverse[s] is the distinct
+    sequence of the sample s. On the diagonal, only the upper triangle of
+    the tile is given (see _tile_values), and diagonal is its diagonal.
+    """
+    tile = np.zeros((rows.stop - rows.start, cols.stop - cols.start))
+    tile[i - rows.start, j - cols.start] = values
+    if rows == cols:
+        tile[j - cols.start, i - rows.start] = values
+        tile.flat[::tile.shape[0] + 1] = diagonal[rows]
+    samples_x = samples[bounds[rows.start]:bounds[rows.stop]]
+    samples_y = samples[bounds[cols.start]:bounds[cols.stop]]
+    block = weight * tile[np.ix_(inverse[samples_x] - rows.start,
+                                 inverse[samples_y] - cols.start)]
+    out[np.ix_(samples_x, samples_y)] += block
+    if rows != cols:
+        out[np.ix_(samples_y, samples_x)] += block.T
+
+
+def sumstringkernel_columns(data, columns=None, combine=False, weights=None,
+                            min_kn=1, max_kn=2, lamda=.5, n_jobs=-1,
+                            hard_matching=True, normalize=True,
+                            normalize_before=False, aa_model=None,
+                            tile_size=None, alphabet=None,
+                            algorithm='dense', deduplicate=True,
+                            max_gap=None, dtype=np.float64, out=None,
+                            stats=None):
+    """Symmetric kernels of several columns of sequences, in one pass.
+
+    Each column (e.g. the CDR loops LCDR1 ... HCDR3 of io_utils.pdb_to_df)
+    is encoded and deduplicated on its own, then the tiles of all the
+    columns are computed by a single pool of workers (threads with the
+    compiled engine, processes otherwise), the most expensive first, and
+    each tile is added to the kernel of all its samples as soon as its
+    batch is completed. Parameters not listed are the ones of
+    sumstringkernel.
+
+    Parameters
+    ----------
+    data : DataFrame or dict
+        The sequences of each column, the same number for all the columns.
+    columns : list, optional
+        The columns to use, all of them by default.
+    combine : bool, optional
+        Return only the combined kernel, sum_c weights[c] * K_c, where K_c
+        is the kernel of the column c. It is accumulated in place in a
+        single n_samples x n_samples array, and the kernels of the columns
+        are never stored.
+    weights : dict or sequence, optional
+        With combine, the weight of each column, by name or in the order of
+        columns; 1 / n_columns for all the columns by default.
+    dtype : float32 or float64, optional
+        Type of the kernels.
+    out : str or array, optional
+        With combine, the name of a .npy file to create, memory-mapped, or
+        an array of shape (n_samples, n_samples) where to accumulate the
+        combined kernel.
+    stats : KernelStats, optional
+        Where to record the timings and the counters (see core.stats).
+
+    Returns
+    -------
+    kernels : OrderedDict or array
+        The kernel of each column, shape (n_samples, n_samples), by column;
+        with combine, the combined kernel.
+    """
+    if stats is None:
+        stats = KernelStats()
+    columns = list(data.keys() if columns is None else columns)
+    if not columns:
+        raise ValueError("At least one column is required")
+    if combine:
+        if weights is None:
+            weights = np.ones(len(columns)) / len(columns)
+        elif hasattr(weights, 'keys'):
+            weights = [weights[column] for column in columns]
+        weights = np.asarray(weights, dtype=float)
+        if weights.shape != (len(columns),):
+            raise ValueError("weights has shape %s, expected one value for "
+                             "each of the %d columns"
+                             % (weights.shape, len(columns)))
+    elif weights is not None or out is not None:
+        raise ValueError("weights and out require combine=True")
+    params = dict(min_kn=min_kn, max_kn=max_kn, lamda=lamda,
+                  hard_matching=hard_matching, algorithm=algorithm,
+                  max_gap=max_gap)
+
+    functions, expansions, tiles, costs = [], [], [], []
+    n_samples = None
+    for c, column in enumerate(columns):
+        store = as_store(data[column], alphabet)
+        if n_samples is None:
+            n_samples = len(store)
+        elif len(store) != n_samples:
+            raise ValueError("Column %r has %d sequences, expected %d"
+                             % (column, len(store), n_samples))
+        inverse = np.arange(n_samples)
+        if deduplicate:
+            store, _, inverse = store.unique()
+        _share(n_jobs, store)
+        column_params = dict(
+            params, table=_aa_model_table(aa_model, store, hard_matching))
+        norms = _norms(store, n_jobs=n_jobs, stats=stats, **column_params)
+        if normalize_before:
+            column_params.update(norms_x=norms, norms_y=norms)
+            norms = np.ones_like(norms)
+        diagonal = norms.sum(axis=1)
+        functions.append(partial(
+            _column_tile, store=store,
+            diagonal=diagonal if normalize else None, **column_params))
+
+        samples = np.argsort(inverse, kind='mergesort')
+        bounds = np.searchsorted(inverse[samples], np.arange(len(store) + 1))
+        expansions.append((np.ones_like(diagonal) if normalize else diagonal,
+                           samples, bounds, inverse))
+
+        lengths = store.lengths
+        column_tiles = scheduler.make_tiles(lengths, tile_size=tile_size)
+        _count_tiles(stats, column_tiles, lengths, lengths, max_kn,
+                     symmetric=True)
+        for rows, cols in column_tiles:
+            tiles.append((c, rows, cols))
+            costs.append(scheduler.tile_cost(lengths, lengths, rows, cols,
+                                             symmetric=True))
+    # the most expensive tiles of all the columns first
+    tiles = [tiles[k] for k in np.argsort(costs, kind='mergesort')[::-1]]
+
+    shape = (n_samples, n_samples)
+    if combine:
+        kernel = _output_array(out, shape, dtype=dtype)
+        kernel[...] = 0
+        targets = [kernel] * len(columns)
+    else:
+        kernels = OrderedDict((column, np.zeros(shape, dtype=dtype))
+                              for column in columns)
+        targets = list(kernels.values())
+        weights = np.ones(len(columns))
+
+    def compute_batches(parallel, batch_size):
+        for start in range(0, len(tiles), batch_size):
+            batch = tiles[start:start + batch_size]
+            with stats.stage('pairs'):
+                if parallel is None:
+                    results = [functions[c](rows, cols)
+                               for c, rows, cols in batch]
+                else:
+                    results = parallel(jl.delayed(functions[c])(rows, cols)
+                                       for c, rows, cols in batch)
+            with stats.stage('expand'):
+                for (c, rows, cols), (i, j, values) in zip(batch, results):
+                    _accumulate_tile(targets[c], weights[c], rows, cols, i,
+                                     j, values, *expansions[c])
+            stats.tiles_completed(len(batch))
+
+    n_jobs = _effective_n_jobs(n_jobs)
+    if n_jobs == 1 or len(tiles) == 1:
+        compute_batches(None, 1)
+    else:
+        import joblib as jl
+        # one pool for all the columns; the compiled engine releases the
+        # GIL, so that threads can share the stores
+        with jl.Parallel(n_jobs=n_jobs, backend='threading'
+                         if sk_fast is not None else None) as parallel:
+            compute_batches(parallel, 4 * n_jobs)
+    return kernel if combine else kernels
+
+
+class SumStringKernel(_IncrementalMixin, BaseEstimator,
+                      TransformerMixin):
     """Utility class for string kernel."""
 
     def __init__(self, min_kn=1, max_kn=2, lamda=.5, n_jobs=-1,
                  check_min_length=0, hard_matching=True, normalize=True,
                  normalize_before=False, aa_model=None, shogun=False,
-                 verbose=0, n_jobs_single=1):
+                 verbose=0, n_jobs_single=1, tile_size=None, alphabet=None,
+                 algorithm='dense', deduplicate=True, out=None,
+                 backend=None, progress=None, max_gap=None):
         super(SumStringKernel, self).__init__()
         self.min_kn = min_kn
         self.max_kn = max_kn
@@ -291,18 +1531,78 @@ class SumStringKernel(BaseEstimator, TransformerMixin):
         self.aa_model = aa_model
         self.verbose = verbose
         self.n_jobs_single = n_jobs_single
+        self.tile_size = tile_size
+        self.alphabet = alphabet
+        self.algorithm = algorithm
+        self.deduplicate = deduplicate
+        self.out = out
+        self.backend = backend
+        self.progress = progress
+        self.max_gap = max_gap
 
     def pairwise(self, x1, x2):
         return self.fit_transform((x1, x2))[0, 1]
 
     def fit(self, X, y=None, **fit_params):
-        """Kernel is built as the sum of string kernels of different length."""
+        """Kernel is built as the sum of string kernels of different length.
+
+        The norms of the training sequences for each length are computed
+        here, once, and stored in `norms_train_`,
+        shape (n_train, max_kn - min_kn + 1) (None with the other backends
+        than the default one, which compute them in each call).
+        With backend='auto', the backend used by the last call is in
+        `stats_.backend`.
+
+        The time of each stage and the work done from here on are recorded
+        in `stats_`, a KernelStats (see core.stats), which reports the
+        completed tiles to `progress`; `timings_` are the seconds spent in
+        each stage.
+        """
+        self.stats_ = KernelStats(self.progress)
+        self.timings_ = self.stats_.timings
         self.X_train_ = X.ravel()
+        self.train_store_ = SequenceStore(self.X_train_, alphabet=self.alphabet)
+        self.norms_train_ = self._train_norms(self.train_store_)
+        self.gram_ = None
         return self
 
+    def _train_norms(self, store):
+        if self.backend is not None:
+            return None
+        unique, _, inverse = store.unique()
+        return _norms(
+            unique, n_jobs=self.n_jobs, min_kn=self.min_kn,
+            max_kn=self.max_kn, lamda=self.lamda,
+            hard_matching=self.hard_matching, aa_model=self.aa_model,
+            algorithm=self.algorithm, max_gap=self.max_gap,
+            stats=self.stats_)[inverse]
+
+    def _kernel(self, X, X_train_, normalize, norms_train, out=None,
+                norms_x=None):
+        return sumstringkernel(
+            X, X_train_, min_kn=self.min_kn,
+            max_kn=self.max_kn,
+            lamda=self.lamda, n_jobs=self.n_jobs,
+            check_min_length=self.check_min_length, aa_model=self.aa_model,
+            hard_matching=self.hard_matching, normalize=normalize,
+            normalize_before=self.normalize_before, verbose=self.verbose,
+            n_jobs_single=self.n_jobs_single, tile_size=self.tile_size,
+            alphabet=self.alphabet, algorithm=self.algorithm,
+            norms_train=norms_train, deduplicate=self.deduplicate,
+            out=out, backend=self.backend, stats=self.stats_,
+            max_gap=self.max_gap, norms_x=norms_x)
+
     def transform(self, X):
-        if self.shogun and __shogun__:
+        """Kernel between X and the training sequences.
+
+        If `out` is the name of a .npy file, the kernel is written there and
+        returned memory-mapped (not with shogun).
+        """
+        shogun = _import_shogun() if self.shogun else None
+        if shogun is not None:
             # use shogun!
+            (SubsequenceStringKernel, IdentityKernelNormalizer,
+             StringCharFeatures, RAWBYTE) = shogun
             if self.min_kn != 1:
                 raise ValueError("shogun only works with maximum length "
                                  "starting from 1")
@@ -314,11 +1614,7 @@ class SumStringKernel(BaseEstimator, TransformerMixin):
                 ssk.set_normalizer(IdentityKernelNormalizer())
             kernel = ssk.get_kernel_matrix()
         else:
-            kernel = sumstringkernel(
-                X.ravel(), self.X_train_, min_kn=self.min_kn, max_kn=self.max_kn,
-                lamda=self.lamda, n_jobs=self.n_jobs,
-                check_min_length=self.check_min_length, aa_model=self.aa_model,
-                hard_matching=self.hard_matching, normalize=self.normalize,
-                normalize_before=self.normalize_before, verbose=self.verbose,
-                n_jobs_single=self.n_jobs_single)
+            kernel = self._kernel(
+                X.ravel(), self.train_store_, normalize=self.normalize,
+                norms_train=self.norms_train_, out=self.out)
         return kernel
@@ -1,58 +1,480 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True
+"""Compiled engine for the string kernel.
+
+Sequences are integer encoded and concatenated in a single buffer `data`,
+so that the i-th sequence is data[offsets[i]:offsets[i + 1]]
+(see sequences.SequenceStore).
+The kernel of a whole list of pairs is computed with a single call, without
+the GIL and in parallel with OpenMP.
+"""
 import numpy as np
 
-def _core_stringkernel(x, y, kn, lamda, hard_matching, aa_model=None):
-    cdef size_t len_x = len(x)
-    cdef size_t len_y = len(y)
-    if len_x < kn or len_y < kn:
-        # do not compute kernel
-        return int(x == y)
-
-    cdef size_t x_dim = len_x + 1
-    cdef size_t y_dim = len_y + 1
-    # Allocate and initialise Kd
-    Kd = [np.ones(x_dim * y_dim), np.zeros(x_dim * y_dim)]
-    # Kd now contains two matrices, that are n+1 x m+1 (empty string included)
-    # Kd[0] is composed by 1s (follows the definition of K_0)
-    # Kd[1] is composed by 0s -> it starts to be filled
-
-    #  start with i = kn = 1, 2, 3 ...
-    for i in range(1, kn):
-        #   Set the Kd to zero for those lengths of s and t
-        #   where s (or t) has exactly length i-1 and t (or s)
-        #   has length >= i-1. L-shaped upside down matrix
-
-        for j in range(i - 1, len_x):
-            Kd[i % 2][j * y_dim + i - 1] = 0
-
-        for j in range(i - 1, len_y):
-            Kd[i % 2][(i - 1) * y_dim + j] = 0
-
-        for j in range(i, len_x):
-            # Kdd maintains the contribution of the left and diagonal terms
-            # that is, ONLY the contribution of the left (not influenced by the
-            # upper terms) and the eventual contibution of lambda^2 in case the
-            # chars are the same
-            Kdd = 0
+from cython.parallel cimport prange, threadid
+from libc.stdlib cimport calloc, free, realloc
+from libc.string cimport memcmp
+
+ctypedef unsigned char symbol_t
+
+
+cdef struct workspace_t:
+    # growable buffers of a thread, for the sparse dynamic programming
+    Py_ssize_t* ibuf
+    Py_ssize_t isize
+    double* dbuf
+    Py_ssize_t dsize
+
+
+cdef int _reserve(workspace_t* ws, Py_ssize_t isize,
+                  Py_ssize_t dsize) nogil:
+    # make room for isize integers and dsize doubles, -1 if out of memory
+    cdef void* buf
+    if isize > ws.isize:
+        buf = realloc(ws.ibuf, isize * sizeof(Py_ssize_t))
+        if buf == NULL:
+            return -1
+        ws.ibuf = <Py_ssize_t*> buf
+        ws.isize = isize
+    if dsize > ws.dsize:
+        buf = realloc(ws.dbuf, dsize * sizeof(double))
+        if buf == NULL:
+            return -1
+        ws.dbuf = <double*> buf
+        ws.dsize = dsize
+    return 0
+
+
+cdef void _core_sumstringkernel(
+        const symbol_t* x, Py_ssize_t len_x,
+        const symbol_t* y, Py_ssize_t len_y,
+        Py_ssize_t min_kn, Py_ssize_t max_kn, double lamda, bint hard_matching,
+        const double* aa_model, Py_ssize_t n_symbols,
+        double* Kd, double* values) nogil:
+    # Same row by row dynamic programming of sk._core_sumstringkernel.
+    # Kd is a scratch buffer of max_kn * min(len_x, len_y) doubles, plus
+    # max_kn for the partial sums and min(len_x, len_y) for the matching
+    # scores of a row.
+    cdef Py_ssize_t i, j, k, kn, top, len_, stride_x = n_symbols, stride_y = 1
+    cdef const symbol_t* tmp
+    cdef double Kdd, sum_
+    cdef double* row
+    cdef double* prev
+    cdef double* sums
+    cdef double* weights
+    cdef const double* scores
+    cdef bint same
+
+    if len_x < len_y:
+        # rows are as long as the shortest sequence
+        tmp = x
+        x = y
+        y = tmp
+        len_ = len_x
+        len_x = len_y
+        len_y = len_
+        stride_x, stride_y = 1, n_symbols
+
+    # lengths longer than a sequence are not computed
+    top = min(max_kn, len_y)
+    same = len_x == len_y and memcmp(x, y, len_x) == 0
+    for kn in range(max(top + 1, min_kn), max_kn + 1):
+        values[kn - min_kn] = same
 
+    # Kd[i * len_y:(i + 1) * len_y] is the current row of level i
+    sums = Kd + max_kn * len_y
+    weights = sums + max_kn
+    for k in range(len_y):
+        Kd[k] = 1
+    for k in range(len_y, (top if top > 1 else 1) * len_y):
+        Kd[k] = 0
+    for kn in range(max_kn):
+        sums[kn] = 0
+
+    for j in range(len_x):
+        i = min(j, top - 1)
+        while i > 0:
+            row = Kd + i * len_y
+            prev = row - len_y
+            Kdd = 0
             for k in range(i, len_y):
                 if x[j - 1] != y[k - 1]:
-                    # ((.))-1 is because indices start with 0 (not with 1)
-                    Kdd *= lamda
+                    Kdd = lamda * Kdd
+                else:
+                    Kdd = lamda * (Kdd + lamda * prev[k - 1])
+                row[k] = lamda * row[k] + Kdd
+            i = i - 1
+
+        # matching scores of x[j] with y, shared by all the lengths
+        if hard_matching:
+            for k in range(len_y):
+                weights[k] = x[j] == y[k]
+        else:
+            scores = aa_model + x[j] * stride_x
+            for k in range(len_y):
+                weights[k] = scores[y[k] * stride_y]
+
+        # Calculate K, row j, for the lengths whose table has this row
+        for kn in range(max(min_kn, 1), min(top, j + 1) + 1):
+            row = Kd + (kn - 1) * len_y
+            sum_ = 0
+            for k in range(kn - 1, len_y):
+                sum_ += weights[k] * row[k]
+            sums[kn - 1] += lamda * lamda * sum_
+
+    for kn in range(max(min_kn, 1), top + 1):
+        values[kn - min_kn] = sums[kn - 1]
+
+
+
+cdef int _sparse_sumstringkernel(
+        const symbol_t* x, Py_ssize_t len_x,
+        const symbol_t* y, Py_ssize_t len_y,
+        Py_ssize_t min_kn, Py_ssize_t max_kn, double lamda,
+        workspace_t* ws, double* values) nogil:
+    # Same match list dynamic programming of sk._core_sumstringkernel_sparse.
+    # Returns -1 if the workspace cannot be allocated.
+    cdef Py_ssize_t a, b, c, m, kn, node, top, n_matches
+    cdef Py_ssize_t start[257]
+    cdef Py_ssize_t fill[256]
+    cdef Py_ssize_t* by_symbol
+    cdef Py_ssize_t* row_start
+    cdef Py_ssize_t* cols
+    cdef double* P
+    cdef double* Q
+    cdef double* tmp
+    cdef double* tree
+    cdef double* powers
+    cdef double value, scale, sum_
+    cdef bint same
+
+    # lengths longer than a sequence are not computed, as in the dense DP
+    top = min(max_kn, min(len_x, len_y))
+    same = len_x == len_y and memcmp(x, y, len_x) == 0
+    for kn in range(max(top + 1, min_kn), max_kn + 1):
+        values[kn - min_kn] = same
+    if top == 0:
+        return 0
+
+    # columns of y sorted by symbol, start[c]:start[c + 1] for the symbol c
+    for c in range(257):
+        start[c] = 0
+    for b in range(len_y):
+        start[y[b] + 1] += 1
+    for c in range(256):
+        start[c + 1] += start[c]
+        fill[c] = start[c]
+    n_matches = 0
+    for a in range(len_x):
+        n_matches += start[x[a] + 1] - start[x[a]]
+
+    if _reserve(ws, len_y + len_x + 1 + n_matches,
+                2 * n_matches + 2 * (len_y + 1)) < 0:
+        return -1
+    by_symbol = ws.ibuf
+    row_start = by_symbol + len_y
+    cols = row_start + len_x + 1
+    P = ws.dbuf
+    Q = P + n_matches
+    tree = Q + n_matches
+    powers = tree + len_y + 1
+
+    for b in range(len_y):
+        by_symbol[fill[y[b]]] = b
+        fill[y[b]] += 1
+    # the matches of row a are cols[row_start[a]:row_start[a + 1]]
+    row_start[0] = 0
+    for a in range(len_x):
+        m = row_start[a]
+        for c in range(start[x[a]], start[x[a] + 1]):
+            cols[m] = by_symbol[c]
+            m = m + 1
+        row_start[a + 1] = m
+
+    # powers[d] is lamda ** d
+    powers[0] = 1
+    for b in range(1, len_y + 1):
+        powers[b] = lamda * powers[b - 1]
+    # P of level 1, lamda ** 2 * Kd[0], where Kd[0] is all 1s
+    for m in range(n_matches):
+        P[m] = lamda * lamda
+
+    for kn in range(1, top + 1):
+        if kn >= min_kn:
+            sum_ = 0
+            for m in range(n_matches):
+                sum_ += P[m]
+            values[kn - min_kn] = sum_
+        if kn == top:
+            break
+
+        for b in range(len_y + 1):
+            tree[b] = 0
+        scale = 1
+        for a in range(len_x):
+            # Kd[kn] at the matches of this row, from the previous rows
+            for m in range(row_start[a], row_start[a + 1]):
+                b = cols[m]
+                value = 0
+                node = b
+                while node > 0:
+                    value += tree[node] * powers[b - node]
+                    node = node & (node - 1)
+                Q[m] = lamda * lamda * value * scale
+
+            # one more row of decay for the previous matches
+            scale = scale * lamda
+            if scale < 1e-100:
+                for b in range(len_y + 1):
+                    tree[b] *= scale
+                scale = 1
+            for m in range(row_start[a], row_start[a + 1]):
+                b = cols[m]
+                value = P[m] / scale
+                node = b + 1
+                while node <= len_y:
+                    tree[node] += value * powers[node - 1 - b]
+                    node = node + (node & -node)
+        tmp = P
+        P = Q
+        Q = tmp
+    return 0
+
+
+cdef int _gapped_sumstringkernel(
+        const symbol_t* x, Py_ssize_t len_x,
+        const symbol_t* y, Py_ssize_t len_y,
+        Py_ssize_t min_kn, Py_ssize_t max_kn, double lamda,
+        Py_ssize_t max_gap, bint hard_matching,
+        const double* aa_model, Py_ssize_t n_symbols,
+        workspace_t* ws, double* values) nogil:
+    # Same banded recurrence of sk._core_sumstringkernel_gapped, visiting
+    # only the matches. C of level i keeps, for the last max_gap + 2 rows a,
+    # sum_d lamda ** d * M[i][a, b - d] (d = 1 .. max_gap + 1), scattered
+    # from the matches of the row; M[i + 1] at a match (a, b) gathers
+    # lamda ** e * C[a - e, b] from the previous max_gap + 1 rows. A row is
+    # cleared, before its slot is reused, from the matches that wrote it.
+    # Returns -1 if the workspace cannot be allocated.
+    cdef Py_ssize_t a, b, c, d, e, i, kn, m, top, width, n_slots, n_back
+    cdef Py_ssize_t stride_x = n_symbols, stride_y = 1
+    cdef Py_ssize_t start[257]
+    cdef Py_ssize_t fill[256]
+    cdef const symbol_t* tmp
+    cdef Py_ssize_t* by_symbol
+    cdef Py_ssize_t* back
+    cdef double* C
+    cdef double* row
+    cdef double* level
+    cdef double* powers
+    cdef double* sums
+    cdef double value, sum_, weight
+
+    if len_x < len_y:
+        # rows are as long as the shortest sequence
+        tmp = x
+        x = y
+        y = tmp
+        len_x, len_y = len_y, len_x
+        stride_x, stride_y = stride_y, stride_x
+
+    # lengths longer than a sequence are not computed, as in the dense DP
+    top = min(max_kn, len_y)
+    for kn in range(max(top + 1, min_kn), max_kn + 1):
+        values[kn - min_kn] = len_x == len_y and memcmp(x, y, len_x) == 0
+    if top == 0:
+        return 0
+
+    width = min(max_gap + 1, len_x)
+    n_slots = width + 1
+    if _reserve(ws, len_y + width + 1, (top - 1) * n_slots * len_y +
+                width + 1 + max_kn + 1) < 0:
+        return -1
+    by_symbol = ws.ibuf
+    back = by_symbol + len_y
+    C = ws.dbuf
+    powers = C + (top - 1) * n_slots * len_y
+    sums = powers + width + 1
+    for m in range((top - 1) * n_slots * len_y):
+        C[m] = 0
+    powers[0] = 1
+    for d in range(1, width + 1):
+        powers[d] = lamda * powers[d - 1]
+    for kn in range(max_kn + 1):
+        sums[kn] = 0
+
+    # columns of y sorted by symbol, start[c]:start[c + 1] for the symbol c
+    for c in range(257):
+        start[c] = 0
+    for b in range(len_y):
+        start[y[b] + 1] += 1
+    for c in range(256):
+        start[c + 1] += start[c]
+        fill[c] = start[c]
+    for b in range(len_y):
+        by_symbol[fill[y[b]]] = b
+        fill[y[b]] += 1
+
+    for a in range(len_x):
+        # the slot of row a held row a - n_slots, which is not needed
+        if a >= n_slots:
+            c = x[a - n_slots]
+            for m in range(start[c], start[c + 1]):
+                b = by_symbol[m]
+                for i in range(top - 1):
+                    row = C + (i * n_slots + a % n_slots) * len_y
+                    for d in range(1, min(width, len_y - 1 - b) + 1):
+                        row[b + d] = 0
+        # back[e], offset of the slot of row a - e within a level
+        n_back = min(width, a)
+        for e in range(1, n_back + 1):
+            back[e] = ((a - e) % n_slots) * len_y
+
+        c = x[a]
+        for i in range(1, min(top, a + 1) + 1):
+            row = C + ((i - 1) * n_slots + a % n_slots) * len_y
+            # the slots of the level i - 1
+            level = C + max(i - 2, 0) * n_slots * len_y
+            sum_ = 0
+            for m in range(start[c], start[c + 1]):
+                b = by_symbol[m]
+                if i == 1:
+                    value = lamda * lamda
                 else:
-                    Kdd = lamda * (Kdd + (lamda * Kd[(i + 1) % 2][(j - 1) * y_dim + k - 1]))
-                Kd[i % 2][j*y_dim+k] = lamda * Kd[i % 2][(j - 1) * y_dim + k] + Kdd
-
-    # Calculate K
-    cdef float sum_ = 0
-    for i in range(kn - 1, len_x):
-        for j in range(kn - 1, len_y):
-            # hard matching
+                    value = 0
+                    for e in range(1, n_back + 1):
+                        value += powers[e] * level[back[e] + b]
+                sum_ += value
+                if i < top:
+                    for d in range(1, min(width, len_y - 1 - b) + 1):
+                        row[b + d] += powers[d] * value
             if hard_matching:
-                if x[i] == y[j]:
-                    sum_ += lamda * lamda * Kd[(kn - 1) % 2][i*y_dim + j]
-            else:
-                # soft matching, regulated from models.h, amminoacidic model
-                sum_ += lamda * lamda * \
-                      aa_model[(ord(x[i])-65)*26 + ord(y[j])-65] * \
-                      Kd[(kn - 1) % 2][i*y_dim + j];
-    return sum_
+                sums[i] += sum_
+
+        if not hard_matching:
+            # the last symbol scored against all the columns
+            for kn in range(max(min_kn, 1), min(top, a + 1) + 1):
+                level = C + max(kn - 2, 0) * n_slots * len_y
+                sum_ = 0
+                for b in range(len_y):
+                    weight = aa_model[x[a] * stride_x + y[b] * stride_y]
+                    if weight == 0:
+                        continue
+                    if kn == 1:
+                        value = lamda * lamda
+                    else:
+                        value = 0
+                        for e in range(1, n_back + 1):
+                            value += powers[e] * level[back[e] + b]
+                    sum_ += weight * value
+                sums[kn] += sum_
+
+    for kn in range(max(min_kn, 1), top + 1):
+        values[kn - min_kn] = sums[kn]
+    return 0
+
+
+def sumstringkernel_pairs(const symbol_t[::1] data_x,
+                          const Py_ssize_t[::1] offsets_x,
+                          const symbol_t[::1] data_y,
+                          const Py_ssize_t[::1] offsets_y,
+                          const Py_ssize_t[::1] rows,
+                          const Py_ssize_t[::1] cols,
+                          Py_ssize_t min_kn, Py_ssize_t max_kn, double lamda,
+                          bint hard_matching, const double[:, ::1] aa_model,
+                          double[:, ::1] out, int num_threads=1,
+                          bint sparse=False, Py_ssize_t max_gap=-1):
+    """Kernel of all the lengths from min_kn to max_kn for a list of pairs.
+
+    Parameters
+    ----------
+    data_x, data_y : array of uint8
+        Encoded sequences, one after the other.
+    offsets_x, offsets_y : array of intp
+        Boundaries of the sequences in `data_x` and `data_y`.
+    rows, cols : array of intp, shape (n_pairs,)
+        The p-th pair is made by the sequences rows[p] of x and cols[p] of y.
+    aa_model : array, shape (n_symbols, n_symbols), or None
+        Substitution scores between encoded symbols (soft matching only,
+        None with hard matching).
+    out : array, shape (n_pairs, max_kn - min_kn + 1)
+        Output buffer, out[p, i] is the kernel of length min_kn + i
+        of the p-th pair.
+    num_threads : int, optional
+        Number of OpenMP threads.
+    sparse : bool, optional
+        Use the match list dynamic programming (hard matching only).
+    max_gap : int, optional
+        If not negative, at most max_gap symbols are skipped between two
+        consecutive symbols of a subsequence (the banded dynamic
+        programming, whatever sparse is).
+    """
+    cdef Py_ssize_t p, i, j, size
+    cdef Py_ssize_t n_pairs = rows.shape[0]
+    cdef const double* scores = NULL
+    cdef Py_ssize_t n_symbols = 0
+    cdef double[:, ::1] scratch
+    cdef double* Kd
+    cdef workspace_t* workspaces
+    cdef Py_ssize_t n_failed = 0
+    cdef int status
+
+    if n_pairs == 0:
+        return
+    if aa_model is not None:
+        n_symbols = aa_model.shape[1]
+        if n_symbols > 0:
+            scores = &aa_model[0, 0]
+    elif not hard_matching:
+        raise ValueError("Soft matching requires the substitution scores")
+    if sparse and not hard_matching:
+        raise ValueError("The sparse algorithm requires hard matching")
+    if sparse or max_gap >= 0:
+        workspaces = <workspace_t*> calloc(max(num_threads, 1),
+                                           sizeof(workspace_t))
+        if workspaces == NULL:
+            raise MemoryError()
+        try:
+            for p in prange(n_pairs, nogil=True, num_threads=num_threads,
+                            schedule='dynamic'):
+                i = rows[p]
+                j = cols[p]
+                if max_gap >= 0:
+                    status = _gapped_sumstringkernel(
+                        &data_x[0] + offsets_x[i],
+                        offsets_x[i + 1] - offsets_x[i],
+                        &data_y[0] + offsets_y[j],
+                        offsets_y[j + 1] - offsets_y[j],
+                        min_kn, max_kn, lamda, max_gap, hard_matching,
+                        scores, n_symbols,
+                        &workspaces[threadid()], &out[p, 0])
+                else:
+                    status = _sparse_sumstringkernel(
+                        &data_x[0] + offsets_x[i],
+                        offsets_x[i + 1] - offsets_x[i],
+                        &data_y[0] + offsets_y[j],
+                        offsets_y[j + 1] - offsets_y[j],
+                        min_kn, max_kn, lamda, &workspaces[threadid()],
+                        &out[p, 0])
+                if status < 0:
+                    n_failed += 1
+        finally:
+            for i in range(max(num_threads, 1)):
+                free(workspaces[i].ibuf)
+                free(workspaces[i].dbuf)
+            free(workspaces)
+        if n_failed:
+            raise MemoryError()
+        return
+    # one workspace for each thread, sized for the largest pair
+    size = (max_kn + 1) * (np.minimum(np.diff(offsets_x)[np.asarray(rows)],
+                                np.diff(offsets_y)[np.asarray(cols)]).max() + 1)
+    scratch = np.empty((max(num_threads, 1), size))
+
+    for p in prange(n_pairs, nogil=True, num_threads=num_threads,
+                    schedule='dynamic'):
+        i = rows[p]
+        j = cols[p]
+        Kd = &scratch[threadid(), 0]
+        _core_sumstringkernel(
+            &data_x[0] + offsets_x[i], offsets_x[i + 1] - offsets_x[i],
+            &data_y[0] + offsets_y[j], offsets_y[j + 1] - offsets_y[j],
+            min_kn, max_kn, lamda, hard_matching, scores, n_symbols,
+            Kd, &out[p, 0])
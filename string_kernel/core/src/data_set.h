@@ -62,8 +62,8 @@ struct DataElement {
 class DataSet {
 
  public:
-  DataSet(size_t max_length, int symbol_size):
-    _max_length(max_length), _symbol_size(symbol_size), _size(0), _elements(0)
+  explicit DataSet(int symbol_size):
+    _max_length(0), _symbol_size(symbol_size), _size(0), _elements(0)
     {}
 
   void load_strings(const std::vector<std::string> &strings) {
@@ -71,17 +71,18 @@ class DataSet {
     _elements = new DataElement[_size];
 
     for (size_t i = 0; i < _size; i++) {
-      assert(strings[i].length() < _max_length);
-
       size_t str_len = strings[i].length();
+      if (str_len > _max_length) {
+        _max_length = str_len;
+      }
       _elements[i].allocate(str_len);
 
       for (size_t j = 0; j < str_len; j++) {
         char temp = *(strings[i].substr(j, 1).c_str());
         assert(static_cast<int>(temp) < _symbol_size);
 
-        // work with uppercase letters
-        _elements[i].attributes[j] = static_cast<int>(toupper(temp));
+        // symbols are compared byte for byte, case included
+        _elements[i].attributes[j] = static_cast<int>(temp);
       }
     }
   }
@@ -98,6 +99,11 @@ class DataSet {
     return _size;
   }
 
+  /** Length of the longest string. */
+  size_t max_length() const {
+    return _max_length;
+  }
+
  private:
   size_t _max_length;
   int _symbol_size;
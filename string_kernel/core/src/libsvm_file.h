@@ -57,7 +57,7 @@ bool write_libsvm_kernel(const std::string &file_name,
     for (int i = 0; i < size; i++) {
       file << labels[i] << " 0:" << i << " ";
       for (int j = 0; j < size; j++)
-        file << j + 1 << ":" << kernel.values()[i][j] << " ";
+        file << j + 1 << ":" << kernel.values()[i * size + j] << " ";
 
       file << std::endl;
     }
@@ -81,7 +81,7 @@ bool write_kernel(const std::string &file_name,
     //   file << labels[i] << " 0:" << i << " ";
       file << labels[i] << "\t";
       for (int j = 0; j < size; j++)
-        file << kernel.values()[i][j] << "\t";
+        file << kernel.values()[i * size + j] << "\t";
 
       file << std::endl;
     }
@@ -97,18 +97,24 @@ bool write_kernel(const std::string &file_name,
                   const SumStringKernel<k_type> &kernel) {
   assert(labels.size() == kernel.size());
   size_t size = labels.size();
+  size_t n_cols = kernel.n_cols();  // columns are labelled by index if the
+                                    // kernel is not symmetric
 
   std::ofstream file;
   file.open(file_name.c_str());
   if (file.is_open()) {
-      for (size_t i = 0; i < size; i++) {
-          file << "," << labels[i];
+      for (size_t j = 0; j < n_cols; j++) {
+          if (n_cols == size) {
+              file << "," << labels[j];
+          } else {
+              file << "," << j;
+          }
       }
       file << std::endl;
       for (size_t i = 0; i < size; i++) {
           file << labels[i];
-          for (size_t j = 0; j < size; j++) {
-              file << "," << kernel.values()[i*size+j];
+          for (size_t j = 0; j < n_cols; j++) {
+              file << "," << kernel.values()[i*n_cols+j];
           }
           file << std::endl;
       }
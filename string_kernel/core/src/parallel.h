@@ -0,0 +1,47 @@
+/* author: Federico Tomasi
+ * license: FreeBSD License
+ * copyright: Copyright (C) 2016 Federico Tomasi
+ */
+#ifndef _PARALLEL_H_
+#define _PARALLEL_H_
+
+#include <atomic>
+#include <cstddef>
+#include <thread>
+#include <vector>
+
+/** Number of threads to use, -1 (or any value < 1) means all the cores. */
+inline int effective_n_threads(int n_threads) {
+    if (n_threads < 1) {
+        n_threads = static_cast<int>(std::thread::hardware_concurrency());
+    }
+    return n_threads < 1 ? 1 : n_threads;
+}
+
+/** Call worker(thread_id, counter) in n_threads threads, to process n items.
+ *  Each thread takes the index of its next item with counter++ until it
+ *  reaches n: items are handed out one at a time, so that threads with
+ *  cheaper items take more of them. */
+template<class Worker>
+void parallel_for(size_t n, int n_threads, Worker worker) {
+    std::atomic<size_t> counter(0);
+    n_threads = effective_n_threads(n_threads);
+    if (static_cast<size_t>(n_threads) > n) {
+        n_threads = n > 0 ? static_cast<int>(n) : 1;
+    }
+    if (n_threads == 1) {
+        worker(0, counter);
+        return;
+    }
+    std::vector<std::thread> threads;
+    for (int t = 0; t < n_threads; t++) {
+        threads.push_back(std::thread([&worker, &counter, t]() {
+            worker(t, counter);
+        }));
+    }
+    for (size_t t = 0; t < threads.size(); t++) {
+        threads[t].join();
+    }
+}
+
+#endif
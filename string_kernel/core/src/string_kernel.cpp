@@ -24,12 +24,11 @@ static PyObject * string_kernel(PyObject *self, PyObject *args, PyObject *keywds
     // string kernel_file(s1);
 
     // Kernel parameters
-    const float c = 1e12;  // unused
     int normalize = 1;
     const int symbol_size = 255;  // A size of an alphabet
-    const int max_length = 1000;  // A maximum sequence length
     int kn = 2;                   // A level of susbsequence matching
     double lambda = .5;          // A decay factor
+    int hard_matching = 1;       // Compare the symbols byte for byte
 
     // Prepare dummy data
     vector<string> dummy_data;
@@ -48,12 +47,13 @@ static PyObject * string_kernel(PyObject *self, PyObject *args, PyObject *keywds
     char * filename = (char *)"output.txt"; // default value
 
     static char *kwlist[] = {(char*)"sequences", (char*)"filename", (char*)"normalize",
-                             (char*)"kn", (char*)"lamda", (char*)"labels", NULL};
+                             (char*)"kn", (char*)"lamda", (char*)"labels",
+                             (char*)"hard_matching", NULL};
     /* the O! parses for a Python object (listObj) checked to be of type PyList_Type */
-    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O!|siidO!", kwlist,
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O!|siidO!i", kwlist,
                                      &PyList_Type, &listObj, &filename,
                                      &normalize, &kn, &lambda,
-                                     &PyList_Type, &labels))
+                                     &PyList_Type, &labels, &hard_matching))
         return NULL;
 
     /* get the number of lines passed to us */
@@ -62,7 +62,6 @@ static PyObject * string_kernel(PyObject *self, PyObject *args, PyObject *keywds
 
     string kernel_file(filename);
     string label;
-    std::stringstream ss;
     for (int i = 0; i < numLines; i++){
     	/* grab the string object from the next element of the list */
     	strObj = PyList_GetItem(listObj, i); /* Can't fail */
@@ -74,6 +73,7 @@ static PyObject * string_kernel(PyObject *self, PyObject *args, PyObject *keywds
         	line = PyString_AsString(strObj);
             label = string(line);
         } else {
+            std::stringstream ss;
             ss << i;
             label = ss.str();
         }
@@ -124,7 +124,8 @@ static PyObject * string_kernel(PyObject *self, PyObject *args, PyObject *keywds
 //
 
     // Main computations
-    StringKernel<float> string_kernel(c, normalize, symbol_size, max_length, kn, lambda);
+    StringKernel<float> string_kernel(normalize, symbol_size, kn, lambda,
+                                      hard_matching);
     string_kernel.set_data(dummy_data);
     string_kernel.compute_kernel();
 
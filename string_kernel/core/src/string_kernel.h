@@ -38,43 +38,466 @@
 
 #include <string>
 #include <vector>
+#include <atomic>
 #include <cassert>
+#include <algorithm>
 #include <cmath>
 #include "data_set.h"
+#include "parallel.h"
 #include "models.h"
 
+/** Position of a symbol in the table of models.h, whose rows are
+ *  ".-*" followed by the letters A-Z. */
 size_t get_idx_aa(char x) {
     switch (x) {
         case '.': return 0;
         case '-': return 1;
         case '*': return 2;
-        default: return x - 'A';
+        default: return x - 'A' + 3;
     }
     return 0; // never reached
 }
 
+/** Size of the workspace of subsequence_kernels, for subsequences up to
+ *  max_kn and strings up to max_length symbols; with max_gap >= 0, the one
+ *  of gapped_subsequence_kernels. */
+inline size_t workspace_size(size_t max_kn, size_t max_length,
+                             int max_gap = -1) {
+  if (max_gap < 0) {
+    return (max_kn + 1) * (max_length + 1);
+  }
+  const size_t width = std::min((size_t) max_gap + 1, max_length);
+  return max_kn * (width + 1) * max_length + width + max_kn + 2;
+}
+
+/** Size of the index buffer of gapped_subsequence_kernels, for strings up
+ *  to max_length symbols. */
+inline size_t columns_size(size_t max_length) {
+  return 257 + 2 * max_length + 1;
+}
+
+/** Code of a symbol, in 0..255, for the tables indexed by symbol. */
+inline size_t symbol_code(int symbol) {
+  return (size_t) (unsigned char) symbol;
+}
+
+/** Soft matching scores between two symbol codes, 256 x 256, row major,
+ *  from the model of models.h: symbols are compared byte for byte, as in
+ *  the other engines, so the ones outside its alphabet (lowercase letters
+ *  included) score 0. */
+inline std::vector<double> models_scores() {
+  static const char alphabet[] = ".-*ABCDEFGHIJKLMNOPQRSTUVWXYZ";
+  std::vector<double> scores(256 * 256, 0.);
+  for (const char * a = alphabet; *a; a++) {
+    for (const char * b = alphabet; *b; b++) {
+      scores[symbol_code(*a) * 256 + symbol_code(*b)] =
+          aa_model[get_idx_aa(*a) * 29 + get_idx_aa(*b)];
+    }
+  }
+  return scores;
+}
+
+/** The scores of models_scores, built once. */
+inline const double * default_scores() {
+  static const std::vector<double> scores = models_scores();
+  return &scores[0];
+}
+
+/** Whether x and y are the same string. */
+inline bool same_strings(const DataElement &x, const DataElement &y) {
+  if (x.length != y.length) {
+    return false;
+  }
+  for (size_t i = 0; i < x.length; i++) {
+    if (x.attributes[i] != y.attributes[i]) {
+      return false;
+    }
+  }
+  return true;
+}
+
+/** Compute the kernel of every subsequence length from min_kn to max_kn.
+ *  The table of level kn - 1 is the one needed for the length kn, so all the
+ *  lengths are computed with a single sweep over the levels.
+ *  Row j of the table of level i only depends on row j - 1 of levels i and
+ *  i - 1, so the tables are swept one row at a time keeping only the current
+ *  row of each level, as long as the shortest string.
+ *  workspace must hold workspace_size(max_kn, min(x.length, y.length))
+ *  elements; values[i] is the kernel of length min_kn + i. */
+template<class k_type>
+void subsequence_kernels(const DataElement &x_, const DataElement &y_,
+                         size_t min_kn, size_t max_kn, double lambda,
+                         int hard_matching, const double * scores,
+                         k_type * workspace, k_type * values) {
+  size_t i, j, k, kn, top;
+  // rows are as long as the shortest string
+  const bool swap = x_.length < y_.length;
+  const DataElement &x = swap ? y_ : x_;
+  const DataElement &y = swap ? x_ : y_;
+
+  // lengths longer than a string are not computed
+  top = max_kn < y.length ? max_kn : y.length;
+  const k_type same = same_strings(x, y);
+  for (kn = (top + 1 > min_kn ? top + 1 : min_kn); kn <= max_kn; kn++) {
+    values[kn - min_kn] = same;
+  }
+  if (top == 0) {
+    return;
+  }
+
+  // Kd[i * y.length + k] is the current row of level i, level 0 is all 1s;
+  // sums holds the contribution of each length, weights the matching
+  // scores of the current symbol of x with the symbols of y
+  k_type * Kd = workspace;
+  k_type * sums = workspace + max_kn * y.length;
+  k_type * weights = sums + max_kn;
+  for (k = 0; k < y.length; k++) {
+    Kd[k] = 1;
+  }
+  for (k = y.length; k < (top > 1 ? top : 1) * y.length; k++) {
+    Kd[k] = 0;
+  }
+  for (kn = 0; kn < max_kn; kn++) {
+    sums[kn] = 0;
+  }
+
+  for (j = 0; j < x.length; j++) {
+    // update from the highest level, so that the lower one is still row j-1
+    for (i = (j < top - 1 ? j : top - 1); i > 0; i--) {
+      k_type * row = Kd + i * y.length;
+      const k_type * prev = row - y.length;
+      // Kdd maintains the contribution of the left and diagonal terms
+      // that is, ONLY the contribution of the left (not influenced by the
+      // upper terms) and the eventual contibution of lambda^2 in case the
+      // chars are the same
+      k_type Kdd = 0;
+      for (k = i; k < y.length; k++) {
+        if (x.attributes[j - 1] != y.attributes[k - 1]) {
+          // ((.))-1 is because indices start with 0 (not with 1)
+          Kdd = lambda * Kdd;
+        } else {
+          Kdd = lambda * (Kdd + (lambda * prev[k - 1]));
+        }
+        row[k] = lambda * row[k] + Kdd;
+      }
+    }
+
+    // matching scores of row j, shared by all the lengths
+    if (hard_matching) {
+      for (k = 0; k < y.length; k++) {
+        weights[k] = x.attributes[j] == y.attributes[k];
+      }
+    } else {
+      // soft matching, scores between symbol codes (see models_scores)
+      const size_t a = symbol_code(x.attributes[j]);
+      for (k = 0; k < y.length; k++) {
+        const size_t b = symbol_code(y.attributes[k]);
+        weights[k] = scores[swap ? b * 256 + a : a * 256 + b];
+      }
+    }
+
+    // Calculate K, row j, for the lengths whose table has this row
+    for (kn = (min_kn > 1 ? min_kn : 1); kn <= top && kn <= j + 1; kn++) {
+      const k_type * row = Kd + (kn - 1) * y.length;
+      k_type sum = 0;
+      for (k = kn - 1; k < y.length; k++) {
+        sum += weights[k] * row[k];
+      }
+      sums[kn - 1] += lambda * lambda * sum;
+    }
+  }
+
+  for (kn = (min_kn > 1 ? min_kn : 1); kn <= top; kn++) {
+    values[kn - min_kn] = sums[kn - 1];
+  }
+}
+
+/** Compute the kernel of every subsequence length from min_kn to max_kn,
+ *  with at most max_gap symbols skipped between two consecutive symbols of
+ *  a subsequence (the banded dynamic programming of
+ *  sk._core_sumstringkernel_gapped).
+ *  M of level i at a match (a, b) sums lambda^(span in x + span in y) over
+ *  the subsequences of length i ending there. C of level i keeps, for the
+ *  last max_gap + 2 rows, the M of each match spread over the max_gap + 1
+ *  following columns, and M of level i + 1 at a match gathers C from the
+ *  max_gap + 1 previous rows: only the matches are visited, each one in
+ *  O(max_gap) time. A row of C is cleared, before its slot is reused, from
+ *  the matches that wrote it. With soft matching only the last symbol of
+ *  the subsequences is scored, as in subsequence_kernels.
+ *  workspace must hold workspace_size(max_kn, max(x.length, y.length),
+ *  max_gap) elements and columns columns_size(max(x.length, y.length)). */
+template<class k_type>
+void gapped_subsequence_kernels(const DataElement &x_, const DataElement &y_,
+                                size_t min_kn, size_t max_kn, double lambda,
+                                int hard_matching, const double * scores,
+                                size_t max_gap, k_type * workspace,
+                                size_t * columns,
+                                k_type * values) {
+  size_t a, b, d, e, i, kn, m;
+  // rows are as long as the shortest string
+  const bool swap = x_.length < y_.length;
+  const DataElement &x = swap ? y_ : x_;
+  const DataElement &y = swap ? x_ : y_;
+
+  // lengths longer than a string are not computed
+  const size_t top = max_kn < y.length ? max_kn : y.length;
+  const k_type same = same_strings(x, y);
+  for (kn = (top + 1 > min_kn ? top + 1 : min_kn); kn <= max_kn; kn++) {
+    values[kn - min_kn] = same;
+  }
+  if (top == 0) {
+    return;
+  }
+
+  const size_t width = std::min(max_gap + 1, x.length);
+  const size_t n_slots = width + 1, len_y = y.length;
+  // columns of y sorted by symbol, by_symbol[start[c]:start[c + 1]] for the
+  // symbol c, and back[e], the offset of the slot of row a - e in a level
+  size_t * start = columns;
+  size_t * by_symbol = start + 257;
+  size_t * back = by_symbol + len_y;
+  std::fill(start, start + 257, (size_t) 0);
+  for (b = 0; b < len_y; b++) {
+    start[symbol_code(y.attributes[b]) + 1]++;
+  }
+  for (size_t c = 0; c < 256; c++) {
+    start[c + 1] += start[c];
+  }
+  for (b = 0; b < len_y; b++) {
+    by_symbol[start[symbol_code(y.attributes[b])]++] = b;
+  }
+  // start[c] is now the end of the symbol c, shift it back
+  for (size_t c = 256; c > 0; c--) {
+    start[c] = start[c - 1];
+  }
+  start[0] = 0;
+  // C + ((i - 1) * n_slots + a % n_slots) * len_y is row a of level i
+  k_type * C = workspace;
+  k_type * powers = C + (top - 1) * n_slots * len_y;
+  k_type * sums = powers + width + 1;
+  std::fill(C, powers, (k_type) 0);
+  powers[0] = 1;
+  for (d = 1; d <= width; d++) {
+    powers[d] = lambda * powers[d - 1];
+  }
+  std::fill(sums, sums + max_kn + 1, (k_type) 0);
+
+  for (a = 0; a < x.length; a++) {
+    const size_t slot = a % n_slots;
+    // the slot held row a - n_slots, which is not needed anymore
+    if (a >= n_slots) {
+      const size_t old = symbol_code(x.attributes[a - n_slots]);
+      for (m = start[old]; m < start[old + 1]; m++) {
+        b = by_symbol[m];
+        for (i = 1; i < top; i++) {
+          k_type * row = C + ((i - 1) * n_slots + slot) * len_y;
+          for (d = 1; d <= width && b + d < len_y; d++) {
+            row[b + d] = 0;
+          }
+        }
+      }
+    }
+    const size_t n_back = std::min(width, a);
+    for (e = 1; e <= n_back; e++) {
+      back[e] = ((a - e) % n_slots) * len_y;
+    }
+
+    const size_t c = symbol_code(x.attributes[a]);
+    for (i = 1; i <= top && i <= a + 1; i++) {
+      k_type * row = C + ((i - 1) * n_slots + slot) * len_y;
+      // the slots of the level i - 1
+      const k_type * level = C + (i > 1 ? i - 2 : 0) * n_slots * len_y;
+      k_type sum = 0;
+      for (m = start[c]; m < start[c + 1]; m++) {
+        b = by_symbol[m];
+        k_type value = 0;
+        if (i == 1) {
+          value = lambda * lambda;
+        } else {
+          for (e = 1; e <= n_back; e++) {
+            value += powers[e] * level[back[e] + b];
+          }
+        }
+        sum += value;
+        if (i < top) {
+          for (d = 1; d <= width && b + d < len_y; d++) {
+            row[b + d] += powers[d] * value;
+          }
+        }
+      }
+      if (hard_matching) {
+        sums[i] += sum;
+      }
+    }
+
+    if (!hard_matching) {
+      // soft matching, the last symbol scored against all the columns
+      const size_t p = symbol_code(x.attributes[a]);
+      for (kn = (min_kn > 1 ? min_kn : 1); kn <= top && kn <= a + 1; kn++) {
+        const k_type * level = C + (kn > 1 ? kn - 2 : 0) * n_slots * len_y;
+        k_type sum = 0;
+        for (b = 0; b < len_y; b++) {
+          const size_t q = symbol_code(y.attributes[b]);
+          const k_type weight = scores[swap ? q * 256 + p : p * 256 + q];
+          if (weight == 0) {
+            continue;
+          }
+          k_type value = 0;
+          if (kn == 1) {
+            value = lambda * lambda;
+          } else {
+            for (e = 1; e <= n_back; e++) {
+              value += powers[e] * level[back[e] + b];
+            }
+          }
+          sum += weight * value;
+        }
+        sums[kn] += sum;
+      }
+    }
+  }
+
+  for (kn = (min_kn > 1 ? min_kn : 1); kn <= top; kn++) {
+    values[kn - min_kn] = sums[kn];
+  }
+}
+
+/** Scratch buffers of a thread, allocated once and reused for all the
+ *  pairs it computes. */
+template<class k_type>
+struct Scratch {
+  std::vector<k_type> workspace;
+  std::vector<size_t> columns;
+  std::vector<k_type> values;
+
+  Scratch(size_t min_kn, size_t max_kn, size_t max_length, int max_gap = -1)
+      : workspace(workspace_size(max_kn, max_length, max_gap)),
+        columns(max_gap < 0 ? 1 : columns_size(max_length)),
+        values(max_kn - min_kn + 1) {}
+};
+
+/** Sum of the kernels of all the lengths from min_kn to max_kn, with at
+ *  most max_gap symbols skipped between consecutive symbols of a
+ *  subsequence if max_gap >= 0. */
+template<class k_type>
+k_type sum_subsequence_kernels(const DataElement &x, const DataElement &y,
+                               size_t min_kn, size_t max_kn, double lambda,
+                               int hard_matching, const double * scores,
+                               int max_gap, Scratch<k_type> &scratch) {
+  k_type * values = &scratch.values[0];
+  if (max_gap < 0) {
+    subsequence_kernels(x, y, min_kn, max_kn, lambda, hard_matching, scores,
+                        &scratch.workspace[0], values);
+  } else {
+    gapped_subsequence_kernels(x, y, min_kn, max_kn, lambda, hard_matching,
+                               scores, (size_t) max_gap, &scratch.workspace[0],
+                               &scratch.columns[0], values);
+  }
+  k_type sum = 0;
+  for (size_t k = 0; k <= max_kn - min_kn; k++) {
+    sum += values[k];
+  }
+  return sum;
+}
+
+/** Kernel (summed over the lengths) of each string of data with itself,
+ *  computed with n_threads threads. The soft matching scores are the ones
+ *  of models.h if scores is NULL (see models_scores). */
+template<class k_type>
+void kernel_norms(const DataSet &data, size_t min_kn, size_t max_kn,
+                  double lambda, int hard_matching, k_type * norms,
+                  int n_threads, int max_gap = -1,
+                  const double * scores = 0) {
+  const double * table = scores ? scores : default_scores();
+  const DataElement * elements = data.elements();
+  const size_t n = data.size();
+  const size_t max_length = data.max_length();
+
+  parallel_for(n, n_threads, [&](int, std::atomic<size_t> &counter) {
+    Scratch<k_type> scratch(min_kn, max_kn, max_length, max_gap);
+    for (size_t i; (i = counter++) < n;) {
+      norms[i] = sum_subsequence_kernels(
+          elements[i], elements[i], min_kn, max_kn, lambda, hard_matching,
+          table, max_gap, scratch);
+    }
+  });
+}
+
+/** Kernel (summed over the lengths) between the strings of rows and cols,
+ *  written in out, rows.size() x cols.size(), row major.
+ *  If symmetric (rows and cols are the same data set), only the upper
+ *  triangle is computed and mirrored. If norms are given, the kernel is
+ *  normalised. The contribution of each length is accumulated in the
+ *  output entry, so that memory is the output matrix plus a scratch
+ *  buffer for each thread. With max_gap >= 0, at most max_gap symbols are
+ *  skipped between consecutive symbols of a subsequence. The soft matching
+ *  scores are the ones of models.h if scores is NULL. */
+template<class k_type>
+void kernel_matrix(const DataSet &rows, const DataSet &cols, bool symmetric,
+                   size_t min_kn, size_t max_kn, double lambda,
+                   int hard_matching, const k_type * norms_rows,
+                   const k_type * norms_cols, k_type * out, int n_threads,
+                   int max_gap = -1, const double * scores = 0) {
+  const double * table = scores ? scores : default_scores();
+  const size_t n_rows = rows.size(), n_cols = cols.size();
+  const DataElement * x = rows.elements();
+  const DataElement * y = cols.elements();
+  const size_t max_length = std::max(rows.max_length(), cols.max_length());
+  const bool normalize = norms_rows && norms_cols;
+
+  parallel_for(n_rows, n_threads, [&](int, std::atomic<size_t> &counter) {
+    Scratch<k_type> scratch(min_kn, max_kn, max_length, max_gap);
+    for (size_t i; (i = counter++) < n_rows;) {
+      // in the symmetric case, row i computes the upper triangle and
+      // mirrors it in column i
+      size_t j = 0;
+      if (symmetric) {
+        j = i;
+        if (normalize) {
+          out[i * n_cols + i] = 1;
+          j = i + 1;
+        }
+      }
+      for (; j < n_cols; j++) {
+        k_type value = sum_subsequence_kernels(
+            x[i], y[j], min_kn, max_kn, lambda, hard_matching, table,
+            max_gap, scratch);
+        if (normalize) {
+          value /= sqrt(norms_rows[i] * norms_cols[j]);
+        }
+        out[i * n_cols + j] = value;
+        if (symmetric) {
+          out[j * n_cols + i] = value;
+        }
+      }
+    }
+  });
+}
+
 template<class k_type>
 class StringKernel {
  public:
   /** Constructor, sets kernel parameters. */
   StringKernel(int normalize, int symbol_size,
-               size_t max_length, int kn, double lambda, int hard_matching)
+               int kn, double lambda, int hard_matching)
         {
             _normalize = normalize;
             _symbol_size = symbol_size;
-            _max_length = max_length;
             _kn = kn;
             _lambda = lambda;
             _hard_matching = hard_matching;
             _string_data = 0;
             _kernel = 0;
+            norms = 0;
+            _private_dataset = 0;
+            _owns_kernel = 0;
         }
 
   ~StringKernel() {
-    delete [] _kernel;
-    if(_normalize) {
-        delete [] norms;
+    if (_owns_kernel) {
+        delete [] _kernel;
     }
+    delete [] norms;
     if(_private_dataset) {
         delete _string_data;
     }
@@ -84,9 +507,11 @@ class StringKernel {
   void set_data(const std::vector<std::string> &strings);
   void set_data(DataSet * dataset);
 
-  /** Calculate the kernel and the norms. */
-  void compute_kernel();
-  void compute_norms();
+  /** Calculate the kernel and the norms, with n_threads threads (all the
+   *  cores if < 1). If out is given, the kernel is written there,
+   *  otherwise it is allocated and owned by this object. */
+  void compute_kernel(k_type * out = 0, int n_threads = 1);
+  void compute_norms(int n_threads = 1);
 
   /** Return pointer to kernel matrix. */
   k_type * values() const {
@@ -104,7 +529,6 @@ class StringKernel {
   int _hard_matching;
   int _normalize;
   int _symbol_size;
-  size_t _max_length;
   int _kn;
   double _lambda;
   DataSet *_string_data;
@@ -112,15 +536,18 @@ class StringKernel {
   k_type * norms;
 
  private:
-  k_type kernel(const DataElement &x, const DataElement &y) const;
   int _private_dataset;
+  int _owns_kernel;
 };
 
 
 template<class k_type>
 void StringKernel<k_type>::set_data(const std::vector<std::string> &strings) {
   assert(strings.size() > 0);
-  _string_data = new DataSet(_max_length, _symbol_size);
+  if (_private_dataset) {
+    delete _string_data;
+  }
+  _string_data = new DataSet(_symbol_size);
   _string_data->load_strings(strings);
 
   _private_dataset = 1;
@@ -129,155 +556,41 @@ void StringKernel<k_type>::set_data(const std::vector<std::string> &strings) {
 
 template<class k_type>
 void StringKernel<k_type>::set_data(DataSet * dataset) {
+  if (_private_dataset) {
+    delete _string_data;
+  }
   _string_data = dataset; // copy the pointer, to avoid copying the same data
   _private_dataset = 0;
 }
 
-
 template<class k_type>
-k_type StringKernel<k_type>::kernel(const DataElement &x, const DataElement &y) const {
-    size_t i, j, k;
-    k_type * Kd[2];
-    size_t x_dim = x.length + 1;
-    size_t y_dim = y.length + 1;
-    if(x.length < _kn || y.length < _kn) {
-        if(x.length == y.length) {
-            for(i = 0; i < x.length; i++) {
-                if(x.attributes[i] != y.attributes[i]) {
-                    return 0;
-                }
-            }
-            return 1;
-        }
-        return 0;
-    }
-
-    // Allocate and initialise Kd
-    for (i = 0; i < 2; i++) {
-      Kd[i] = new k_type [x_dim * y_dim];
-      for (j = 0; j < x_dim * y_dim; j++) {
-          Kd[i][j] = (i + 1) % 2;
-      }
-    }
-
-  // Kd now contains two matrices, that are n+1 x m+1 (empty string included)
-  // Kd[0] is composed by 1s (follows the definition of K_0)
-  // Kd[1] is composed by 0s -> it starts to be filled
-
-  // start with i = kn = 1, 2, 3 ...
-  for (i = 1; i < _kn; i++) {
-    /* Set the Kd to zero for those lengths of s and t
-    where s (or t) has exactly length i-1 and t (or s)
-    has length >= i-1. L-shaped upside down matrix */
-    for (j = (i - 1); j < x.length; j++) {
-      Kd[i % 2][j * y_dim + i - 1] = 0;
-    }
-    for (j = (i - 1); j < y.length; j++) {
-      Kd[i % 2][(i - 1) * y_dim + j] = 0;
-    }
-
-    // // print matrix, DEBUG
-    // for (int zzz = 0; zzz < 2; zzz++) {
-    //     printf("########### Kd[%d] ##########\n", zzz);
-    //     int _i;
-    //     for (_i = 0, printf("  e "); _i < y.length; _i++) {
-    //           printf("%c ", y.attributes[_i]);
-    //     }
-    //     printf("\n");
-    //
-    //     for (int j = 0; j < (x.length + 1); j++) {
-    //         if(j==0) printf("e ");
-    //         else printf("%c ", x.attributes[j-1]);
-    //         for (int k = 0; k < (y.length + 1); k++) {
-    //             printf("%.9f ", Kd[zzz][j*y_dim + k]);
-    //         }
-    //         printf("\n");
-    //     }
-    // }
-
-    for (j = i; j < x.length; j++) {
-      // Kdd maintains the contribution of the left and diagonal terms
-      // that is, ONLY the contribution of the left (not influenced by the
-      // upper terms) and the eventual contibution of lambda^2 in case the
-      // chars are the same
-      k_type Kdd = 0;
-      for (k = i; k < y.length; k++) {
-        if (x.attributes[j - 1] != y.attributes[k - 1]) {
-          // ((.))-1 is because indices start with 0 (not with 1)
-          Kdd = _lambda * Kdd;
-        } else {
-          Kdd = _lambda * (Kdd + (_lambda * Kd[(i + 1) % 2][(j - 1)*y_dim + k - 1]));
-        }
-        Kd[i % 2][j*y_dim+k] = _lambda * Kd[i % 2][(j - 1) * y_dim + k] + Kdd;
-      }
-    }
-  }
-
-  // Calculate K
-  k_type sum = 0;
-
-  for (i = _kn - 1; i < x.length; i++) {
-    for (j = _kn - 1; j < y.length; j++) {
-        // hard matching
-        if(_hard_matching) {
-            if (x.attributes[i] == y.attributes[j]) {
-                sum += _lambda * _lambda * Kd[(_kn - 1) % 2][i*y_dim + j];
-            }
-        } else {
-            // soft matching, regulated from models.h, amminoacidic model
-            sum += _lambda * _lambda * \
-                aa_model[get_idx_aa(x.attributes[i])*29 +
-                         get_idx_aa(y.attributes[j])] * \
-                Kd[(_kn - 1) % 2][i*y_dim + j];
-        }
-    }
-  }
-
-  for (i = 0; i < 2; i++) {
-      delete[] Kd[i];
-  }
-  return sum;
-}
-
-template<class k_type>
-void StringKernel<k_type>::compute_kernel() {
+void StringKernel<k_type>::compute_kernel(k_type * out, int n_threads) {
   assert(_string_data);
-
-  size_t i, j;
   size_t kernel_dim = _string_data->size();
 
   // if computing normalised kernel, then compute norms
   if (_normalize) {
-      compute_norms();
+      compute_norms(n_threads);
   }
 
-  // Compute kernel using dynamic programming
-  _kernel = new k_type [kernel_dim * kernel_dim];
-  for (i = 0; i < kernel_dim; i++) {
-      if(_normalize) {
-          _kernel[i*kernel_dim+i] = 1;
-          j = i + 1;
-      } else {
-          j = i;
-      }
-    for (; j < kernel_dim; j++) {
-        _kernel[i*kernel_dim+j] = kernel(_string_data->elements()[i],
-                                         _string_data->elements()[j]);
-        if (_normalize) {
-            _kernel[i*kernel_dim+j] /= sqrt(norms[i] * norms[j]);
-        }
-        _kernel[j*kernel_dim+i] = _kernel[i*kernel_dim+j];
-    }
+  if (_owns_kernel) {
+      delete [] _kernel;
   }
+  _owns_kernel = out == 0;
+  _kernel = out ? out : new k_type [kernel_dim * kernel_dim];
+
+  // Compute kernel using dynamic programming
+  kernel_matrix(*_string_data, *_string_data, true, _kn, _kn, _lambda,
+                _hard_matching, _normalize ? norms : (k_type *) 0,
+                _normalize ? norms : (k_type *) 0, _kernel, n_threads);
 }
 
 template<class k_type>
-void StringKernel<k_type>::compute_norms() {
+void StringKernel<k_type>::compute_norms(int n_threads) {
     // Get values for normalization, it is computed for elements in diagonal
+    delete [] norms;
     norms = new k_type [_string_data->size()];
-    for (size_t i = 0; i < _string_data->size(); i++) {
-      norms[i] = kernel(_string_data->elements()[i],
-                        _string_data->elements()[i]);
-    }
+    kernel_norms(*_string_data, _kn, _kn, _lambda, _hard_matching, norms,
+                 n_threads);
 }
 #endif
@@ -11,6 +11,62 @@
 #define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
 #include <numpy/arrayobject.h>
 
+/* Read a list of strings into vector_data, NULL on error. */
+static int
+read_strings(PyObject * listObj, std::vector<std::string> &vector_data,
+             int check_min_length, int * min_kn) {
+    Py_ssize_t list_size = PyList_Size(listObj);
+    for (Py_ssize_t i = 0; i < list_size; i++) {
+        /* grab the string object from the next element of the list */
+        PyObject * strObj = PyList_GetItem(listObj, i); /* Can't fail */
+        char * line = PyString_AsString(strObj);  /* make it a string */
+        if (line == NULL) {
+            return 0;
+        }
+        if (check_min_length && strlen(line) < (size_t)*min_kn) {
+            *min_kn = strlen(line);
+        }
+        vector_data.push_back(line);
+    }
+    return 1;
+}
+
+template<class k_type>
+static int
+compute_kernel(const std::vector<std::string> &vector_data,
+               const std::vector<std::string> &vector_train,
+               int min_kn, int max_kn, int normalize, double lambda,
+               int hard_matching, int n_jobs, PyArrayObject * py_arr,
+               int save_output, const std::string &kernel_file,
+               const std::vector<std::string> &vector_labels, int max_gap,
+               PyArrayObject * scores) {
+    const int symbol_size = 255;  // A size of an alphabet
+    SumStringKernel<k_type> string_kernel(min_kn, max_kn, normalize,
+                                          symbol_size, lambda, hard_matching,
+                                          max_gap);
+    string_kernel.set_data(vector_data);
+    if (scores != NULL) {
+        string_kernel.set_scores((const double *) PyArray_DATA(scores));
+    }
+    if (!vector_train.empty()) {
+        string_kernel.set_train(vector_train);
+    }
+
+    // the kernel is written directly in the buffer of the numpy array,
+    // without holding the GIL
+    Py_BEGIN_ALLOW_THREADS
+    string_kernel.compute_kernel((k_type *) PyArray_DATA(py_arr), n_jobs);
+    Py_END_ALLOW_THREADS
+
+    if (save_output) {
+        if (!write_kernel(kernel_file, vector_labels, string_kernel)) {
+            PyErr_SetString(PyExc_IOError, "Cannot write to filename specified");
+            return 0;
+        }
+    }
+    return 1;
+}
+
 // static PyArrayObject *
 static PyObject *
 sum_string_kernel(PyObject *self, PyObject *args, PyObject *keywds) {
@@ -21,14 +77,17 @@ sum_string_kernel(PyObject *self, PyObject *args, PyObject *keywds) {
     int return_float = 0;
     int check_min_length = 0;
     int hard_matching = 0;
-    const int symbol_size = 255;  // A size of an alphabet
-    const int max_length = 1000;  // A maximum sequence length
     int min_kn = 1;                   // A level of subsequence matching
     int max_kn = 2;                   // A level of subsequence matching
     double lambda = .5;          // A decay factor
+    int n_jobs = 1;              // Number of threads, -1 for all the cores
+    int double_precision = 0;    // Compute and return float64
+    int max_gap = -1;            // Maximum gap in the subsequences, -1 none
+    PyObject * scoresObj = NULL; // Soft matching scores, 256 x 256
 
     // Prepare data
     std::vector<std::string> vector_data;
+    std::vector<std::string> vector_train;
     std::vector<std::string> vector_labels;
 
     Py_ssize_t list_size;      /* how many lines we passed for parsing */
@@ -37,6 +96,7 @@ sum_string_kernel(PyObject *self, PyObject *args, PyObject *keywds) {
     PyObject * listObj; /* the list of strings */
     PyObject * strObj;  /* one string in the list */
     PyObject * labels = NULL; /* the list of strings */
+    PyObject * train = NULL; /* the list of training strings (columns) */
     char * filename = (char *)"output.txt"; // default value
 
     static char *kwlist[] = {
@@ -44,43 +104,51 @@ sum_string_kernel(PyObject *self, PyObject *args, PyObject *keywds) {
         (char*)"min_kn", (char*)"max_kn", (char*)"lamda",
         (char*)"save_output", (char*)"hard_matching",
         (char*)"verbose", (char*)"return_float", (char*)"check_min_length",
-        (char*)"labels", NULL
+        (char*)"labels", (char*)"train", (char*)"n_jobs",
+        (char*)"double_precision", (char*)"max_gap", (char*)"scores", NULL
     };
     /* the O! parses for a Python object (listObj) checked to be of type PyList_Type */
-    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O!|siiidiiiiiO!", kwlist,
+    if (!PyArg_ParseTupleAndKeywords(args, keywds, "O!|siiidiiiiiO!O!iiiO", kwlist,
             &PyList_Type, &listObj, &filename, &normalize, &min_kn, &max_kn,
             &lambda, &save_output, &hard_matching, &verbose, &return_float,
             &check_min_length,
-            &PyList_Type, &labels))
+            &PyList_Type, &labels, &PyList_Type, &train, &n_jobs,
+            &double_precision, &max_gap, &scoresObj))
         return NULL;
 
     /* get the number of lines passed */
     list_size = PyList_Size(listObj);
     if (list_size < 0) return NULL; /* Not a list */
+    if (list_size == 0 || (train != NULL && PyList_Size(train) == 0)) {
+        PyErr_SetString(PyExc_ValueError, "Empty list of sequences");
+        return NULL;
+    }
+
+    if (!read_strings(listObj, vector_data, check_min_length, &min_kn)) {
+        return NULL;
+    }
+    if (train != NULL &&
+            !read_strings(train, vector_train, check_min_length, &min_kn)) {
+        return NULL;
+    }
 
     std::string kernel_file(filename);
     std::string label;
-    std::stringstream ss;
     for (Py_ssize_t i = 0; i < list_size; i++){
-    	/* grab the string object from the next element of the list */
-    	strObj = PyList_GetItem(listObj, i); /* Can't fail */
-    	line = PyString_AsString(strObj);  /* make it a string */
-        if(check_min_length && strlen(line) < min_kn) {
-            min_kn = strlen(line);
-        }
-        vector_data.push_back(line);
-
         if (labels != NULL) {
             strObj = PyList_GetItem(labels, i);
-        	line = PyString_AsString(strObj);
+            if (strObj == NULL || (line = PyString_AsString(strObj)) == NULL) {
+                return NULL;
+            }
             label = std::string(line);
         } else {
             // convert i into a string
+            std::stringstream ss;
             ss << i;
             label = ss.str();
         }
         vector_labels.push_back(label);
-	}
+    }
 
     if(verbose) {
         std::cout << "Parameters:"
@@ -90,6 +158,8 @@ sum_string_kernel(PyObject *self, PyObject *args, PyObject *keywds) {
         << "\n\tmax_kn: " << max_kn
         << "\n\tlambda: " << lambda
         << "\n\thard_matching: " << hard_matching
+        << "\n\tn_jobs: " << n_jobs
+        << "\n\tmax_gap: " << max_gap
         << std::endl;
     }
 
@@ -97,45 +167,83 @@ sum_string_kernel(PyObject *self, PyObject *args, PyObject *keywds) {
         PyErr_SetString(PyExc_ValueError, "`min_kn` is higher than `max_kn`");
         return NULL;
     }
-
-    // Main computations
-    SumStringKernel<float> string_kernel(min_kn, max_kn, normalize,
-                                         symbol_size, max_length, lambda,
-                                         hard_matching);
-    string_kernel.set_data(vector_data);
-    string_kernel.compute_kernel();
-
-    if (save_output) {
-      if (!write_kernel(kernel_file, vector_labels, string_kernel)) {
-        PyErr_SetString(PyExc_IOError, "Cannot write to filename specified");
+    if(max_gap < -1) {
+        PyErr_SetString(PyExc_ValueError, "`max_gap` must be -1 or >= 0");
         return NULL;
-      }
     }
 
-    if(return_float && list_size == 2) {
-        return Py_BuildValue("f", string_kernel.values()[1]);
+    // the soft matching scores between symbol codes, required if soft
+    if (!hard_matching && (scoresObj == NULL || scoresObj == Py_None)) {
+        PyErr_SetString(PyExc_ValueError,
+                        "soft matching requires the `scores`");
+        return NULL;
+    }
+    PyArrayObject * scores = NULL;
+    if (scoresObj != NULL && scoresObj != Py_None) {
+        scores = (PyArrayObject *) PyArray_FROMANY(
+            scoresObj, NPY_DOUBLE, 2, 2,
+            NPY_ARRAY_C_CONTIGUOUS | NPY_ARRAY_ALIGNED);
+        if (scores == NULL) {
+            return NULL;
+        }
+        if (PyArray_DIM(scores, 0) != 256 || PyArray_DIM(scores, 1) != 256) {
+            Py_DECREF(scores);
+            PyErr_SetString(PyExc_ValueError, "`scores` must be 256 x 256");
+            return NULL;
+        }
     }
 
-    // build the numpy matrix to pass back to the Python code
-    // need to copy data to prevent the deleting in string kernel class
-    // TODO avoid copying data?
-    float * data = (float*) malloc(list_size*list_size*sizeof(float));
-    if (!data) {
-        PyErr_SetString(PyExc_MemoryError, "out of memory");
+    // the numpy array owns its buffer, the kernel is computed in place
+    npy_intp size[2];
+    size[0] = list_size;
+    size[1] = train != NULL ? PyList_Size(train) : list_size;
+    PyArrayObject * py_arr = (PyArrayObject *) PyArray_SimpleNew(
+        2, size, double_precision ? NPY_DOUBLE : NPY_FLOAT);
+    if (py_arr == NULL) {
+        Py_XDECREF(scores);
         return NULL;
     }
-    string_kernel.copy_kernel(data);
 
+    // Main computations
+    int success;
+    if (double_precision) {
+        success = compute_kernel<double>(
+            vector_data, vector_train, min_kn, max_kn, normalize, lambda,
+            hard_matching, n_jobs, py_arr, save_output, kernel_file,
+            vector_labels, max_gap, scores);
+    } else {
+        success = compute_kernel<float>(
+            vector_data, vector_train, min_kn, max_kn, normalize, lambda,
+            hard_matching, n_jobs, py_arr, save_output, kernel_file,
+            vector_labels, max_gap, scores);
+    }
+    Py_XDECREF(scores);
+    if (!success) {
+        Py_DECREF(py_arr);
+        return NULL;
+    }
 
-    npy_intp* size = (npy_intp*)malloc(sizeof(npy_intp)*2);
-    size[0] = size[1] = list_size;
-    PyObject * py_arr = PyArray_SimpleNewFromData(2, size, NPY_FLOAT, data);
-    return py_arr;
+    if(return_float && list_size == 2 && train == NULL) {
+        void * ptr = PyArray_GETPTR2(py_arr, 0, 1);
+        PyObject * value = Py_BuildValue(
+            "d", double_precision ? *(double *) ptr : *(float *) ptr);
+        Py_DECREF(py_arr);
+        return value;
+    }
+    return (PyObject *) py_arr;
 }
 
 static PyMethodDef StringKernelMethods[] = {
     {"sum_string_kernel", (PyCFunction)sum_string_kernel, METH_VARARGS | METH_KEYWORDS,
-     "docs."},
+     "Sum of the string kernels of lengths from min_kn to max_kn.\n\n"
+     "The kernel is between `sequences` (rows) and `train` (columns), or\n"
+     "between `sequences` and themselves if train is not given. It is\n"
+     "computed with `n_jobs` threads (-1 for all the cores) and returned\n"
+     "as a float32 array, or float64 if `double_precision`. With\n"
+     "`max_gap` >= 0, at most max_gap symbols are skipped between\n"
+     "consecutive symbols of a subsequence. Symbols are compared byte\n"
+     "for byte; `scores`, a 256 x 256 array required for soft matching,\n"
+     "are the soft matching scores between their codes."},
     {NULL, NULL, 0, NULL}        /* Sentinel */
 };
 
@@ -6,56 +6,71 @@
 #include <cassert>
 #include <cmath>
 #include "data_set.h"
+#include "parallel.h"
 #include "string_kernel.h"
 
 template<class k_type>
 class SumStringKernel {
  public:
-  /** Constructor, sets kernel parameters. */
+  /** Constructor, sets kernel parameters. With max_gap >= 0, at most
+   *  max_gap symbols are skipped between consecutive symbols of a
+   *  subsequence. */
   SumStringKernel(int min_kn, int max_kn,
                   const int normalize, const int symbol_size,
-                  const size_t max_length, double lambda, const int hard_matching)
+                  double lambda, const int hard_matching,
+                  const int max_gap = -1)
       : _min_kn(min_kn), _max_kn(max_kn), _normalize(normalize),
-        _symbol_size(symbol_size), _max_length(max_length),
-        _hard_matching(hard_matching) {
+        _symbol_size(symbol_size), _hard_matching(hard_matching),
+        _max_gap(max_gap), _lambda(lambda) {
             _num_subseq_length = max_kn - min_kn + 1;
-            _string_kernels = new StringKernel<k_type> *[_num_subseq_length];
-            for (size_t i = 0; i < _num_subseq_length; i++) {
-                // force normalize false in the StringKernel
-                _string_kernels[i] = new StringKernel<k_type>(0, symbol_size,
-                    max_length, min_kn + i, lambda, hard_matching);
-            }
+            _string_data = 0;
+            _train_data = 0;
+            _kernel = 0;
+            _owns_kernel = 0;
         }
 
   ~SumStringKernel() {
-        delete [] _kernel;
-        if(_normalize) {
-            delete [] _norms;
+        if (_owns_kernel) {
+            delete [] _kernel;
         }
-
-        for (size_t i = 0; i < _num_subseq_length; i++)
-            delete _string_kernels[i];
-        delete [] _string_kernels;
-
         delete _string_data;
+        delete _train_data;
   }
 
-  /** Set the dataset to be used by the kernel. */
+  /** Set the dataset to be used by the kernel (the rows). */
   void set_data(const std::vector<std::string> &strings);
 
-  /** Calculate the kernel. */
-  void compute_kernel();
+  /** Set the training dataset (the columns). If not set, the kernel is the
+   *  symmetric one between the strings of set_data. */
+  void set_train(const std::vector<std::string> &strings);
+
+  /** Set the soft matching scores between two symbol codes, 256 x 256, row
+   *  major (copied). If not set, they are the ones of models.h. */
+  void set_scores(const double * scores) {
+    _scores.assign(scores, scores + 256 * 256);
+  }
+
+  /** Calculate the kernel with n_threads threads (all the cores if < 1).
+   *  If out is given, the kernel is written there, otherwise it is
+   *  allocated and owned by this object. */
+  void compute_kernel(k_type * out = 0, int n_threads = 1);
   void copy_kernel(k_type * copy);
 
-  /** Return pointer to kernel matrix. */
+  /** Return pointer to kernel matrix, size() x n_cols(), row major. */
   k_type * values() const {
     assert(_kernel);
     return _kernel;
   }
 
-  /** Return the size of the array of StringKernels. */
+  /** Return the number of rows of the kernel. */
   size_t size() const {
-    return _num_subseq_length;
+    assert(_string_data);
+    return _string_data->size();
+  }
+
+  /** Return the number of columns of the kernel. */
+  size_t n_cols() const {
+    return _train_data ? _train_data->size() : size();
   }
 
  protected:
@@ -64,81 +79,77 @@ class SumStringKernel {
   // const float _c;
   const int _normalize;
   const int _symbol_size;
-  const size_t _max_length;
   const int _hard_matching;
+  const int _max_gap;
+  const double _lambda;
   size_t _num_subseq_length;
-  // const double _lambda;
   DataSet *_string_data;
-  // std::vector<StringKernel<k_type> *> _string_kernels;
+  DataSet *_train_data;
+  std::vector<double> _scores;
   k_type *_kernel;
-  StringKernel<k_type> ** _string_kernels;
-  k_type *_norms; // keep norms at each step
+  int _owns_kernel;
 };
 
 
 template<class k_type>
 void SumStringKernel<k_type>::set_data(const std::vector<std::string> &strings) {
   assert(strings.size() > 0);
-  _string_data = new DataSet(_max_length, _symbol_size);
+  delete _string_data;
+  _string_data = new DataSet(_symbol_size);
   _string_data->load_strings(strings);
+}
 
-  for (size_t i = 0; i < _num_subseq_length; i++) {
-    //   _string_kernels[i]->set_data(strings);
-      _string_kernels[i]->set_data(_string_data); //avoid copying
-  }
+template<class k_type>
+void SumStringKernel<k_type>::set_train(const std::vector<std::string> &strings) {
+  assert(strings.size() > 0);
+  delete _train_data;
+  _train_data = new DataSet(_symbol_size);
+  _train_data->load_strings(strings);
 }
 
 template<class k_type>
 void SumStringKernel<k_type>::copy_kernel(k_type * copy) {
-    size_t kernel_dim_2 = _string_data->size() * _string_data->size();
+    size_t kernel_dim_2 = size() * n_cols();
     for (size_t i = 0; i < kernel_dim_2; i++) {
         copy[i] = _kernel[i];
     }
 }
 
 template<class k_type>
-void SumStringKernel<k_type>::compute_kernel() {
+void SumStringKernel<k_type>::compute_kernel(k_type * out, int n_threads) {
   assert(_string_data);
 
-  size_t i, j, k;
-  size_t kernel_dim = _string_data->size();
+  const DataSet * train = _train_data ? _train_data : _string_data;
+  const bool symmetric = _train_data == 0;
+  const size_t n_rows = size(), n_cols = this->n_cols();
 
-  // Get values for normalization, it is computed for elements in diagonal
-  if(_normalize) {
-      _norms = new k_type[kernel_dim];
-      for(i = 0; i < kernel_dim; i++) {
-          _norms[i] = 0;
-      }
-  }
-  for(i = 0; i < _num_subseq_length; i++) {
-      _string_kernels[i]->compute_kernel();
-      if(_normalize) {
-          _string_kernels[i]->compute_norms();
-          for (j = 0; j < kernel_dim; j++) {
-              _norms[j] += _string_kernels[i]->norms[j];
-          }
-      }
+  if (_owns_kernel) {
+      delete [] _kernel;
   }
-
-  _kernel = new k_type [kernel_dim*kernel_dim];
-  for (i = 0; i < kernel_dim; i++) {
-      if(_normalize) {
-          _kernel[i*kernel_dim+i] = 1;
-          j = i + 1;
+  _owns_kernel = out == 0;
+  _kernel = out ? out : new k_type[n_rows * n_cols];
+
+  // norms are computed once for each string, for all the lengths together
+  const double * scores = _scores.empty() ? 0 : &_scores[0];
+  std::vector<k_type> norms_rows, norms_cols;
+  if (_normalize) {
+      norms_rows.resize(n_rows);
+      kernel_norms(*_string_data, _min_kn, _max_kn, _lambda, _hard_matching,
+                   &norms_rows[0], n_threads, _max_gap, scores);
+      if (symmetric) {
+          norms_cols = norms_rows;
       } else {
-          j = i;
-      }
-      for (; j < kernel_dim; j++) {
-          _kernel[i*kernel_dim+j] = 0;
-          for(k = 0; k < _num_subseq_length; k++) {
-              _kernel[i*kernel_dim+j] += _string_kernels[k]->_kernel[i*kernel_dim+j];
-          }
-          if (_normalize) {
-              _kernel[i*kernel_dim+j] /= sqrt(_norms[i] * _norms[j]);
-          }
-          _kernel[j*kernel_dim+i] = _kernel[i*kernel_dim+j];
+          norms_cols.resize(n_cols);
+          kernel_norms(*train, _min_kn, _max_kn, _lambda, _hard_matching,
+                       &norms_cols[0], n_threads, _max_gap, scores);
       }
   }
+
+  // all the lengths of a pair are accumulated in the same entry
+  kernel_matrix(*_string_data, *train, symmetric, _min_kn, _max_kn, _lambda,
+                _hard_matching, _normalize ? &norms_rows[0] : (k_type *) 0,
+                _normalize ? &norms_cols[0] : (k_type *) 0, _kernel,
+                n_threads, _max_gap, scores);
 }
 
 
@@ -0,0 +1,152 @@
+"""Timings and counters of a kernel computation.
+
+A KernelStats object is given to the kernel functions of sk (the `stats`
+argument), which record in it the time spent in each stage and the work
+done, and report the completed tiles to an optional progress callback:
+
+- 'norms', the kernel of each sequence with itself;
+- 'pairs', the kernel of the pairs of sequences (the tiles);
+- 'normalize', the normalisation of the kernel;
+- 'expand', the expansion of the kernel between distinct sequences to
+  all the samples;
+- 'native', the whole computation in the C++ extension;
+- 'explicit', the whole computation with the explicit feature map.
+
+The work is counted in pairs of sequences and in cells of the dynamic
+programming, about max_kn * len(x) * len(y) for each pair (the cells that
+the dense algorithm visits; the sparse one, and the banded one with
+max_gap, visit less of them).
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+
+def _pairs_and_cells(lengths_x, lengths_y, max_kn, triangle=False):
+    """Number of pairs and of cells of the tile lengths_x x lengths_y.
+
+    If triangle, the tile is on the diagonal of a symmetric kernel and only
+    its pairs (i, j), i < j, are counted.
+    """
+    lengths_x = np.asarray(lengths_x, dtype=float)
+    lengths_y = np.asarray(lengths_y, dtype=float)
+    if triangle:
+        n = len(lengths_x)
+        total = lengths_x.sum()
+        return n * (n - 1) // 2, max_kn * (
+            total * total - np.dot(lengths_x, lengths_x)) / 2
+    return len(lengths_x) * len(lengths_y), \
+        max_kn * lengths_x.sum() * lengths_y.sum()
+
+
+class KernelStats(object):
+    """Timings and counters of a kernel computation.
+
+    Parameters
+    ----------
+    progress : callable, optional
+        Called as progress(done, total) every time a tile of the kernel is
+        completed, where done and total are numbers of tiles. It is called
+        from the thread that computed the tile, or after each batch of
+        tiles when they are computed by worker processes.
+
+    Attributes
+    ----------
+    timings : OrderedDict
+        Seconds spent in each stage (see the module docstring).
+    n_pairs, n_cells : int
+        Pairs of sequences and cells of the dynamic programming computed.
+    n_tiles, tiles_done : int
+        Tiles of the kernel to compute, and the ones completed.
+    backend : str or None
+        Backend of the last kernel computed (the one chosen, with
+        backend='auto').
+    """
+
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.timings = OrderedDict()
+        self.n_pairs = 0
+        self.n_cells = 0
+        self.n_tiles = 0
+        self.tiles_done = 0
+        self.backend = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # the lock cannot be pickled (fitted estimators keep their stats)
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """Add the time spent in the block to the stage `name`."""
+        start = time.time()
+        try:
+            yield self
+        finally:
+            elapsed = time.time() - start
+            with self._lock:
+                self.timings[name] = self.timings.get(name, 0.) + elapsed
+
+    def count(self, lengths_x, lengths_y, max_kn, triangle=False):
+        """Count the pairs of the tile lengths_x x lengths_y."""
+        n_pairs, n_cells = _pairs_and_cells(lengths_x, lengths_y, max_kn,
+                                            triangle=triangle)
+        with self._lock:
+            self.n_pairs += int(n_pairs)
+            self.n_cells += int(n_cells)
+
+    def count_norms(self, lengths, max_kn):
+        """Count the pairs of each sequence with itself."""
+        lengths = np.asarray(lengths, dtype=float)
+        with self._lock:
+            self.n_pairs += len(lengths)
+            self.n_cells += int(max_kn * np.dot(lengths, lengths))
+
+    def add_tiles(self, n_tiles):
+        with self._lock:
+            self.n_tiles += n_tiles
+
+    def tiles_completed(self, n_tiles=1):
+        """Record completed tiles and report them to progress."""
+        with self._lock:
+            self.tiles_done += n_tiles
+            done, total = self.tiles_done, self.n_tiles
+        if self.progress is not None:
+            self.progress(done, total)
+
+    @property
+    def total_time(self):
+        return sum(self.timings.values())
+
+    def as_dict(self):
+        """Timings, counters and throughput, in a flat dictionary.
+
+        The throughput (pairs_per_second, cells_per_second) is measured on
+        all the stages.
+        """
+        result = OrderedDict(('%s_time' % name, value)
+                             for name, value in self.timings.items())
+        total = self.total_time
+        result.update([
+            ('total_time', total), ('n_pairs', self.n_pairs),
+            ('n_cells', self.n_cells), ('n_tiles', self.n_tiles),
+            ('pairs_per_second', self.n_pairs / total if total else 0.),
+            ('cells_per_second', self.n_cells / total if total else 0.)])
+        return result
+
+    def __repr__(self):
+        stages = ', '.join('%s %.3fs' % item for item in self.timings.items())
+        total = self.total_time
+        return "KernelStats(%s; %d pairs, %.3g cells, %.0f pairs/s)" % (
+            stages or 'no stages', self.n_pairs, self.n_cells,
+            self.n_pairs / total if total else 0.)
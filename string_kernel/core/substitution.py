@@ -0,0 +1,110 @@
+"""Substitution scores between symbols, for the soft matching.
+
+Substitution matrices (BLOSUM, PAM, or the model of core/src/models.h) are
+converted once to the canonical encoding, a table over the symbols of
+ALPHABET, and then to a table over the codes of a SequenceStore, so that
+the score of two encoded symbols is a single lookup.
+"""
+import numpy as np
+
+# symbols of the canonical encoding, the ones of the table in models.h
+ALPHABET = '.-*ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# alphabet of the flat 26 x 26 models, indexed by
+# (ord(x) - 65) * 26 + ord(y) - 65
+LEGACY_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+
+def _positions(alphabet):
+    """Position of each symbol of alphabet in ALPHABET."""
+    positions = np.array([ALPHABET.find(symbol) for symbol in alphabet],
+                         dtype=np.intp)
+    if np.any(positions < 0):
+        raise ValueError("Symbols %r are not in the canonical alphabet %r" % (
+            ''.join(np.array(list(alphabet))[positions < 0]), ALPHABET))
+    return positions
+
+
+def canonical(matrix, alphabet=None):
+    """Substitution matrix in the canonical encoding.
+
+    Parameters
+    ----------
+    matrix : array-like, shape (n, n) or (n * n,)
+        Scores between the symbols of alphabet.
+    alphabet : str, optional
+        Symbols of the rows (and columns) of matrix. If None, matrix is
+        already canonical (29 x 29) or it is a legacy model over A-Z
+        (26 x 26).
+
+    Returns
+    -------
+    table : array, shape (len(ALPHABET), len(ALPHABET))
+        Scores between the symbols of ALPHABET; the ones involving symbols
+        not in alphabet are 0.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    n = int(round(np.sqrt(matrix.size)))
+    if n * n != matrix.size:
+        raise ValueError("The substitution matrix must be square, it has %d "
+                         "elements" % matrix.size)
+    matrix = matrix.reshape(n, n)
+    if alphabet is None:
+        if n == len(ALPHABET):
+            return matrix.copy()
+        if n != len(LEGACY_ALPHABET):
+            raise ValueError("The alphabet of a %d x %d substitution matrix "
+                             "must be given" % (n, n))
+        alphabet = LEGACY_ALPHABET
+    if len(alphabet) != n:
+        raise ValueError("The alphabet has %d symbols, the substitution "
+                         "matrix %d" % (len(alphabet), n))
+    positions = _positions(alphabet)
+    table = np.zeros((len(ALPHABET), len(ALPHABET)))
+    table[np.ix_(positions, positions)] = matrix
+    return table
+
+
+def as_canonical(aa_model):
+    """Canonical table of aa_model.
+
+    aa_model is an array (see canonical), a pair (matrix, alphabet), or a
+    pandas DataFrame whose index is the alphabet.
+    """
+    if isinstance(aa_model, tuple):
+        return canonical(*aa_model)
+    if hasattr(aa_model, 'index') and hasattr(aa_model, 'values'):
+        return canonical(aa_model.values, ''.join(map(str, aa_model.index)))
+    return canonical(aa_model)
+
+
+def table(aa_model, symbols):
+    """Scores between encoded symbols.
+
+    Parameters
+    ----------
+    aa_model : see as_canonical
+        The substitution model; None gives all 0s.
+    symbols : array of uint8
+        The byte value of each code (see SequenceStore.symbols).
+
+    Returns
+    -------
+    table : array, shape (len(symbols), len(symbols))
+        table[a, b] is the score of the symbols of the codes a and b, 0 for
+        symbols which are not in ALPHABET.
+    """
+    symbols = np.asarray(symbols, dtype=np.uint8)
+    result = np.zeros((len(symbols), len(symbols)))
+    if aa_model is None:
+        return result
+    scores = as_canonical(aa_model)
+    lookup = np.empty(256, dtype=np.intp)
+    lookup.fill(-1)
+    lookup[np.frombuffer(ALPHABET.encode('latin-1'), dtype=np.uint8)] = \
+        np.arange(len(ALPHABET))
+    positions = lookup[symbols]
+    valid = positions >= 0
+    result[np.ix_(valid, valid)] = scores[np.ix_(positions[valid],
+                                                 positions[valid])]
+    return result
@@ -1,15 +1,17 @@
 """Utility functions to compute explicitly the string kernel."""
-import cPickle as pkl
 import numpy as np
 import pandas as pd
 from scipy.sparse import csr_matrix
 
 from string_kernel.core import sk
+from string_kernel.core.sequences import SequenceStore
 
 def allperm(inputstr, lamda=1, offset=0, limit=None):
     """Explicit feature map of a gap-weighted string kernel.
 
-    Limit allows a maximum gap.
+    Limit allows a maximum gap: two consecutive symbols of a subsequence are
+    at distance less than limit in inputstr.
+    Subsequences are enumerated depth first with an explicit stack.
 
     Usage
     -----
@@ -22,13 +24,160 @@ def allperm(inputstr, lamda=1, offset=0, limit=None):
          ('bc', 0.25, 2),
          ('c', 0.5, 2)]
     """
-    for i in range(len(inputstr)):
-        yield(inputstr[i], lamda, i+offset)
-        if limit is not None:
-            limit = limit+i
-        for s, l, j in allperm(
-                inputstr[i+1:limit], lamda, offset=offset+i+1, limit=limit):
-            yield(inputstr[i] + s, lamda ** (j-i+1), j)
+    n = len(inputstr)
+    # (first position, last position, subsequence)
+    stack = [(i, i, inputstr[i]) for i in reversed(range(n))]
+    while stack:
+        start, end, subsequence = stack.pop()
+        yield subsequence, lamda ** (end - start + 1), end + offset
+        stop = n if limit is None else min(n, end + limit)
+        for j in reversed(range(end + 1, stop)):
+            stack.append((start, j, subsequence + inputstr[j]))
+
+
+def _encode(strings):
+    """Sequences of strings with the codes 1..n_symbols of their symbols.
+
+    Returns
+    -------
+    data : array of int64
+        Codes of the sequences, one after the other.
+    offsets : array of intp
+        The i-th sequence is data[offsets[i]:offsets[i + 1]].
+    symbols : array of uint8
+        The byte value of each code - 1.
+    """
+    store = SequenceStore(strings)
+    symbols, data = np.unique(store.data, return_inverse=True)
+    return data.astype(np.int64) + 1, store.offsets, symbols
+
+
+def decode(codes, symbols):
+    """Subsequences of the integer codes given by enumerate_subsequences."""
+    base = len(symbols) + 1
+    result = []
+    for code in codes:
+        code = int(code)
+        digits = []
+        while code:
+            code, digit = divmod(code, base)
+            digits.append(symbols[digit - 1])
+        result.append(bytearray(reversed(digits)).decode('latin-1'))
+    return result
+
+
+def _hash(codes, n_features):
+    """Column of each code with the hashing trick (multiplicative hash)."""
+    mixed = codes.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return ((mixed >> np.uint64(32)) % np.uint64(n_features)).astype(np.intp)
+
+
+def _aggregate(rows, keys, weights):
+    """Sum the weights with the same (row, key)."""
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    pairs, inverse = np.unique(rows * len(unique_keys) + inverse,
+                               return_inverse=True)
+    return (pairs // len(unique_keys), unique_keys[pairs % len(unique_keys)],
+            np.bincount(inverse, weights=weights))
+
+
+def enumerate_subsequences(strings, min_kn=1, max_kn=3, limit=None, lamda=1,
+                           n_features=None, batch_size=1024):
+    """Weighted count of the gapped subsequences of each string.
+
+    All the subsequences of a batch of strings are extended one symbol at a
+    time, level by level, as integer codes: the code of a subsequence is
+    code * (n_symbols + 1) + code of the next symbol, so that subsequences
+    of different lengths have different codes. A subsequence spanning s
+    positions has weight lamda ** s, and its weights in a string are summed.
+
+    Parameters
+    ----------
+    strings : iterable of str
+    min_kn, max_kn : int, optional
+        Range of lengths of the subsequences.
+    limit : int, optional
+        Consecutive symbols of a subsequence are at distance less than limit
+        (see allperm); None means no limit.
+    lamda : float, optional
+        Decay of the gaps.
+    n_features : int, optional
+        If given, use the hashing trick: subsequences are mapped to
+        n_features columns by a hash of their codes (the ones mapped to the
+        same column are summed) and no vocabulary is kept.
+    batch_size : int, optional
+        Number of strings enumerated together.
+
+    Returns
+    -------
+    rows, features : array of intp
+        String and feature of each entry.
+    weights : array of float64
+        Weighted count of the feature in the string.
+    vocabulary : array of int64 or None
+        Code of each feature (see decode), None with the hashing trick.
+    symbols : array of uint8
+        The symbols of the codes.
+    """
+    data, offsets, symbols = _encode(strings)
+    base = len(symbols) + 1
+    if n_features is None and max_kn * np.log2(base) >= 63:
+        raise ValueError("Subsequences of length %d over %d symbols do not "
+                         "fit in 64 bits, use the hashing trick (n_features)"
+                         % (max_kn, base - 1))
+    lamda = float(lamda)
+    n_strings = len(offsets) - 1
+
+    rows_, keys_, weights_ = [], [], []
+    for first in range(0, n_strings, batch_size):
+        batch = np.arange(first, min(first + batch_size, n_strings))
+        stops = offsets[batch + 1]
+        # level 1, the single symbols
+        row = np.repeat(batch, offsets[batch + 1] - offsets[batch])
+        start = end = np.arange(offsets[first], stops[-1])
+        code = data[start]
+        if n_features is not None:
+            code = code.astype(np.uint64)
+
+        levels_rows, levels_keys, levels_weights = [], [], []
+        for kn in range(1, max_kn + 1):
+            if kn >= min_kn and len(code):
+                keys = code if n_features is None else _hash(code, n_features)
+                levels_rows.append(row)
+                levels_keys.append(keys)
+                levels_weights.append(lamda ** (end - start + 1))
+            if kn == max_kn:
+                break
+            # extend each subsequence with the symbols that can follow it
+            stop = stops[row - first]
+            if limit is not None:
+                stop = np.minimum(stop, end + limit)
+            counts = np.maximum(stop - end - 1, 0)
+            parent = np.repeat(np.arange(len(code)), counts)
+            shift = np.arange(len(parent)) - np.repeat(
+                np.cumsum(counts) - counts, counts)
+            row, start = row[parent], start[parent]
+            end = end[parent] + 1 + shift
+            code = code[parent] * code.dtype.type(base) + \
+                data[end].astype(code.dtype)
+
+        if levels_rows:
+            rows, keys, weights = _aggregate(
+                np.concatenate(levels_rows), np.concatenate(levels_keys),
+                np.concatenate(levels_weights))
+            rows_.append(rows)
+            keys_.append(keys)
+            weights_.append(weights)
+
+    rows = np.concatenate(rows_ or [np.empty(0, dtype=np.intp)])
+    keys = np.concatenate(keys_ or [np.empty(0, dtype=np.int64)])
+    weights = np.concatenate(weights_ or [np.empty(0)])
+    if n_features is not None:
+        return rows.astype(np.intp), keys.astype(np.intp), weights, None, \
+            symbols
+    vocabulary, features = np.unique(keys, return_inverse=True)
+    return (rows.astype(np.intp), features.astype(np.intp), weights,
+            vocabulary, symbols)
 
 
 def permutations(min_kn=1, max_kn=3, **kwargs):
@@ -39,65 +188,105 @@ def permutations(min_kn=1, max_kn=3, **kwargs):
 
 # Generate X using the explicit feature map of the column HCDR3
 # X is sparse to avoid memory explosion
-def compute_explicit_sk(strings, min_kn=5, max_kn=7, limit=3, lamda=1, save_row=False):
-    """strings is like df_tr['HCDR3']"""
-    col_dict = {}
-    max_i = -1
-    rows, cols, data = [], [], []
-    for i, s in enumerate(strings):
-        dic = {}
-        for d, l, _ in permutations(min_kn=min_kn, max_kn=max_kn, inputstr=s,
-                                    lamda=lamda, limit=limit):
-            dic[d] = dic.get(d, 0) + l
-
-        rows_i, cols_i, data_i = [], [], []
-        for d in dic:
-            if d not in col_dict:
-                max_i += 1
-                col_dict[d] = max_i
-            rows_i.append(i)
-            cols_i.append(col_dict[d])
-            data_i.append(dic[d])
-        if save_row:
-            with open("_row_%s.pkl" % s, 'wb') as ff:
-                pkl.dump([rows_i, cols_i, data_i], ff)  # avoid memory explosion
-        rows.extend(rows_i)
-        cols.extend(cols_i)
-        data.extend(data_i)
-    return csr_matrix((data, (rows, cols))), col_dict
+def compute_explicit_sk(strings, min_kn=5, max_kn=7, limit=3, lamda=1,
+                        save_row=False, n_features=None):
+    """strings is like df_tr['HCDR3']
 
+    Returns the sparse feature matrix and the column of each subsequence
+    (None if n_features is given, see enumerate_subsequences).
+    save_row is not used anymore, since the rows are not kept in memory as
+    dictionaries; it is kept for backward compatibility.
+    """
+    strings = list(strings)
+    rows, features, weights, vocabulary, symbols = enumerate_subsequences(
+        strings, min_kn=min_kn, max_kn=max_kn, limit=limit, lamda=lamda,
+        n_features=n_features)
+    shape = (len(strings),
+             len(vocabulary) if n_features is None else n_features)
+    X = csr_matrix((weights, (rows, features)), shape=shape)
+    col_dict = None
+    if n_features is None:
+        col_dict = dict(zip(decode(vocabulary, symbols),
+                            range(len(vocabulary))))
+    return X, col_dict
 
-def explicit_sk_dataframe(strings, min_kn=1, max_kn=2, limit=3, lamda=.5,
-                          normalize=True, normalize_before=False,
-                          save_row=False):
 
-    res = compute_explicit_sk(strings, min_kn=min_kn, max_kn=max_kn,
-                              limit=limit, lamda=lamda, save_row=save_row)
-    columns = sorted(res[1], key=lambda x: res[1][x])
-    df = pd.DataFrame(res[0].toarray(), columns=columns)
+def normalize_rows(X, groups=None):
+    """Divide in place each row of the CSR matrix X by its norm.
 
-    if normalize_before:
-        # raise NotImplementedError("Not yet implemented the normalization for "
-        # "each subsequence length")
-        lengths = np.array(map(len, df.columns))
-        minimum, maximum = np.min(lengths), np.max(lengths)
-        df_res = None
-        for i in range(minimum, maximum+1):
-            df_i = df.loc[:, lengths == i]
-            df_i = df_i.div(np.sqrt(np.square(df_i).sum(axis=1)), axis=0)
-            df_i = df_i.fillna(0)
-            df_res = pd.concat([df_res, df_i], axis=1)
-        df = df_res
+    If groups (one for each column) are given, the entries of each row are
+    normalised separately in each group. Zero rows are left as they are.
+    """
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+    if groups is None:
+        keys, n_groups = rows, 1
+    else:
+        _, groups = np.unique(groups, return_inverse=True)
+        n_groups = groups.max() + 1 if len(groups) else 1
+        keys = rows * n_groups + groups[X.indices]
+    norms = np.sqrt(np.bincount(keys, weights=X.data ** 2,
+                                minlength=X.shape[0] * n_groups))
+    norms[norms == 0] = 1
+    X.data /= norms[keys]
+    return X
+
+
+def explicit_sk_sparse(strings, min_kn=1, max_kn=2, limit=3, lamda=.5,
+                       normalize=True, normalize_before=False,
+                       n_features=None):
+    """Explicit feature map as a sparse matrix.
 
+    The same features of explicit_sk_dataframe, normalised directly on the
+    CSR matrix, without building the dense one.
+
+    Returns
+    -------
+    X : csr_matrix, shape (n_strings, n_features)
+    columns : array of str or None
+        The subsequence of each column (None with the hashing trick, see
+        enumerate_subsequences).
+    """
+    if normalize_before and n_features is not None:
+        raise ValueError("normalize_before is not supported with the "
+                         "hashing trick")
+    strings = list(strings)
+    rows, features, weights, vocabulary, symbols = enumerate_subsequences(
+        strings, min_kn=min_kn, max_kn=max_kn, limit=limit, lamda=lamda,
+        n_features=n_features)
+    shape = (len(strings),
+             len(vocabulary) if n_features is None else n_features)
+    X = csr_matrix((weights, (rows, features)), shape=shape)
+    columns = None
+    if n_features is None:
+        columns = np.array(decode(vocabulary, symbols), dtype=object)
+
+    if normalize_before:
+        normalize_rows(X, groups=np.array([len(c) for c in columns]))
     if normalize:
-        df = df.div(np.sqrt(np.square(df).sum(axis=1)), axis=0)
-        df = df.fillna(0)
-    return df
+        normalize_rows(X)
+    return X, columns
 
 
-def explicit_and_kernel(X, limit=10, check_equality=False, n_jobs=-1, **kwargs):
-    df = explicit_sk_dataframe(X, limit=limit, **kwargs)
-    kernel = sk.SumStringKernel(**kwargs).fit_transform(X)
+def explicit_sk_dataframe(strings, min_kn=1, max_kn=2, limit=3, lamda=.5,
+                          normalize=True, normalize_before=False,
+                          save_row=False):
+    # save_row is kept for backward compatibility (see compute_explicit_sk)
+    X, columns = explicit_sk_sparse(
+        strings, min_kn=min_kn, max_kn=max_kn, limit=limit, lamda=lamda,
+        normalize=normalize, normalize_before=normalize_before)
+    return pd.DataFrame(X.toarray(), columns=columns)
+
+
+def explicit_and_kernel(X, limit=10, check_equality=False, n_jobs=-1,
+                        **kwargs):
+    """Kernel of the explicit feature map and the one of SumStringKernel.
+
+    The first one is computed as the sparse product of the features.
+    """
+    features, _ = explicit_sk_sparse(X, limit=limit, **kwargs)
+    explicit = features.dot(features.T)
+    kernel = sk.SumStringKernel(n_jobs=n_jobs, **kwargs).fit_transform(X)
 
     if check_equality:
-        np.testing.assert_array_almost_equal(df.values.dot(df.values.T), kernel)
+        np.testing.assert_array_almost_equal(explicit.toarray(), kernel)
+    return explicit, kernel
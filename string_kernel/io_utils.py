@@ -1,6 +1,8 @@
 import os
 import sys
 import csv
+import json
+import tempfile
 import pandas as pd
 
 d = {'CYS': 'C', 'ASP': 'D', 'SER': 'S', 'GLN': 'Q', 'LYS': 'K',
@@ -8,6 +10,17 @@ d = {'CYS': 'C', 'ASP': 'D', 'SER': 'S', 'GLN': 'Q', 'LYS': 'K',
      'GLY': 'G', 'HIS': 'H', 'LEU': 'L', 'ARG': 'R', 'TRP': 'W',
      'ALA': 'A', 'VAL': 'V', 'GLU': 'E', 'TYR': 'Y', 'MET': 'M'}
 
+LOOPS = ['LCDR1', 'LCDR2', 'LCDR3', 'HCDR1', 'HCDR2', 'HCDR3']
+
+# residue numbers of each loop, on the light (L) and heavy (H) chain
+_RANGES = [('L', 24, 34), ('L', 48, 54), ('L', 89, 98),
+           ('H', 24, 34), ('H', 51, 57), ('H', 93, 104)]
+_LOOP_OF = dict(((chain, n), loop) for loop, (chain, first, last)
+                in zip(LOOPS, _RANGES) for n in range(first, last + 1))
+
+# version of the format of the cached CDRs
+_CACHE_VERSION = 1
+
 def shorten(x):
     if len(x) % 3 != 0:
         raise ValueError('Input length should be a multiple of three')
@@ -18,6 +31,30 @@ def shorten(x):
     return y
 
 
+def _parse_pdb(pdb_file):
+    """CDRs of a pdb file, parsed by the fixed columns of its ATOM records.
+
+    Only the residue name (columns 18-20), the chain (22) and the residue
+    number with its insertion code (23-27) of the chains H and L are read,
+    once per residue. Errors are raised, not reported (see read_pdb).
+    """
+    residues = dict((loop, []) for loop in LOOPS)
+    last = {}
+    with open(pdb_file) as f:
+        for line in f:
+            if not line.startswith('ATOM'):
+                continue
+            chain, residue = line[21], line[22:27]
+            if chain not in ('H', 'L') or last.get(chain) == residue:
+                continue
+            last[chain] = residue
+            loop = _LOOP_OF.get((chain, int(line[22:26])))
+            if loop is not None:
+                residues[loop].append(line[17:20].strip())
+    return dict((loop, ''.join(d[name] for name in residues[loop]))
+                for loop in LOOPS)
+
+
 def read_pdb(pdb_file, dialect='excel-tab'):
     """Read a protein database file.
 
@@ -33,13 +70,15 @@ def read_pdb(pdb_file, dialect='excel-tab'):
     The numbering is of pdb file, that is the kabat-chothia numbering.
     There can be some IG with ids like 100A, 100B; they must be considered
     if they are inside the intervals specified before.
+    The ATOM records are read by their fixed columns, and the records of
+    chains other than H and L are ignored.
 
     Parameters
     ----------
     pdb_file : str
-        A protein database file. Delimited according to `dialect`.
+        A protein database file.
     dialect : ('excel-tab', 'excel')
-        Dialect for csv.DictReader.
+        Not used, kept for backward compatibility.
 
     Returns
     -------
@@ -48,67 +87,94 @@ def read_pdb(pdb_file, dialect='excel-tab'):
         specified.
     """
     try:
-        heavy = []
-        light = []
-        loops = ['LCDR1', 'LCDR2', 'LCDR3', 'HCDR1', 'HCDR2', 'HCDR3']
-        seqs = ['', '', '', '', '', '']
-        with open(pdb_file, 'rb') as f:
-            for line in f:
-                words = [w for w in line.split(" ") if w != '']
-                if words[0] != 'ATOM':
-                    continue
-                if words[4] == 'H':
-                    if heavy == [] or words[5] != heavy[-1][1]:
-                        heavy.append((words[3], words[5]))
-                elif words[4] == 'L':
-                    if light == [] or words[5] != light[-1][1]:
-                        light.append((words[3], words[5]))
-                else:
-                    raise ValueError
-        for pos, t in enumerate(light):
-            # remove the suffix A, B, D ...
-            n = int(t[1][:-1]) if t[1][-1].isalpha() else int(t[1])
-            if 24 <= n <= 34:
-                seqs[0] += t[0]
-            elif 48 <= n <= 54:
-                seqs[1] += t[0]
-            elif 89 <= n <= 98:
-                seqs[2] += t[0]
-        for pos, t in enumerate(heavy):
-            # remove the suffix A, B, D ...
-            n = int(t[1][:-1]) if t[1][-1].isalpha() else int(t[1])
-            if 24 <= n <= 34:
-                seqs[3] += t[0]
-            elif 51 <= n <= 57:
-                seqs[4] += t[0]
-            elif 93 <= n <= 104:
-                seqs[5] += t[0]
-
+        return _parse_pdb(pdb_file)
     except IOError:
         sys.exit('ERROR: File %s cannot be read' % pdb_file)
     except Exception as e:
         sys.exit('ERROR: {}'.format(e))
-    return {k: v for k, v in zip(loops, map(shorten, seqs))}  # , light, heavy
 
 
-def pdb_to_df(path):
-    loops = ['LCDR1', 'LCDR2', 'LCDR3', 'HCDR1', 'HCDR2', 'HCDR3']
-    df = pd.DataFrame(columns=loops)
+def cache_path(path):
+    """The file where the parsed CDRs of the folder path are cached."""
+    return os.path.join(path, '.pdb_cdrs.json')
+
+
+def _load_cache(path):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    if cached.get('version') != _CACHE_VERSION:
+        return {}
+    return cached['files']
+
+
+def _save_cache(path, files):
+    try:
+        folder = os.path.dirname(path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        # write and rename, so that readers never see a partial file
+        fd, temp = tempfile.mkstemp(dir=folder or '.', suffix='.json')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(dict(version=_CACHE_VERSION, files=files), f)
+        os.rename(temp, path)
+    except (IOError, OSError):
+        # a read-only cache: parse again in the next run
+        pass
+
+
+def pdb_to_df(path, n_jobs=1, cache=False):
+    """CDRs of all the pdb files of a folder (see read_pdb).
 
+    The files are parsed in n_jobs processes. With cache, the parsed CDRs
+    are kept on disk by absolute path and modification time, so that only
+    new or changed files are parsed again; the entries of the files which
+    are not in the folder anymore are removed.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the .pdb files.
+    n_jobs : int, optional
+        Number of processes, -1 for all the processors.
+    cache : bool or str, optional
+        If True, cache the CDRs in the folder itself (see cache_path); if a
+        string, in that file.
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The CDRs of each file (columns LOOPS), indexed by file name.
+    """
     filenames = [os.path.join(path, f) for f in os.listdir(path)
                  if os.path.isfile(os.path.join(path, f)) and
                  f.endswith('.pdb')]
+    if cache is True:
+        cache = cache_path(path)
+    files = _load_cache(cache) if cache else {}
+
+    keys = [os.path.abspath(f) for f in filenames]
+    stamps = [os.path.getmtime(f) for f in filenames]
+    todo = [i for i, (key, mtime) in enumerate(zip(keys, stamps))
+            if files.get(key, {}).get('mtime') != mtime]
+    try:
+        if n_jobs == 1 or len(todo) < 2:
+            parsed = [_parse_pdb(filenames[i]) for i in todo]
+        else:
+            import joblib as jl
+            parsed = jl.Parallel(n_jobs=n_jobs)(
+                jl.delayed(_parse_pdb)(filenames[i]) for i in todo)
+    except Exception as e:
+        sys.exit('ERROR: {}'.format(e))
+
+    # the entries of files not in the folder anymore
+    stale = set(files) - set(keys)
+    for i, cdrs in zip(todo, parsed):
+        files[keys[i]] = dict(mtime=stamps[i], cdrs=cdrs)
+    if cache and (todo or stale):
+        _save_cache(cache, dict((key, files[key]) for key in keys))
 
-    for f in filenames:
-        dict_seqs = read_pdb(f)
-        df = df.append(dict_seqs, ignore_index=True)
-
-    # # To insert the names of the sequences, load them from the merged file
-    # # after conversion
-    # __df = pd.read_csv('/home/fede/Dropbox/projects/Franco_Fabio_Marcat/'
-    #                    'conversioni_ID/tab_final_merged_newid_mutation.csv')
-    # indexes = []
-    # for f in filenames:
-    #     df1[df1['ID TM matrice'] == x]['new_id_tm']
-    df.index = map(lambda x: x.split('/')[-1], filenames)
-    return df
+    return pd.DataFrame([files[key]['cdrs'] for key in keys], columns=LOOPS,
+                        index=[os.path.basename(f) for f in filenames])
@@ -25,3 +25,46 @@ def test_feature_explicit_kernel_normed():
         min_kn=2, max_kn=2, lamda=.5, normalize=True).fit_transform(ll)
 
     assert_array_almost_equal(df.values.dot(df.values.T), kernel)
+
+
+def test_allperm_limit():
+    # consecutive symbols are at distance less than limit
+    for limit in (2, 3):
+        for s, _, _ in feature_map.allperm('abcdef', limit=limit):
+            positions = np.array(['abcdef'.index(c) for c in s])
+            assert np.all(np.diff(positions) < limit)
+    assert len(list(feature_map.allperm('abcdef', limit=2))) == 21
+
+
+def test_enumerate_subsequences():
+    ll = ['caba', 'gaba', '', 'abracadabra']
+    for limit in (None, 2, 3):
+        X, columns = feature_map.compute_explicit_sk(
+            ll, min_kn=2, max_kn=4, limit=limit, lamda=.5)
+        for i, s in enumerate(ll):
+            expected = {}
+            for d, l, _ in feature_map.permutations(
+                    min_kn=2, max_kn=4, inputstr=s, lamda=.5, limit=limit):
+                expected[d] = expected.get(d, 0) + l
+            assert X[i].nnz == len(expected)
+            for d in expected:
+                assert_array_almost_equal(X[i, columns[d]], expected[d])
+
+        # with the hashing trick, colliding subsequences are summed
+        hashed, columns = feature_map.compute_explicit_sk(
+            ll, min_kn=2, max_kn=4, limit=limit, lamda=.5, n_features=16)
+        assert columns is None and hashed.shape == (len(ll), 16)
+        assert_array_almost_equal(hashed.sum(axis=1), X.sum(axis=1))
+
+
+def test_explicit_sparse():
+    ll = np.array(['caba', 'gaba', 'ciba', 'abracadabra', 'abc'])
+    for normalize_before in (False, True):
+        X, columns = feature_map.explicit_sk_sparse(
+            ll, min_kn=1, max_kn=3, lamda=.5, limit=99,
+            normalize_before=normalize_before)
+        assert len(columns) == X.shape[1]
+        explicit, kernel = feature_map.explicit_and_kernel(
+            ll, limit=99, check_equality=True, n_jobs=1, min_kn=1, max_kn=3,
+            lamda=.5, normalize_before=normalize_before)
+        assert_array_almost_equal(X.dot(X.T).toarray(), kernel)
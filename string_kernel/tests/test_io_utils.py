@@ -0,0 +1,77 @@
+"""Testing the reading of pdb files."""
+import json
+import os
+import shutil
+import tempfile
+
+from numpy.testing import assert_array_equal, assert_raises
+
+from string_kernel import io_utils
+
+_ATOM = "%-6s%5d  %-3s %3s %1s%4d%1s   %8.3f%8.3f%8.3f  1.00  0.00\n"
+
+
+def _write_pdb(filename, chains):
+    # chains: chain -> list of (residue name, number, insertion code)
+    serial = 0
+    with open(filename, 'w') as f:
+        for chain, residues in sorted(chains.items()):
+            for name, number, code in residues:
+                for atom in ('N', 'CA', 'C'):
+                    serial += 1
+                    f.write(_ATOM % ('ATOM', serial, atom, name, chain,
+                                     number, code, 1, 2, 3))
+        f.write(_ATOM % ('HETATM', serial + 1, 'O', 'HOH', 'W', 1, '',
+                         0, 0, 0))
+
+
+def test_pdb_to_df():
+    folder = tempfile.mkdtemp()
+    try:
+        light = [('ALA', 23, ''), ('CYS', 24, ''), ('ASP', 27, ''),
+                 ('GLU', 27, 'A'), ('PHE', 34, ''), ('GLY', 50, ''),
+                 ('HIS', 90, '')]
+        heavy = [('ILE', 52, ''), ('LYS', 100, ''), ('LEU', 100, 'A'),
+                 ('MET', 105, '')]
+        antigen = [('TRP', 30, '')]
+        _write_pdb(os.path.join(folder, 'a.pdb'),
+                   dict(L=light, H=heavy, A=antigen))
+        _write_pdb(os.path.join(folder, 'b.pdb'), dict(L=light[:3]))
+        expected = dict(LCDR1='CDEF', LCDR2='G', LCDR3='H', HCDR1='',
+                        HCDR2='I', HCDR3='KL')
+        assert io_utils.read_pdb(os.path.join(folder, 'a.pdb')) == expected
+
+        cache = os.path.join(folder, 'cache', 'cdrs.json')
+        for n_jobs in (1, 2):
+            df = io_utils.pdb_to_df(folder, n_jobs=n_jobs, cache=cache)
+            assert_array_equal(df.columns, io_utils.LOOPS)
+            assert sorted(df.index) == ['a.pdb', 'b.pdb']
+            assert df.loc['a.pdb'].to_dict() == expected
+            assert df.loc['b.pdb', 'LCDR1'] == 'CD'
+        assert os.path.exists(cache)
+
+        # only the changed files are parsed again
+        _write_pdb(os.path.join(folder, 'a.pdb'), dict(H=[('XYZ', 100, '')]))
+        os.utime(os.path.join(folder, 'a.pdb'), (0, 0))
+        assert_raises(SystemExit, io_utils.pdb_to_df, folder, cache=cache)
+        _write_pdb(os.path.join(folder, 'a.pdb'), dict(H=heavy))
+        os.utime(os.path.join(folder, 'a.pdb'), (1, 1))
+        df = io_utils.pdb_to_df(folder, n_jobs=1, cache=cache)
+        assert df.loc['a.pdb', 'HCDR3'] == 'KL'
+        assert df.loc['a.pdb', 'LCDR1'] == ''
+        assert df.loc['b.pdb', 'LCDR1'] == 'CD'
+        # no cache and a single process by default
+        assert_array_equal(io_utils.pdb_to_df(folder).values, df.values)
+        assert not os.path.exists(io_utils.cache_path(folder))
+        io_utils.pdb_to_df(folder, cache=True)
+        assert os.path.exists(io_utils.cache_path(folder))
+
+        # the files removed from the folder are removed from the cache
+        os.remove(os.path.join(folder, 'b.pdb'))
+        df = io_utils.pdb_to_df(folder, cache=cache)
+        assert list(df.index) == ['a.pdb']
+        with open(cache) as f:
+            assert [os.path.basename(key)
+                    for key in json.load(f)['files']] == ['a.pdb']
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
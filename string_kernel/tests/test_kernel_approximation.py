@@ -0,0 +1,59 @@
+"""Testing the Nystroem approximation."""
+import numpy as np
+from numpy.testing import (assert_array_equal, assert_array_almost_equal,
+                           assert_raises)
+
+from string_kernel.core import sk
+from string_kernel.core.kernel_approximation import NystroemStringKernel
+
+
+def _sequences(n_samples=30, random_state=0):
+    rng = np.random.RandomState(random_state)
+    return np.array([''.join(rng.choice(list('ACDEFG'), rng.randint(3, 9)))
+                     for _ in range(n_samples)])
+
+
+def test_all_landmarks_exact():
+    # with all the distinct sequences as landmarks the kernel is exact
+    X = np.concatenate((_sequences(), _sequences(5)))
+    for landmarks in ('uniform', 'kmeans++', 'leverage'):
+        for normalize_before in (False, True):
+            nystroem = NystroemStringKernel(
+                n_components=100, landmarks=landmarks, random_state=0,
+                min_kn=1, max_kn=3, lamda=.5,
+                normalize_before=normalize_before, n_jobs=1)
+            embedding = nystroem.fit_transform(X)
+            assert len(set(nystroem.landmarks_)) == 30
+            assert_array_almost_equal(
+                embedding.dot(embedding.T), sk.sumstringkernel(
+                    X, X, min_kn=1, max_kn=3, lamda=.5,
+                    normalize_before=normalize_before))
+
+
+def test_landmarks_subset():
+    X = _sequences(50)
+    Y = _sequences(10, random_state=1)
+    nystroem = NystroemStringKernel(n_components=10, landmarks='kmeans++',
+                                    random_state=0, n_jobs=1).fit(X)
+    assert nystroem.transform(Y).shape == (10, 10)
+    assert np.all(X[nystroem.component_indices_] == nystroem.landmarks_)
+    # the landmarks are embedded exactly
+    embedding = nystroem.transform(nystroem.landmarks_)
+    assert_array_almost_equal(
+        embedding.dot(embedding.T),
+        sk.sumstringkernel(nystroem.landmarks_, nystroem.landmarks_))
+    assert_raises(ValueError, NystroemStringKernel(landmarks='foo').fit, X)
+
+
+def test_landmarks_backend():
+    # the columns of the landmarks are computed by the backend
+    X = _sequences(50)
+    for landmarks in ('kmeans++', 'leverage'):
+        params = dict(n_components=10, landmarks=landmarks, random_state=0,
+                      max_kn=3, n_jobs=1)
+        expected = NystroemStringKernel(**params).fit(X)
+        nystroem = NystroemStringKernel(backend='cpp', **params).fit(X)
+        assert nystroem.norms_landmarks_ is None
+        assert_array_equal(nystroem.component_indices_,
+                           expected.component_indices_)
+        assert_array_almost_equal(nystroem.transform(X), expected.transform(X))
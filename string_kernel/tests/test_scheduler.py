@@ -0,0 +1,32 @@
+"""Testing the tiling of the kernel matrix."""
+import numpy as np
+from numpy.testing import assert_array_equal, assert_array_almost_equal
+
+from string_kernel.core import scheduler, sk
+
+
+def test_tiles_cover_matrix():
+    lengths = np.random.RandomState(0).randint(1, 30, size=23)
+
+    coverage = np.zeros((23, 10), dtype=int)
+    for rows, cols in scheduler.make_tiles(lengths, lengths[:10], 4):
+        coverage[rows, cols] += 1
+    assert_array_equal(coverage, 1)
+
+    # diagonal tiles only cover their upper triangle
+    coverage = np.zeros((23, 23), dtype=int)
+    for rows, cols in scheduler.make_tiles(lengths, tile_size=4):
+        assert rows == cols or rows.stop <= cols.start
+        coverage[rows, cols] += 1
+    assert_array_equal(np.triu(coverage), np.triu(np.ones_like(coverage)))
+
+
+def test_tile_size_invariance():
+    ll = np.array(['caba', 'gaba', 'ciba', 'siba', 'cabaca', 'a', 'gabagaba'])
+
+    kernel = sk.sumstringkernel(ll, ll, min_kn=1, max_kn=3, n_jobs=1)
+    for tile_size in (1, 2, 3):
+        assert_array_almost_equal(kernel, sk.sumstringkernel(
+            ll, ll, min_kn=1, max_kn=3, n_jobs=2, tile_size=tile_size))
+        assert_array_almost_equal(kernel[:3], sk.sumstringkernel(
+            ll[:3], ll, min_kn=1, max_kn=3, n_jobs=2, tile_size=tile_size))
@@ -0,0 +1,52 @@
+"""Testing the nearest sequences search."""
+import numpy as np
+from numpy.testing import (assert_array_almost_equal, assert_array_equal,
+                           assert_raises)
+
+from string_kernel.core import search, sk
+from string_kernel.core.sequences import SequenceStore
+
+
+def _sequences(n_samples, random_state=0):
+    rng = np.random.RandomState(random_state)
+    return np.array([''.join(rng.choice(list('ACDEFG'), rng.randint(1, 9)))
+                     for _ in range(n_samples)])
+
+
+def test_symbol_norms():
+    # the kernels restricted to each last symbol sum to the norms
+    store = SequenceStore(_sequences(20))
+    values, symbols = search.symbol_norms(store, min_kn=1, max_kn=3)
+    norms = sk._norms(store, min_kn=1, max_kn=3, lamda=.5)
+    lengths = np.arange(1, 4) <= store.lengths[:, None]
+    assert_array_almost_equal(values.sum(axis=2)[lengths], norms[lengths])
+    codes = np.searchsorted(symbols, store.data)
+    for i in range(len(store)):
+        assert_array_almost_equal(values[i], search._python_symbol_norms(
+            codes[store.offsets[i]:store.offsets[i + 1]], 1, 3, .5,
+            len(symbols)))
+
+
+def test_kneighbors():
+    X = np.concatenate((_sequences(200), _sequences(20)))
+    Q = np.concatenate((_sequences(30, random_state=1), X[:3], ['HHH']))
+    for normalize_before in (False, True):
+        index = search.KernelNeighbors(
+            min_kn=1, max_kn=3, normalize_before=normalize_before).fit(X)
+        kernel = sk.sumstringkernel(Q, X, min_kn=1, max_kn=3, n_jobs=1,
+                                    normalize_before=normalize_before)
+        similarities, indices = index.kneighbors(Q, n_neighbors=7)
+        assert_array_almost_equal(
+            similarities, -np.sort(-kernel, axis=1)[:, :7])
+        assert_array_almost_equal(
+            kernel[np.arange(len(Q))[:, None], indices], similarities)
+        assert index.n_evaluations_ < len(Q) * len(X)
+
+        # the approximate mode evaluates only the candidates
+        similarities, indices = index.kneighbors(Q, n_neighbors=7,
+                                                 exact=False, n_candidates=20)
+        assert index.n_evaluations_ == len(Q) * 20
+        true = np.argsort(-kernel, axis=1, kind='mergesort')[:, :7]
+        assert 0 < search.recall(indices, true) <= 1
+    assert_array_equal(search.recall([[1, 2]], [[2, 3]]), .5)
+    assert_raises(ValueError, index.kneighbors, Q, n_neighbors=1000)
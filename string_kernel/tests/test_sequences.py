@@ -0,0 +1,56 @@
+"""Testing the encoded sequence store."""
+import pickle
+import numpy as np
+from numpy.testing import (assert_array_equal, assert_array_almost_equal,
+                           assert_raises)
+
+from string_kernel.core import sk
+from string_kernel.core.sequences import SequenceStore
+
+
+def test_store_encoding():
+    ll = ['caba', 'gaba', '', 'a']
+    store = SequenceStore(ll, alphabet='abcg')
+
+    assert_array_equal(store.offsets, [0, 4, 8, 8, 9])
+    assert_array_equal(store.data, [2, 0, 1, 0, 3, 0, 1, 0, 0])
+    assert_array_equal(store.lengths, [4, 4, 0, 1])
+    assert list(store) == ll
+    assert store.equals(ll)
+    assert not store.equals(ll[::-1])
+
+
+def test_store_shared():
+    ll = ['caba', 'gaba', 'ciba', 'siba']
+    store = SequenceStore(ll).share()
+
+    assert isinstance(store.data, np.memmap)
+    assert list(pickle.loads(pickle.dumps(store))) == ll
+    assert_array_almost_equal(
+        sk.sumstringkernel(ll, ll, max_kn=3, n_jobs=1),
+        sk.sumstringkernel(store, store, max_kn=3, n_jobs=2))
+
+
+def test_store_unique():
+    ll = ['AB', 'A', 'AB', '', 'C', 'A']
+    store = SequenceStore(ll, alphabet='ABC')
+    unique, index, inverse = store.unique()
+
+    assert list(unique) == ['AB', 'A', '', 'C']
+    assert [ll[i] for i in index] == list(unique)
+    assert [unique[i] for i in inverse] == ll
+    assert store.unique()[0] is unique
+
+    store = SequenceStore(['A', 'B'])
+    assert store.unique()[0] is store
+
+
+def test_store_concatenate():
+    ll = ['caba', '', 'gaba']
+    store = SequenceStore(ll[:2], alphabet='abcg').concatenate(
+        SequenceStore(ll[2:], alphabet='abcg'))
+
+    assert_array_equal(store.offsets, [0, 4, 4, 8])
+    assert list(store) == ll
+    assert store.equals(SequenceStore(ll, alphabet='abcg'))
+    assert_raises(ValueError, store.concatenate, SequenceStore(ll))
@@ -1,9 +1,16 @@
 """Testing the kernel."""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
 import numpy as np
-from numpy.testing import assert_array_equal, assert_array_almost_equal
+from numpy.testing import (assert_array_equal, assert_array_almost_equal,
+                           assert_raises)
 
 from string_kernel import feature_map
 from string_kernel.core import sk
+from string_kernel.core.sequences import SequenceStore
 
 
 def test_equivalence_symmetric_unsymmetric():
@@ -20,3 +27,614 @@ def test_equivalence_symmetric_unsymmetric():
 
         assert_array_equal(kernel1, kernel2)
         assert_array_equal(norms1, norms2[:len(ll)])
+
+
+def _dense_stringkernel(x, y, kn, lamda, aa_model=None):
+    # reference: the dynamic programming with the full (n+1) x (m+1) tables
+    len_x, len_y = len(x), len(y)
+    if len_x < kn or len_y < kn:
+        return int(x == y)
+    y_dim = len_y + 1
+    Kd = [np.ones((len_x + 1) * y_dim), np.zeros((len_x + 1) * y_dim)]
+    for i in range(1, kn):
+        for j in range(i - 1, len_x):
+            Kd[i % 2][j * y_dim + i - 1] = 0
+        for j in range(i - 1, len_y):
+            Kd[i % 2][(i - 1) * y_dim + j] = 0
+        for j in range(i, len_x):
+            Kdd = 0
+            for k in range(i, len_y):
+                if x[j - 1] != y[k - 1]:
+                    Kdd *= lamda
+                else:
+                    Kdd = lamda * (Kdd + (lamda * Kd[(i + 1) % 2][
+                        (j - 1) * y_dim + k - 1]))
+                Kd[i % 2][j * y_dim + k] = \
+                    lamda * Kd[i % 2][(j - 1) * y_dim + k] + Kdd
+    sum_ = 0
+    for i in range(kn - 1, len_x):
+        for j in range(kn - 1, len_y):
+            if aa_model is None:
+                weight = float(x[i] == y[j])
+            else:
+                weight = aa_model[(ord(x[i]) - 65) * 26 + ord(y[j]) - 65]
+            sum_ += lamda * lamda * weight * Kd[(kn - 1) % 2][i * y_dim + j]
+    return sum_
+
+
+def test_single_sweep_all_lengths():
+    ll = ['caba', 'gaba', 'ciba', 'sibaba', 'a']
+
+    for x in ll:
+        for y in ll:
+            values = sk._core_sumstringkernel(
+                x, y, min_kn=2, max_kn=5, lamda=.5, hard_matching=True)
+            expected = [_dense_stringkernel(x, y, kn, .5)
+                        for kn in range(2, 6)]
+            assert_array_almost_equal(values, expected)
+
+
+def test_linear_memory_soft_matching():
+    ll = ['CABA', 'GABADA', 'CIBA', 'SIBABAXY', 'A']
+    rng = np.random.RandomState(0)
+    aa_model = rng.rand(26, 26)
+    aa_model = (aa_model + aa_model.T).ravel()
+
+    for x in ll:
+        for y in ll:
+            values = sk._core_sumstringkernel(
+                x, y, min_kn=1, max_kn=4, lamda=.5, hard_matching=False,
+                aa_model=aa_model)
+            expected = [_dense_stringkernel(x, y, kn, .5, aa_model)
+                        for kn in range(1, 5)]
+            assert_array_almost_equal(values, expected)
+
+
+def test_soft_matching_requires_model():
+    X = np.array(['CABA', 'GABA', 'CIBA'])
+    for backend in (None, 'cpp', 'auto'):
+        assert_raises(ValueError, sk.sumstringkernel, X, X,
+                      hard_matching=False, backend=backend)
+    assert_raises(ValueError, sk.stringkernel, X, X, hard_matching=False)
+    assert_raises(ValueError, sk.sumstringkernel_condensed, X,
+                  hard_matching=False)
+    assert_raises(ValueError, sk.SumStringKernel(hard_matching=False).fit,
+                  X)
+
+
+def test_substitution_table_once():
+    from string_kernel.core import substitution
+    rng = np.random.RandomState(0)
+    X = [''.join(rng.choice(list('ACDE'), 6)) for _ in range(40)]
+    calls = []
+    table = substitution.table
+    try:
+        substitution.table = lambda *args: calls.append(1) or table(*args)
+        sk.sumstringkernel(X, X, tile_size=4, n_jobs=1)
+        assert not calls
+        for Y in (X, X[:9]):
+            del calls[:]
+            sk.sumstringkernel(X, Y, tile_size=4, n_jobs=1,
+                               hard_matching=False, aa_model=np.eye(26))
+            assert len(calls) == 1
+    finally:
+        substitution.table = table
+
+
+def test_pairs_kernel_engine():
+    ll = ['caba', 'gaba', 'ciba', 'sibaba', 'a']
+    store = SequenceStore(ll)
+    rows, cols = np.meshgrid(range(len(ll)), range(len(ll)))
+
+    values = sk._pairs_kernel(store, store, rows.ravel(), cols.ravel(),
+                              min_kn=1, max_kn=4, lamda=.5, n_jobs=2)
+    expected = [sk._core_sumstringkernel(ll[i], ll[j], 1, 4, .5, True)
+                for i, j in zip(rows.ravel(), cols.ravel())]
+    assert_array_almost_equal(values, expected)
+
+
+def test_long_sequences():
+    # no limit on the length of the sequences
+    from string_kernel import sum_string_kernel
+    rng = np.random.RandomState(0)
+    ll = [''.join(rng.choice(list('ACDE'), n)) for n in (1100, 1050, 40)]
+
+    kernel = sk.sumstringkernel(np.array(ll), np.array(ll), min_kn=1,
+                                max_kn=3, lamda=.5, n_jobs=1)
+    kernel_cpp = sum_string_kernel(ll, min_kn=1, max_kn=3, lamda=.5,
+                                   hard_matching=1)
+    assert_array_almost_equal(kernel, kernel_cpp, decimal=4)
+
+
+def test_sparse_algorithm():
+    rng = np.random.RandomState(0)
+    ll = [''.join(rng.choice(list('ACDEFG'), n)) for n in (0, 1, 3, 8, 20)]
+
+    for x in ll:
+        for y in ll:
+            assert_array_almost_equal(
+                sk._core_sumstringkernel_sparse(x, y, 2, 5, .6),
+                sk._core_sumstringkernel(x, y, 2, 5, .6, True))
+
+    X = np.array(ll[1:] * 2)
+    dense = sk.SumStringKernel(min_kn=1, max_kn=4, n_jobs=1).fit(X)
+    sparse = sk.SumStringKernel(min_kn=1, max_kn=4, n_jobs=1,
+                                algorithm='sparse').fit(X)
+    assert_array_almost_equal(dense.transform(X), sparse.transform(X))
+    assert_array_almost_equal(dense.transform(X[:3]), sparse.transform(X[:3]))
+
+    assert_raises(ValueError, sk.stringkernel, X, X, kn=2,
+                  hard_matching=False, algorithm='sparse')
+
+
+def test_norms_computed_at_fit():
+    import pickle
+    X = np.array(['caba', 'gaba', 'ciba', 'sibaba', 'a', 'abba'])
+    est = sk.SumStringKernel(min_kn=1, max_kn=3, n_jobs=1).fit(X)
+    assert est.norms_train_.shape == (len(X), 3)
+
+    est = pickle.loads(pickle.dumps(est))
+    assert_array_almost_equal(
+        est.transform(X[:2]),
+        sk.sumstringkernel(X[:2], X, min_kn=1, max_kn=3, n_jobs=1))
+    assert_array_almost_equal(
+        est.transform(X), sk.sumstringkernel(X, X, min_kn=1, max_kn=3,
+                                             n_jobs=1))
+
+    est = sk.StringKernel(kn=2, normalize=False, return_norms=True).fit(X)
+    est.transform(X[:2])
+    assert_array_almost_equal(est.norms_[2:], est.norms_train_.ravel())
+
+
+def test_deduplicate():
+    X = np.array(['caba', 'gaba', 'caba', 'a', 'gaba', 'caba', 'ciba'])
+    Y = np.array(['a', 'caba', 'a'])
+
+    for x, y in ((X, X), (Y, X), (X, Y)):
+        expected = sk.sumstringkernel(x, y, min_kn=1, max_kn=3, n_jobs=1,
+                                      deduplicate=False)
+        kernel = sk.sumstringkernel(x, y, min_kn=1, max_kn=3, n_jobs=1)
+        assert_array_almost_equal(kernel, expected)
+
+        lazy = sk.sumstringkernel(x, y, min_kn=1, max_kn=3, n_jobs=1,
+                                  lazy=True)
+        assert lazy.shape == expected.shape
+        assert_array_almost_equal(lazy[1], expected[1])
+        assert_array_almost_equal(lazy[1:, ::2], expected[1:, ::2])
+        assert_array_almost_equal(lazy[[0, 2], -1], expected[[0, 2], -1])
+        assert_array_almost_equal(lazy[[0, 1], [2, 0]],
+                                  expected[[0, 1], [2, 0]])
+        assert_array_almost_equal(lazy[np.ix_([0, 1], [2, 0])],
+                                  expected[np.ix_([0, 1], [2, 0])])
+        column = np.array([[0], [1]])
+        assert_array_almost_equal(lazy[column, :], expected[column, :])
+        assert_array_almost_equal(np.asarray(lazy), expected)
+
+        expected = sk.stringkernel(x, y, kn=2, normalize=False,
+                                   return_norms=True, deduplicate=False)
+        kernel = sk.stringkernel(x, y, kn=2, normalize=False,
+                                 return_norms=True)
+        assert_array_almost_equal(kernel[0], expected[0])
+        assert_array_almost_equal(kernel[1], expected[1])
+
+
+def test_out_of_core():
+    import os
+    import shutil
+    import tempfile
+    X = np.array(['caba', 'gaba', 'caba', 'a', 'gaba', 'sibaba', 'ciba'])
+    Y = X[:4]
+    folder = tempfile.mkdtemp()
+    try:
+        for x, y in ((X, X), (Y, X)):
+            expected = sk.sumstringkernel(x, y, max_kn=3, n_jobs=1)
+            filename = os.path.join(folder, 'kernel.npy')
+            kernel = sk.sumstringkernel(x, y, max_kn=3, n_jobs=2,
+                                        out=filename)
+            assert isinstance(kernel, np.memmap)
+            assert_array_almost_equal(np.load(filename), expected)
+
+            out = np.zeros(expected.shape)
+            assert sk.sumstringkernel(x, y, max_kn=3, n_jobs=1,
+                                      deduplicate=False, out=out) is out
+            assert_array_almost_equal(out, expected)
+
+            blocks = list(sk.sumstringkernel_blocks(x, y, block_size=3,
+                                                    max_kn=3, n_jobs=1))
+            assert [rows.start for rows, _ in blocks] == list(
+                range(0, len(x), 3))
+            assert_array_almost_equal(
+                np.vstack([block for _, block in blocks]), expected)
+
+        est = sk.StringKernel(kn=2, out=filename).fit(X)
+        assert_array_almost_equal(est.transform(Y),
+                                  sk.stringkernel(Y, X, kn=2))
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_cpp_backend():
+    from string_kernel import sum_string_kernel
+    X = np.array(['CABA', 'GABA', 'CIBA', 'SIBABA', 'A', 'CABA'])
+    Y = np.array(['CABA', 'GABAD', 'ZZ'])
+
+    kernel = sum_string_kernel(list(X), train=list(Y), min_kn=1, max_kn=3,
+                               hard_matching=1, n_jobs=2, double_precision=1)
+    assert kernel.flags['OWNDATA']
+    assert kernel.shape == (len(X), len(Y))
+
+    for normalize in (False, True):
+        for x in (X, Y):
+            est = sk.SumStringKernel(min_kn=1, max_kn=3, n_jobs=2,
+                                     normalize=normalize).fit(X)
+            expected = est.transform(x)
+            est.set_params(backend='cpp').fit(X)
+            assert_array_almost_equal(est.transform(x), expected)
+
+    assert_raises(ValueError, sk.sumstringkernel, X, X, backend='cpp',
+                  normalize_before=True)
+
+    # symbols are compared byte for byte, and scored with aa_model
+    X = np.array(['acdef', 'ACDEF', 'cdeAA', 'AcDeF', 'GHIK*', 'X.-y'])
+    aa_model = np.random.RandomState(0).rand(26, 26)
+    for hard_matching in (True, False):
+        for max_gap in (None, 1):
+            params = dict(min_kn=1, max_kn=3, normalize=False,
+                          hard_matching=hard_matching, max_gap=max_gap,
+                          aa_model=None if hard_matching else aa_model)
+            expected = sk.sumstringkernel(X, X, **params)
+            assert_array_almost_equal(
+                sk.sumstringkernel(X, X, backend='cpp', **params), expected)
+            assert_array_almost_equal(
+                sk.sumstringkernel(X[:2], X, backend='cpp', **params),
+                expected[:2])
+    assert sk.sumstringkernel(X, X, backend='cpp')[0, 1] == 0
+
+
+def test_cpp_threads():
+    from string_kernel import sum_string_kernel
+    rng = np.random.RandomState(0)
+    X = [''.join(rng.choice(list('ACDE'), n)) for n in rng.randint(1, 30, 40)]
+
+    for train in (None, X[:7]):
+        kwargs = dict(min_kn=1, max_kn=4, hard_matching=1,
+                      double_precision=1)
+        if train is not None:
+            kwargs['train'] = train
+        expected = sum_string_kernel(X, n_jobs=1, **kwargs)
+        assert_array_equal(sum_string_kernel(X, n_jobs=4, **kwargs),
+                           expected)
+
+
+def test_import_side_effects():
+    # importing the module does not touch sys.path nor load optional modules
+    import os
+    import subprocess
+    import sys
+    import string_kernel
+    code = ("import sys; path = list(sys.path); "
+            "import string_kernel.core.sk; "
+            "assert sys.path == path; "
+            "assert not set(['joblib', 'shogun', 'pyximport']) & "
+            "set(sys.modules)")
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.path.dirname(os.path.dirname(
+        os.path.abspath(string_kernel.__file__)))
+    subprocess.check_call([sys.executable, '-c', code], env=env)
+
+
+def test_condensed():
+    import os
+    import shutil
+    import tempfile
+    from scipy.cluster.hierarchy import linkage
+    from scipy.spatial.distance import squareform
+    X = np.array(['caba', 'gaba', 'ciba', 'siba', 'caba', 'abracadabra', 'a',
+                  'gaba'])
+    for normalize, normalize_before in ((True, False), (False, False),
+                                        (True, True)):
+        params = dict(min_kn=1, max_kn=3, lamda=.5, normalize=normalize,
+                      normalize_before=normalize_before, n_jobs=1,
+                      tile_size=3)
+        kernel = sk.sumstringkernel(X, X, **params)
+        for deduplicate in (True, False):
+            values = sk.sumstringkernel_condensed(
+                X, deduplicate=deduplicate, **params)
+            assert_array_almost_equal(values, squareform(kernel, checks=False))
+            distances = sk.sumstringkernel_condensed(
+                X, deduplicate=deduplicate, distance=True, **params)
+            diagonal = kernel.diagonal()
+            assert_array_almost_equal(distances, squareform(np.sqrt(np.maximum(
+                diagonal[:, None] + diagonal - 2 * kernel, 0)), checks=False))
+
+    distances = sk.sumstringkernel_condensed(X, distance=True,
+                                             dtype=np.float32, n_jobs=1)
+    assert distances.dtype == np.float32
+    assert linkage(distances, method='average').shape == (len(X) - 1, 4)
+
+    folder = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(folder, 'kernel.npy')
+        values = sk.sumstringkernel_condensed(X, n_jobs=1, out=filename)
+        assert_array_almost_equal(np.load(filename), values)
+        assert_array_almost_equal(values, squareform(
+            sk.sumstringkernel(X, X, n_jobs=1), checks=False))
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_partial_fit():
+    from sklearn.base import clone
+    X = np.array(['caba', 'gaba', 'ciba', 'siba', 'caba', 'abracadabra'])
+    X_new = np.array(['gaba', 'cabala', 'a'])
+    X_all = np.concatenate((X, X_new))
+    for estimator in (sk.StringKernel(kn=2, lamda=.5),
+                      sk.SumStringKernel(min_kn=1, max_kn=3, n_jobs=1),
+                      sk.SumStringKernel(min_kn=1, max_kn=3, n_jobs=1,
+                                         normalize_before=True),
+                      sk.SumStringKernel(min_kn=1, max_kn=3, n_jobs=1,
+                                         normalize=False),
+                      sk.SumStringKernel(min_kn=1, max_kn=3, n_jobs=1,
+                                         backend='cpp')):
+        expected = clone(estimator).fit_transform(X_all)
+        estimator.partial_fit(X[:2]).partial_fit(X[2:])
+        estimator.partial_fit(X_new)
+        assert_array_equal(estimator.X_train_, X_all)
+        assert estimator.train_store_.equals(X_all)
+        assert_array_almost_equal(estimator.training_kernel(), expected)
+        assert_array_almost_equal(estimator.transform(X_new), expected[6:])
+
+
+def test_substitution_models():
+    from string_kernel.core import substitution
+    X = np.array(['CABA', 'GABADA', 'CIBA', 'SIBABAXY', 'A', 'W-ID'])
+    rng = np.random.RandomState(0)
+    legacy = rng.rand(26, 26)
+    legacy = legacy + legacy.T
+    canonical = substitution.canonical(legacy)
+    assert canonical.shape == (29, 29)
+    assert_array_equal(canonical[:3], 0)
+    assert_array_equal(canonical[3:, 3:], legacy)
+
+    # a model over its own alphabet, as a pair or as a DataFrame
+    alphabet = 'ABCDGISWXY'
+    idx = [ord(a) - 65 for a in alphabet]
+    small = legacy[np.ix_(idx, idx)]
+    import pandas as pd
+    frame = pd.DataFrame(small, index=list(alphabet), columns=list(alphabet))
+
+    params = dict(min_kn=1, max_kn=3, hard_matching=False, n_jobs=1)
+    expected = sk.sumstringkernel(X, X, aa_model=legacy.ravel(), **params)
+    for aa_model in (legacy, canonical, (small, alphabet), frame):
+        assert_array_almost_equal(
+            sk.sumstringkernel(X, X, aa_model=aa_model, **params), expected)
+
+    # both engines, against the full dynamic programming (over A-Z only)
+    X = X[:-1]
+    engine = sk.sk_fast
+    try:
+        for sk.sk_fast in (engine, None):
+            store = SequenceStore(X)
+            rows, cols = np.meshgrid(range(len(X)), range(len(X)))
+            values = sk._pairs_kernel(
+                store, store, rows.ravel(), cols.ravel(), min_kn=2, max_kn=2,
+                lamda=.5, hard_matching=False, aa_model=(small, alphabet))
+            expected = [_dense_stringkernel(X[i], X[j], 2, .5, legacy.ravel())
+                        for i, j in zip(rows.ravel(), cols.ravel())]
+            assert_array_almost_equal(values.ravel(), expected)
+    finally:
+        sk.sk_fast = engine
+
+    assert_raises(ValueError, substitution.canonical, np.ones((5, 5)))
+    assert_raises(ValueError, substitution.canonical, np.ones((2, 2)), 'a#')
+
+
+def test_stats():
+    import pickle
+    from string_kernel.core.stats import KernelStats
+    rng = np.random.RandomState(0)
+    X = np.array([''.join(rng.choice(list('ACDE'), n))
+                  for n in rng.randint(5, 30, 50)])
+    lengths = np.array([len(x) for x in X], dtype=float)
+    progress = []
+
+    est = sk.SumStringKernel(min_kn=1, max_kn=3, n_jobs=1, tile_size=8,
+                             deduplicate=False,
+                             progress=lambda *args: progress.append(args))
+    kernel = est.fit(X).transform(X)
+    assert_array_almost_equal(kernel, sk.sumstringkernel(
+        X, X, min_kn=1, max_kn=3, n_jobs=1))
+    assert list(est.timings_) == ['norms', 'pairs', 'normalize', 'expand']
+    stats = est.stats_
+    assert stats.n_tiles == progress[-1][1] == len(progress)
+    assert progress[-1][0] == stats.tiles_done == stats.n_tiles
+    # the norms are computed at fit, the kernel at transform
+    assert stats.n_pairs == len(X) + len(X) * (len(X) - 1) // 2
+    assert stats.n_cells == int(3 * lengths.sum() ** 2 / 2 +
+                                3 * np.dot(lengths, lengths) / 2)
+    assert stats.as_dict()['pairs_per_second'] > 0
+    est = sk.SumStringKernel(min_kn=1, max_kn=3, n_jobs=1).fit(X)
+    assert pickle.loads(pickle.dumps(est)).stats_.n_pairs == len(X)
+
+    stats = KernelStats()
+    sk.sumstringkernel_condensed(X, min_kn=1, max_kn=3, n_jobs=1,
+                                 stats=stats)
+    assert 'pairs' in stats.timings and stats.n_tiles == stats.tiles_done
+
+
+@contextmanager
+def _cost_model_cache():
+    # calibrate in a temporary file, not in the cache of the user
+    folder = tempfile.mkdtemp()
+    previous = os.environ.get('STRING_KERNEL_COST_MODEL')
+    os.environ['STRING_KERNEL_COST_MODEL'] = os.path.join(
+        folder, 'cost_model.json')
+    try:
+        yield os.environ['STRING_KERNEL_COST_MODEL']
+    finally:
+        if previous is None:
+            del os.environ['STRING_KERNEL_COST_MODEL']
+        else:
+            os.environ['STRING_KERNEL_COST_MODEL'] = previous
+        shutil.rmtree(folder)
+
+
+def test_backends():
+    import json
+    from string_kernel.core import cost_model
+    from string_kernel.core.stats import KernelStats
+    rng = np.random.RandomState(0)
+    X = np.array([''.join(rng.choice(list('ACDE'), n))
+                  for n in rng.randint(1, 12, 40)])
+
+    # the explicit feature map gives the same kernel, short sequences too
+    for normalize_before in (False, True):
+        for x in (X, X[:7]):
+            params = dict(min_kn=2, max_kn=4, normalize_before=normalize_before)
+            assert_array_almost_equal(
+                sk.sumstringkernel(x, X, backend='explicit', **params),
+                sk.sumstringkernel(x, X, **params))
+    assert_raises(ValueError, sk.sumstringkernel, X, X, backend='explicit',
+                  hard_matching=False)
+    assert_raises(ValueError, sk.sumstringkernel, X, X, backend='shogun')
+
+    assert cost_model.count_subsequences(6, 3) == 20
+    assert cost_model.count_subsequences(6, 3, limit=2) == 4
+    # the norms given to the engines are not computed again
+    pairs, cells = cost_model.workload([3, 5], [4], max_kn=2)
+    assert cost_model.workload([3, 5], [4], max_kn=2, norms_x=False) == (
+        pairs - 2, cells - 2 * (9 + 25))
+
+    with _cost_model_cache() as path:
+        constants = cost_model.load(recalibrate=True)
+        with open(path) as f:
+            assert json.load(f)['constants'] == constants
+        assert cost_model.load() is constants
+        stats = KernelStats()
+        est = sk.SumStringKernel(min_kn=1, max_kn=3, backend='auto').fit(X)
+        assert_array_almost_equal(est.transform(X[:5]),
+                                  sk.sumstringkernel(X[:5], X, max_kn=3))
+        assert est.stats_.backend in (None, 'cpp', 'explicit')
+        params = dict(max_kn=3, hard_matching=False,
+                      aa_model=cost_model._calibration_model())
+        assert_array_almost_equal(
+            sk.sumstringkernel(X, X, backend='auto', stats=stats, **params),
+            sk.sumstringkernel(X, X, **params))
+        assert stats.backend in (None, 'cpp')
+
+
+def test_auto_backend_same_kernel():
+    from string_kernel.core import cost_model
+    from string_kernel.core.stats import KernelStats
+    # mixed case: the backends must compare the symbols byte for byte
+    X = np.array(['acdef', 'ACDEF', 'cdeAA', 'AcDeF', 'CDE'])
+    aa_model = np.random.RandomState(0).rand(26, 26)
+    choose = cost_model.choose
+    with _cost_model_cache():
+        try:
+            for hard_matching in (True, False):
+                params = dict(max_kn=3, hard_matching=hard_matching,
+                              normalize=False,
+                              aa_model=None if hard_matching else aa_model)
+                expected = sk.sumstringkernel(X, X, **params)
+                candidates = []
+                cost_model.choose = lambda backends, *args, **kwargs: (
+                    candidates.extend(backends) or backends[0])
+                sk.sumstringkernel(X, X, backend='auto', **params)
+                if cost_model._cpp_available():
+                    assert 'cpp' in candidates
+                for backend in set(candidates):
+                    cost_model.choose = lambda *args, **kwargs: backend
+                    stats = KernelStats()
+                    assert_array_almost_equal(sk.sumstringkernel(
+                        X, X, backend='auto', stats=stats, **params), expected)
+                    assert stats.backend == backend
+        finally:
+            cost_model.choose = choose
+
+
+def test_max_gap():
+    rng = np.random.RandomState(0)
+    ll = [''.join(rng.choice(list('ACDE'), n)) for n in (4, 5, 8, 13, 20)]
+    store = SequenceStore(ll)
+    rows, cols = [a.ravel() for a in np.indices((len(ll), len(ll)))]
+    aa_model = rng.rand(26, 26)
+
+    for max_gap in (0, 1, 3):
+        # the explicit feature map with limit = max_gap + 2
+        features = feature_map.explicit_sk_dataframe(
+            ll, min_kn=1, max_kn=4, limit=max_gap + 2, lamda=.6,
+            normalize=False).values
+        kernel = np.array([[sk._core_sumstringkernel_gapped(
+            x, y, 1, 4, .6, max_gap, True).sum() for y in ll] for x in ll])
+        assert_array_almost_equal(kernel, features.dot(features.T))
+
+        # the compiled engine, soft matching too
+        for hard_matching in (True, False):
+            params = dict(min_kn=2, max_kn=5, lamda=.6, max_gap=max_gap,
+                          hard_matching=hard_matching, aa_model=aa_model)
+            expected = np.array([sk._core_sumstringkernel_gapped(
+                x, y, 2, 5, .6, max_gap, hard_matching, aa_model=aa_model)
+                for x, y in zip(np.take(ll, rows), np.take(ll, cols))])
+            assert_array_almost_equal(
+                sk._pairs_kernel(store, store, rows, cols, **params),
+                expected)
+
+    # no gap is longer than the sequences
+    for x in ll:
+        for y in ll:
+            assert_array_almost_equal(
+                sk._core_sumstringkernel_gapped(x, y, 1, 5, .6, 20, True),
+                sk._core_sumstringkernel(x, y, 1, 5, .6, True))
+
+    X = np.array(ll + ['A', 'CA', 'CA'])
+    est = sk.SumStringKernel(min_kn=1, max_kn=3, max_gap=1, n_jobs=1).fit(X)
+    expected = est.transform(X)
+    for backend in ('explicit', 'cpp'):
+        est.set_params(backend=backend).fit(X)
+        assert_array_almost_equal(est.transform(X), expected)
+    assert_array_almost_equal(
+        sk.StringKernel(kn=2, max_gap=1).fit(X).transform(X[:3]),
+        sk.sumstringkernel(X[:3], X, min_kn=2, max_kn=2, max_gap=1,
+                           normalize_before=True))
+    assert_raises(ValueError, sk.sumstringkernel, X, X, max_gap=-1)
+
+
+def test_columns():
+    rng = np.random.RandomState(0)
+    data = dict((column, [''.join(rng.choice(list('ACDE'), length))
+                          for length in rng.randint(1, 9, 20)] * 2)
+                for column in ('LCDR3', 'HCDR1', 'HCDR3'))
+    data['LCDR3'][:10] = ['CA'] * 10
+    columns = ['HCDR1', 'LCDR3', 'HCDR3']
+    params = dict(min_kn=1, max_kn=3, tile_size=4)
+
+    for kwargs in (dict(), dict(normalize=False),
+                   dict(normalize_before=True, max_gap=1)):
+        expected = [sk.sumstringkernel(data[c], data[c], n_jobs=1,
+                                       **dict(params, **kwargs))
+                    for c in columns]
+        for n_jobs in (1, 2):
+            kernels = sk.sumstringkernel_columns(
+                data, columns=columns, n_jobs=n_jobs,
+                **dict(params, **kwargs))
+            assert list(kernels.keys()) == columns
+            for column, kernel in zip(columns, expected):
+                assert_array_almost_equal(kernels[column], kernel)
+
+            combined = sk.sumstringkernel_columns(
+                data, columns=columns, combine=True, weights=[.2, .3, .5],
+                n_jobs=n_jobs, **dict(params, **kwargs))
+            assert_array_almost_equal(combined, np.dot(
+                [.2, .3, .5], np.array(expected).reshape(3, -1)).reshape(
+                    combined.shape))
+
+    # equal weights, normalised: the diagonal is 1
+    combined = sk.sumstringkernel_columns(data, combine=True, n_jobs=1,
+                                          dtype=np.float32, **params)
+    assert combined.dtype == np.float32
+    assert_array_almost_equal(np.diag(combined), np.ones(40))
+    assert_raises(ValueError, sk.sumstringkernel_columns, data,
+                  weights=[1, 2, 3])
+    assert_raises(ValueError, sk.sumstringkernel_columns, data,
+                  combine=True, weights=[1, 2])